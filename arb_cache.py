@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from arb_compact import compact_pair
+from arb_quantize import quantization_report, quantize_arb
+from arb_store import arb_hash
+from exact_period import exact_period_pair
+from waveform_batch import align_waveforms
+
+# Bump when the preparation algorithm changes so old entries are not reused
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.keysight33600a', 'arb_cache')
+
+
+def file_hash(filename, chunk_size=1 << 20):
+    """Return the SHA-1 of a file's contents"""
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _tmp_path(path):
+    # Unique per process and thread: several writers may fill the same cache
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+class AlignedPairCache:
+    """Bounded in-process LRU of aligned channel pairs with hit/miss counters
+
+    Entries are keyed by both files' paths and mtimes plus the invert,
+    normalize and resampling options, so a hit needs no file reads and no NumPy work.
+    """
+
+    def __init__(self, prepare, maxsize=8):
+        # prepare(file1, file2, invert_ch2=..., normalize=..., **options) computes a missing entry
+        self.prepare = prepare
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # Drivers of several instruments may share one cache
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(file1, file2, invert_ch2, normalize, **options):
+        """Return the memo key of a pair: paths and mtimes plus options"""
+        return (os.path.abspath(file1), os.stat(file1).st_mtime_ns,
+                os.path.abspath(file2), os.stat(file2).st_mtime_ns,
+                bool(invert_ch2), bool(normalize), tuple(sorted(options.items())))
+
+    def get(self, file1, file2, invert_ch2=True, normalize=True, **options):
+        """Return (sig1, sig2, sRate, points, unified_times), preparing it on a miss"""
+        key = self.key(file1, file2, invert_ch2, normalize, **options)
+        # Held while preparing, so concurrent misses on one pair compute it once
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            result = self.prepare(file1, file2, invert_ch2=invert_ch2, normalize=normalize, **options)
+            # Entries are shared between callers, so keep the buffers read-only
+            for array in (result[0], result[1], result[4]):
+                array.setflags(write=False)
+            self._entries[key] = result
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return result
+
+    def evict(self, filename=None):
+        """Drop every entry that uses filename (or all entries); returns how many were dropped"""
+        with self._lock:
+            if filename is None:
+                dropped = list(self._entries)
+            else:
+                path = os.path.abspath(filename)
+                dropped = [key for key in self._entries if path in (key[0], key[2])]
+            for key in dropped:
+                del self._entries[key]
+            self.evictions += len(dropped)
+            return len(dropped)
+
+    def stats(self):
+        """Return the hit/miss/eviction counters and current size"""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+class ArbCache:
+    """Disk cache of prepared float32 channel buffers (and their int16 DAC codes) as memory-mappable .npy files"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memo_size=8):
+        self.cache_dir = cache_dir
+        # In-memory LRU in front of the disk cache for repeated requests in one session
+        self.memo = AlignedPairCache(self._prepare_pair, memo_size)
+        # (path, size, mtime) -> content hash, so unchanged files are hashed once per process
+        self._hashes = {}
+
+    def _source_hash(self, filename):
+        st = os.stat(filename)
+        stamp = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+        if stamp not in self._hashes:
+            self._hashes[stamp] = file_hash(filename)
+        return self._hashes[stamp]
+
+    def key(self, files, **params):
+        """Return the cache key of the source files' contents plus preparation parameters"""
+        payload = json.dumps([CACHE_VERSION, [self._source_hash(f) for f in files], params], sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.npy', base + '.json'
+
+    def get(self, key):
+        """Return (channels, meta) for a cached entry, or None; channels is memory-mapped"""
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            channels = np.load(data_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        return channels, meta
+
+    def put(self, key, channels, meta, ident=None, dtype='<f4'):
+        """Store stacked channel buffers (channels x points) with their metadata
+
+        When ident names the sources and parameters, the entry it previously
+        pointed to is removed so changed files do not leave stale buffers behind.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, meta_path = self._paths(key)
+        tmp_path = _tmp_path(data_path)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(channels, dtype=dtype))
+        os.replace(tmp_path, data_path)
+        with open(_tmp_path(meta_path), 'w') as f:
+            json.dump(meta, f)
+        os.replace(_tmp_path(meta_path), meta_path)
+        if ident is not None:
+            self.update_index({ident: key})
+
+    def update_index(self, entries):
+        """Point each ident at its new key, removing the entries they pointed to before"""
+        index_path = os.path.join(self.cache_dir, 'index.json')
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        for ident, key in entries.items():
+            old_key = index.get(ident)
+            if old_key and old_key != key:
+                for path in self._paths(old_key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            index[ident] = key
+        with open(_tmp_path(index_path), 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(_tmp_path(index_path), index_path)
+
+    def dac_codes(self, samples, dither=False):
+        """Return (codes, report): a float arb's int16 DAC codes and its quantization_report()
+
+        Keyed by the arb's content and the dither option, so codes quantized by
+        precompile.py --dac are what the driver's dac path uploads.
+        """
+        payload = json.dumps([CACHE_VERSION, 'dac', arb_hash(samples), bool(dither)])
+        key = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        entry = self.get(key)
+        if entry is not None:
+            codes, meta = entry
+            return codes, meta['report']
+        codes = quantize_arb(samples, dither)
+        report = quantization_report(samples, dither)
+        self.put(key, codes, {'report': report}, dtype='<i2')
+        return codes, report
+
+    def prepare_pair(self, file1, file2, invert_ch2=True, normalize=True, points=None, rms_error=None,
+                     peak_error=None):
+        """Cached align_waveforms(): returns (sig1, sig2, sRate, points, unified_times)"""
+        return self.memo.get(file1, file2, invert_ch2=invert_ch2, normalize=normalize, points=points,
+                             rms_error=rms_error, peak_error=peak_error)
+
+    def _prepare_pair(self, file1, file2, invert_ch2=True, normalize=True, **options):
+        return self.build_pair(file1, file2, invert_ch2, normalize, **options)[0]
+
+    def build_pair(self, file1, file2, invert_ch2=True, normalize=True, index=True, points=None, rms_error=None,
+                   peak_error=None):
+        """Return (result, key, ident, built): the aligned pair from disk, or aligned and stored
+
+        built is False on a disk hit. With index False the index entry is left
+        to the caller (see update_index), e.g. when worker processes fill one cache.
+        A points count resamples each period onto an exact-period grid of that
+        length (see exact_period); an RMS or peak error budget picks the
+        shortest such grid within it (see arb_compact). By default the files'
+        own grid is kept.
+        """
+        params = {'invert_ch2': invert_ch2, 'normalize': normalize}
+        if points is not None and (rms_error is not None or peak_error is not None):
+            raise ValueError("Give either an arb length or an error budget")
+        # Options left at their defaults stay out of the key, so existing entries still match
+        for name, value in (('points', points), ('rms_error', rms_error), ('peak_error', peak_error)):
+            if value is not None:
+                params[name] = value
+        key = self.key((file1, file2), **params)
+        ident = json.dumps([os.path.abspath(file1), os.path.abspath(file2), params], sort_keys=True)
+        entry = self.get(key)
+        if entry is None:
+            if points is not None:
+                sig1, sig2, sRate, points, unified_times, _ = exact_period_pair(
+                    file1, file2, invert_ch2, normalize, points)
+            elif rms_error is not None or peak_error is not None:
+                sig1, sig2, sRate, points, unified_times, _ = compact_pair(
+                    file1, file2, invert_ch2, normalize, rms_error, peak_error)
+            else:
+                sig1, sig2, sRate, points, unified_times = align_waveforms(file1, file2, invert_ch2, normalize)
+            meta = {'sRate': sRate, 'points': points, 't_start': float(unified_times[0]),
+                    'dt': 1 / float(sRate)}
+            self.put(key, np.stack((sig1, sig2)), meta, ident if index else None)
+            return (sig1, sig2, sRate, points, unified_times), key, ident, True
+        channels, meta = entry
+        unified_times = meta['t_start'] + np.arange(meta['points']) * meta['dt']
+        return (channels[0], channels[1], meta['sRate'], meta['points'], unified_times), key, ident, False
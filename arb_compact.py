@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""Minimum-length arbs: the fewest points (and matching SRAT) within an RMS or peak error budget
+
+    python arb_compact.py modal/ONEPERIOD_A_*.csv modal/ONEPERIOD_B_*.csv --rms 1e-3 --out modal_compact
+
+The instrument plays an arb through its interpolation filter, so a period
+only needs enough points to carry the harmonics that matter. Errors are
+relative to each waveform's peak.
+"""
+
+import argparse
+import os
+import re
+
+import numpy as np
+
+from arb_quantize import DAC_MAX
+from exact_period import DEFAULT_MAX_SRATE, MIN_POINTS, choose_grid, period_report, resample_periodic
+from phase_timer import phase
+from waveform_batch import load_batch, prepare_loaded
+
+# Fraction of SRAT the NORMal arb filter passes flat; harmonics above it are not reproduced
+FILTER_BANDWIDTH = 0.4
+# RMS error of int16 DAC codes relative to full scale; budgets below it buy nothing
+DAC_RMS_ERROR = 1 / DAC_MAX / np.sqrt(12)
+# Truncation candidates per peak-error pass, fewer for long arbs
+PEAK_CHUNK = 64
+# Complex values one peak-error pass may hold (16 bytes each)
+PEAK_ELEMENTS = 4_000_000
+
+
+def spectrum_of(signals):
+    """Return (spectrum, length, peak) of one-period rows; peak is each row's error scale"""
+    signals = np.atleast_2d(np.asarray(signals, dtype=np.float64))
+    scale = np.abs(signals).max(axis=1)
+    return np.fft.rfft(signals, axis=1), signals.shape[1], np.where(scale == 0, 1.0, scale)
+
+
+def rms_errors(spectrum, n, scale):
+    """Return the RMS error of keeping harmonics 0..k, for every k: the worst row, relative to its peak
+
+    Comes from the spectrum alone (Parseval).
+    """
+    # Each bin's share of the mean square; all but DC and Nyquist stand for two conjugate bins
+    power = np.abs(spectrum) ** 2 / n ** 2
+    power[:, 1:(n + 1) // 2] *= 2
+    tail = np.cumsum(power[:, ::-1], axis=1)[:, ::-1]
+    # Error of keeping 0..k is the power from k + 1 up
+    rms = np.sqrt(np.concatenate((tail[:, 1:], np.zeros((len(spectrum), 1))), axis=1))
+    return (rms / scale[:, None]).max(axis=0)
+
+
+def peak_errors(spectrum, n, scale, ks):
+    """Return the peak error of keeping harmonics 0..k, for each k in ks: the worst row, relative to its peak
+
+    Exact, from the inverse transform of each discarded tail; the ks are
+    transformed together, as many per pass as fit in PEAK_ELEMENTS.
+    """
+    ks = np.asarray(ks)
+    bins = np.arange(spectrum.shape[1])
+    step = max(1, PEAK_ELEMENTS // spectrum.size)
+    errors = []
+    for start in range(0, len(ks), step):
+        chunk = ks[start:start + step]
+        discarded = spectrum[None, :, :] * (bins[None, None, :] > chunk[:, None, None])
+        errors.append(np.abs(np.fft.irfft(discarded, n, axis=2)).max(axis=2))
+    return (np.concatenate(errors) / scale[None, :]).max(axis=1)
+
+
+def minimum_harmonics(signals, rms=None, peak=None):
+    """Return the fewest harmonics (highest kept k) that meet every given budget
+
+    Peak errors are only computed where the RMS error (never above the peak
+    error) allows a hit, PEAK_CHUNK candidates at a time, lowest k first.
+    """
+    if rms is None and peak is None:
+        raise ValueError("Give an RMS or a peak error budget")
+    spectrum, n, scale = spectrum_of(signals)
+    errors = rms_errors(spectrum, n, scale)
+    ok = np.ones(len(errors), dtype=bool)
+    if rms is not None:
+        ok &= errors <= rms
+    if peak is not None:
+        ok &= errors <= peak
+    candidates = np.flatnonzero(ok)
+    if peak is None:
+        return int(candidates[0])
+    for start in range(0, len(candidates), PEAK_CHUNK):
+        ks = candidates[start:start + PEAK_CHUNK]
+        hits = np.flatnonzero(peak_errors(spectrum, n, scale, ks) <= peak)
+        if len(hits):
+            return int(ks[hits[0]])
+    # Keeping every harmonic is exact
+    return len(errors) - 1
+
+
+def compact_loaded(group, invert=None, normalize=True, rms=None, peak=None, srate_limit=DEFAULT_MAX_SRATE,
+                   min_points=MIN_POINTS, bandwidth=FILTER_BANDWIDTH):
+    """Shortest exact-period arbs of one group of loaded (times, values) one-period waveforms
+
+    The group's channels share one length: enough points for the filter to
+    pass the highest harmonic either channel needs. Returns
+    (signals, srate, points, times, report) with float32 rows.
+    """
+    native = prepare_loaded([group], invert, normalize)
+    signals = native.signals.astype(np.float64)
+    freq = float(native.sRates[0]) / native.points
+    harmonics = minimum_harmonics(signals, rms, peak)
+    wanted = max(min_points, int(np.ceil(harmonics / bandwidth)), 2 * harmonics + 1)
+    points, srate = choose_grid(freq, min(wanted, native.points), srate_limit, min_points, search=0)
+    compact = resample_periodic(signals, points)
+    np.clip(compact, -1.0, 1.0, out=compact)
+
+    # Errors of what the filter passes at the chosen length
+    spectrum, n, scale = spectrum_of(signals)
+    passed = min(int(bandwidth * points), spectrum.shape[1] - 1)
+    rms_error = float(rms_errors(spectrum, n, scale)[passed])
+    peak_error = float(peak_errors(spectrum, n, scale, [passed])[0])
+    report = period_report(freq, points, srate, compact)
+    report.update({
+        'native_points': native.points,
+        'native_srate': float(native.sRates[0]),
+        'harmonics': harmonics,
+        'passed_harmonics': passed,
+        'rms_error': rms_error,
+        'peak_error': peak_error,
+        'rms_budget': rms,
+        'peak_budget': peak,
+        'within_budget': (rms is None or rms_error <= rms) and (peak is None or peak_error <= peak),
+        'below_dac': rms is not None and rms < DAC_RMS_ERROR,
+        'reduction': native.points / points,
+    })
+    times = native.t_starts[0] + np.arange(points) / srate
+    return compact.astype('f4'), srate, points, times, report
+
+
+def compact_pair(file1, file2, invert_ch2=True, normalize=True, rms=None, peak=None,
+                 srate_limit=DEFAULT_MAX_SRATE):
+    """align_waveforms() at the shortest length within budget: returns (sig1, sig2, sRate, points, unified_times, report)"""
+    loaded = load_batch((file1, file2))
+    with phase('align'):
+        signals, srate, points, times, report = compact_loaded(
+            [loaded[file1], loaded[file2]], [False, invert_ch2], normalize, rms, peak, srate_limit)
+    return signals[0], signals[1], str(srate), points, times, report
+
+
+def compact_name(filename, points):
+    """Return the file name of a compact arb: the points token replaced, or appended"""
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    if re.search(r'\d+pts', stem, re.IGNORECASE):
+        return re.sub(r'\d+pts', f'{points}pts', stem, flags=re.IGNORECASE) + ext
+    return f'{stem}_{points}pts{ext}'
+
+
+def write_compact(filename, times, values, source):
+    """Write a compact arb as a time/value CSV like the modal files, headed with the source's label"""
+    with open(source) as f:
+        header = f.readline().strip()
+    # Files without a header row start with a number
+    if not header or header[0] in '+-.0123456789':
+        header = 'time_s,value'
+    np.savetxt(filename, np.column_stack((times, values)), fmt='%.10g', delimiter=',', header=header,
+               comments='')
+
+
+def print_report(report, names):
+    print(f"{' + '.join(names)}: {report['native_points']} -> {report['points']} points "
+          f"({report['reduction']:.0f}x fewer, {report['bytes']} bytes per channel), "
+          f"{report['native_srate'] / 1e6:g} -> {report['srate'] / 1e6:g} MSa/s")
+    print(f"  harmonics kept {report['harmonics']} (filter passes {report['passed_harmonics']}), "
+          f"RMS error {report['rms_error']:.2e}, peak error {report['peak_error']:.2e} of peak, "
+          f"period error {report['period_error']:.1e}, wrap jump {report['wrap_jump']:.2f}")
+    if not report['within_budget']:
+        print("  note: over budget, the filter does not pass enough harmonics even at the native length")
+    if report['below_dac']:
+        print(f"  note: the RMS budget is below the DAC's own {DAC_RMS_ERROR:.1e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='channel pairs: file1 file2 [file1 file2 ...]')
+    parser.add_argument('--rms', type=float, default=None, help='RMS error budget, relative to peak')
+    parser.add_argument('--peak', type=float, default=None, help='peak error budget, relative to peak')
+    parser.add_argument('--no-invert-ch2', dest='invert_ch2', action='store_false')
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--out', default=None, help='directory for the compact arbs (CSV)')
+    args = parser.parse_args()
+    if len(args.files) % 2:
+        parser.error('give the files in channel pairs')
+    if args.rms is None and args.peak is None:
+        args.rms = 1e-3
+
+    for file1, file2 in zip(args.files[::2], args.files[1::2]):
+        sig1, sig2, _, points, times, report = compact_pair(file1, file2, args.invert_ch2, args.normalize,
+                                                            args.rms, args.peak)
+        print_report(report, [os.path.basename(file1), os.path.basename(file2)])
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            # Channel 2 is stored as in its file; the driver inverts it again when loading
+            for source, values in ((file1, sig1), (file2, -sig2 if args.invert_ch2 else sig2)):
+                path = os.path.join(args.out, compact_name(source, points))
+                write_compact(path, times, values, source)
+                print(f"  wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import hashlib
+import math
+
+import numpy as np
+
+# DATA:ARB:DAC codes span -32767..+32767 (full scale -1..+1)
+DAC_MAX = 32767
+CHUNK_POINTS = 65536
+
+
+def quantize_dac(samples, dither=False, rng=None):
+    """Quantize float samples in -1..1 to int16 DAC codes, with optional TPDF dither
+
+    Values outside -1..1 are clipped. Dither adds triangular noise of +/-1 LSB
+    before rounding, which decorrelates the error from the signal.
+    """
+    scaled = np.asarray(samples, dtype=np.float64) * DAC_MAX
+    if dither:
+        rng = rng if rng is not None else np.random.default_rng(0)
+        scaled += rng.random(scaled.shape) - rng.random(scaled.shape)
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, -DAC_MAX, DAC_MAX, out=scaled)
+    return scaled.astype('<i2')
+
+
+def iter_dac_chunks(samples, dither=False, seed=0, chunk_points=CHUNK_POINTS):
+    """Yield DAC codes chunk by chunk; the same seed always gives the same codes"""
+    rng = np.random.default_rng(seed) if dither else None
+    for start in range(0, len(samples), chunk_points):
+        yield quantize_dac(samples[start:start + chunk_points], dither, rng)
+
+
+def quantize_arb(samples, dither=False, seed=0):
+    """Return the DAC codes of a whole arb, the same codes iter_dac_chunks() yields"""
+    return np.concatenate(list(iter_dac_chunks(samples, dither, seed)) or [np.zeros(0, '<i2')])
+
+
+def dac_hash(samples, dither=False, seed=0):
+    """Return the content hash of an arb uploaded as DAC codes"""
+    digest = hashlib.sha1(b'dac')
+    for codes in iter_dac_chunks(samples, dither, seed):
+        digest.update(codes)
+    return digest.hexdigest()
+
+
+def codes_hash(codes):
+    """Return dac_hash() of the arb these DAC codes were quantized from"""
+    digest = hashlib.sha1(b'dac')
+    digest.update(np.ascontiguousarray(codes, dtype='<i2'))
+    return digest.hexdigest()
+
+
+def quantization_report(samples, dither=False, seed=0):
+    """Compare host DAC quantization with the float32 upload path
+
+    The float path is quantized by the instrument; it is modelled as rounding
+    the float32 value to the nearest code. Errors are in full-scale units.
+    """
+    sq_error = sq_float = sq_signal = 0.0
+    peak = peak_float = 0.0
+    clipped = 0
+    for start, codes in zip(range(0, len(samples), CHUNK_POINTS), iter_dac_chunks(samples, dither, seed)):
+        exact = np.asarray(samples[start:start + CHUNK_POINTS], dtype=np.float64)
+        error = codes / DAC_MAX - exact
+        float_codes = np.clip(np.rint(exact.astype('f4') * DAC_MAX), -DAC_MAX, DAC_MAX)
+        float_error = float_codes / DAC_MAX - exact
+        sq_error += float(np.dot(error, error))
+        sq_float += float(np.dot(float_error, float_error))
+        sq_signal += float(np.dot(exact, exact))
+        peak = max(peak, float(np.abs(error).max()))
+        peak_float = max(peak_float, float(np.abs(float_error).max()))
+        clipped += int(np.count_nonzero(np.abs(exact) > 1.0))
+    n = max(len(samples), 1)
+    rms = math.sqrt(sq_error / n)
+    rms_float = math.sqrt(sq_float / n)
+    return {
+        'points': len(samples),
+        'dither': bool(dither),
+        'rms_error': rms,
+        'peak_error': peak,
+        'snr_db': 10 * math.log10(sq_signal / sq_error) if sq_error > 0 else math.inf,
+        'float_rms_error': rms_float,
+        'float_peak_error': peak_float,
+        'extra_rms_error': rms - rms_float,
+        'clipped': clipped,
+        'bytes': 2 * len(samples),
+        'float_bytes': 4 * len(samples),
+    }
+
+
+def worst_report(reports):
+    """Combine quantization_report()s of several arbs into their worst case; None without any"""
+    reports = list(reports)
+    if not reports:
+        return None
+    return {
+        'arbs': len(reports),
+        'dither': any(report['dither'] for report in reports),
+        'rms_error': max(report['rms_error'] for report in reports),
+        'peak_error': max(report['peak_error'] for report in reports),
+        'snr_db': min(report['snr_db'] for report in reports),
+        'float_rms_error': max(report['float_rms_error'] for report in reports),
+        'float_peak_error': max(report['float_peak_error'] for report in reports),
+        'extra_rms_error': max(report['extra_rms_error'] for report in reports),
+        'clipped': sum(report['clipped'] for report in reports),
+        'bytes': sum(report['bytes'] for report in reports),
+        'float_bytes': sum(report['float_bytes'] for report in reports),
+    }
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import re
+
+from arb_store import arb_hash, arb_name
+from arb_quantize import codes_hash, quantization_report, quantize_arb
+from arb_stream import OperationCancelled, upload_arb
+from phase_timer import phase
+
+
+def _quantize(samples, dither):
+    return quantize_arb(samples, dither), quantization_report(samples, dither)
+
+
+class ArbResidency:
+    """Track which arbitrary waveforms are resident in each channel's volatile memory"""
+
+    def __init__(self, channels=(1, 2), store=None, progress=None, dac=False, dither=False, quantize=None):
+        self.channels = tuple(channels)
+        # Optional ArbStore; without one, arbs are only sent to volatile memory
+        self.store = store
+        # progress(sent bytes, total bytes, bytes/sec) during uploads
+        self.progress = progress
+        # Upload int16 codes through DATA:ARB:DAC instead of float32
+        self.dac = dac
+        self.dither = dither
+        # quantize(samples, dither) -> (codes, report), e.g. ArbCache.dac_codes; quantized here if None
+        self.quantize = quantize or _quantize
+        # arb name -> quantization_report() of arbs uploaded as DAC codes
+        self.reports = {}
+        # channel -> {content hash: name used with FUNC:ARB}
+        self.resident = {ch: {} for ch in self.channels}
+        # (file1, file2) -> (name1, name2, sRate, points)
+        self.pairs = {}
+
+    def is_resident(self, channel, name):
+        """Return True if the arb is loaded in the channel's volatile memory"""
+        return name in self.resident[channel].values()
+
+    def clear(self, inst, channel=None):
+        """Clear volatile arb memory of one channel (or all channels)"""
+        channels = self.channels if channel is None else (channel,)
+        for ch in channels:
+            inst.write(f'SOUR{ch}:DATA:VOL:CLE')
+            self.resident[ch].clear()
+        self.pairs = {key: value for key, value in self.pairs.items()
+                      if all(self.is_resident(ch, name) for ch, name in zip(self.channels, value[:2]))}
+
+    def reconcile(self, inst):
+        """Forget arbs missing from the channels' DATA:VOL:CAT? (e.g. after a power cycle); returns them
+
+        Pairs with a lost arb are dropped too, so preload() loads only what is gone.
+        """
+        lost = {}
+        for ch in self.channels:
+            catalog = set(re.findall(r'"([^"]+)"', inst.query(f'SOUR{ch}:DATA:VOL:CAT?')))
+            # Arbs loaded from flash are selected by their quoted path
+            lost[ch] = [name for name in self.resident[ch].values() if name.strip('"') not in catalog]
+            self.resident[ch] = {digest: name for digest, name in self.resident[ch].items()
+                                 if name.strip('"') in catalog}
+        self.pairs = {key: value for key, value in self.pairs.items()
+                      if all(self.is_resident(ch, name) for ch, name in zip(self.channels, value[:2]))}
+        return lost
+
+    def upload(self, inst, channel, samples, cancel=None):
+        """Make an arb resident on a channel unless it already is; returns its name"""
+        report = None
+        if self.dac:
+            samples, report = self.quantize(samples, self.dither)
+            digest = codes_hash(samples)
+        else:
+            digest = arb_hash(samples)
+        if digest in self.resident[channel]:
+            return self.resident[channel][digest]
+        if self.store is not None:
+            name = self.store.ensure(inst, channel, samples, digest, self.progress, cancel, self.dac, self.dither)
+        else:
+            name = arb_name(digest)
+            with phase('upload'):
+                upload_arb(inst, channel, name, samples, self.progress, cancel, self.dac, self.dither)
+        if report is not None:
+            self.reports[name] = report
+        self.resident[channel][digest] = name
+        return name
+
+    def select(self, inst, channel, name):
+        """Select a resident arb as the channel's active waveform"""
+        if not self.is_resident(channel, name):
+            raise KeyError(f'Arb {name} is not resident on channel {channel}')
+        inst.write(f'SOUR{channel}:FUNC:ARB {name}')
+
+    def preload(self, inst, pairs, align, cancel=None):
+        """Align and upload every distinct waveform pair once, CH1 from file1 and CH2 from file2
+
+        align(file1, file2) returns the pair as align_waveforms() does, with its
+        options (invert_ch2, normalize) already bound. When the cancel event
+        (threading.Event) is set, OperationCancelled is raised before the next
+        upload or chunk; arbs already uploaded stay resident.
+        """
+        for file1, file2 in pairs:
+            if (file1, file2) in self.pairs:
+                continue
+            sig1, sig2, sRate, points, _ = align(file1, file2)
+            names = []
+            for channel, samples in zip(self.channels, (sig1, sig2)):
+                if cancel is not None and cancel.is_set():
+                    raise OperationCancelled(f'Upload of {file1}, {file2} cancelled')
+                names.append(self.upload(inst, channel, samples, cancel))
+            name1, name2 = names
+            self.pairs[(file1, file2)] = (name1, name2, sRate, points)
+        return self.pairs
+
+    def pair(self, file1, file2):
+        """Return (name1, name2, sRate, points) for a preloaded waveform pair"""
+        try:
+            return self.pairs[(file1, file2)]
+        except KeyError:
+            raise KeyError(f'Waveform pair {file1}, {file2} has not been preloaded')
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""Arb sequences: play a pattern of modes on the instrument, with no host round trips between segments
+
+    awg.play_sequence('forward 200, right 50, backward until trigger')
+
+Each channel gets one DATA:SEQ sequence whose steps are resident one-period
+arbs. A sequence plays at one sample rate, so every mode is resampled to the
+whole number of points its period takes at a common SRAT, and mode polarity
+(OUTPx:POL is per channel, not per step) is baked into inverted copies.
+"""
+
+import hashlib
+import json
+import math
+import re
+from collections import namedtuple
+from fractions import Fraction
+
+import numpy as np
+
+from exact_period import DEFAULT_MAX_SRATE, MAX_POINTS, MIN_POINTS, SRATE_RESOLUTION, max_srate, resample_periodic
+from mode_switch import ARB_HEADERS
+from phase_timer import phase
+
+# Step play controls of DATA:SEQ
+PLAY_CONTROLS = ('once', 'onceWaitTrig', 'repeat', 'repeatInf', 'repeatTilTrig')
+# Words of a pattern that pick a play control (a bare count repeats)
+ADVANCE_WORDS = {'wait': 'onceWaitTrig', 'forever': 'repeatInf', 'until trigger': 'repeatTilTrig'}
+MAX_STEPS = 512
+MAX_REPEAT = 1_000_000
+TRIGGER_SOURCES = ('IMM', 'EXT', 'TIM', 'BUS')
+
+# mode: number in the mode table; cycles: periods played (play 'repeat' or 'once')
+Segment = namedtuple('Segment', 'mode cycles play')
+# SYST:ERR? entries read at most per check
+MAX_ERRORS = 20
+
+
+class SequenceError(Exception):
+    """The instrument reported an error while the steps or sequences were loaded"""
+
+
+def read_errors(inst):
+    """Empty the instrument's error queue; returns its entries"""
+    errors = []
+    for _ in range(MAX_ERRORS):
+        error = inst.query('SYST:ERR?').strip()
+        if error.startswith(('+0', '0')):
+            break
+        errors.append(error)
+    return errors
+
+
+def segment(mode, cycles=1, play=None):
+    """Return a Segment, 'repeat' for several cycles and 'once' for one unless play is given"""
+    if play is None:
+        play = 'repeat' if cycles > 1 else 'once'
+    if play not in PLAY_CONTROLS:
+        raise ValueError(f"Unknown play control {play!r}; use one of {', '.join(PLAY_CONTROLS)}")
+    if not 1 <= cycles <= MAX_REPEAT:
+        raise ValueError(f"Cycles must be 1..{MAX_REPEAT}")
+    return Segment(mode, int(cycles), play)
+
+
+def parse_pattern(text, modes):
+    """Parse 'forward 200, right 50, left until trigger' into Segments
+
+    Modes are named as in the mode table (or numbered); each may be followed
+    by a cycle count and 'wait', 'forever' or 'until trigger'.
+    """
+    names = {name.lower(): num for num, (name, *_) in modes.items()}
+    segments = []
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        match = re.match(r'^(\w+)(?:\s+(\d+))?(?:\s+(?:cycles?|x))?(?:\s+(wait|forever|until trigger))?$',
+                         part, re.IGNORECASE)
+        if not match:
+            raise ValueError(f"Cannot parse segment {part!r}")
+        word, cycles, advance = match.groups()
+        mode = int(word) if word.isdigit() else names.get(word.lower())
+        if mode not in modes:
+            raise ValueError(f"Unknown mode {word!r}")
+        play = ADVANCE_WORDS[advance.lower()] if advance else None
+        segments.append(segment(mode, int(cycles) if cycles else 1, play))
+    if not segments:
+        raise ValueError("Empty pattern")
+    return segments
+
+
+def common_rate(freqs, min_points, srate=None, srate_limit=DEFAULT_MAX_SRATE):
+    """Return (srate, points per frequency): one SRAT at which every period is whole samples
+
+    SRAT is a multiple of every frequency (and of the SRAT resolution); the
+    smallest one that gives each frequency at least its min_points, or the
+    given srate if it qualifies.
+    """
+    fractions = [Fraction(f).limit_denominator(10 ** 6) for f in freqs]
+    base = Fraction(SRATE_RESOLUTION).limit_denominator(10 ** 6)
+    for f in fractions:
+        base = Fraction(math.lcm(base.numerator, f.numerator), math.gcd(base.denominator, f.denominator))
+    if srate is None:
+        multiple = max(math.ceil(n * f / base) for n, f in zip(min_points, fractions))
+        rate = multiple * base
+    else:
+        rate = Fraction(srate).limit_denominator(10 ** 6)
+        if rate % base:
+            raise ValueError(f"{srate} Sa/s is not a multiple of every mode's frequency (use a multiple of "
+                             f"{float(base):g} Sa/s)")
+    points = [int(rate / f) for f in fractions]
+    if rate > srate_limit or max(points) > MAX_POINTS or min(points) < MIN_POINTS:
+        raise ValueError(f"No common sample rate within {srate_limit:g} Sa/s and {MIN_POINTS}..{MAX_POINTS} points "
+                         f"(needs {float(rate):g} Sa/s)")
+    return float(rate), points
+
+
+def sequence_name(steps):
+    """Return the 12-character name of a sequence from its steps"""
+    return 'S' + hashlib.sha1(json.dumps(steps).encode()).hexdigest()[:11].upper()
+
+
+def sequence_block(name, steps):
+    """Return the DATA:SEQ definite-length block of a sequence
+
+    steps are (arb name, repeat count, play control, points); the marker
+    goes high at each step's start and low halfway, so Sync marks the steps.
+    """
+    fields = [f'"{name}"']
+    for arb, repeat, play, points in steps:
+        fields.append(f'"{arb.strip(chr(34))}",{repeat},{play},highAtStartGoLow,{max(points // 2, 1)}')
+    payload = ','.join(fields).encode('latin-1')
+    length = str(len(payload))
+    return f'#{len(length)}{length}'.encode('ascii') + payload
+
+
+def sequence_settings(names, srate, trigger, ch1_voltage, ch2_voltage):
+    """Build the (waveform, output) settings that play a sequence per channel, like mode_settings()"""
+    waveform = {}
+    for ch, name, voltage in ((1, names[0], ch1_voltage), (2, names[1], ch2_voltage)):
+        waveform.update({
+            f'SOUR{ch}:FUNC': 'ARB',
+            f'SOUR{ch}:FUNC:ARB': name,
+            f'SOUR{ch}:FUNC:ARB:SRAT': str(srate),
+            f'SOUR{ch}:VOLT': str(voltage),
+            f'SOUR{ch}:VOLT:OFFS': '0',
+            f'SOUR{ch}:PHAS': '0',
+            f'TRIG{ch}:SOUR': trigger,
+        })
+    # Polarity is in the samples; the step markers drive Sync
+    output = {
+        'OUTP1:POL': 'NORM',
+        'OUTP2:POL': 'NORM',
+        'OUTP:SYNC': 'ON',
+        'OUTP:SYNC:SOURCE': 'CH1',
+        'OUTP:SYNC:MODE': 'MARK',
+        'OUTP1': 'ON',
+        'OUTP2': 'ON',
+    }
+    return waveform, output
+
+
+def load_sequence(awg, segments, srate=None, trigger='BUS', output_state='ON'):
+    """Upload the steps and sequences of a pattern to a connected Keysight33600A and start it
+
+    Returns a report: name per channel, SRAT, per-segment points, start time
+    and duration (None after a step that waits for a trigger or never ends),
+    and the total duration of the deterministic part. The driver keeps the
+    pattern as current_sequence, so reconnect() can restore it. Raises
+    SequenceError, with the outputs left as they were, if the instrument
+    reports an error for the steps or sequences.
+    """
+    if isinstance(segments, str):
+        segments = parse_pattern(segments, awg.modes)
+    if len(segments) > MAX_STEPS:
+        raise ValueError(f"A sequence has at most {MAX_STEPS} steps")
+    if trigger not in TRIGGER_SOURCES:
+        raise ValueError(f"Unknown trigger source {trigger!r}")
+    with awg.lock:
+        # One period per waveform pair, as the driver prepares it
+        pairs = {}
+        for seg in segments:
+            _, file1, file2, _, _ = awg.modes[seg.mode]
+            if (file1, file2) not in pairs:
+                sig1, sig2, sRate, points, _ = awg.align(file1, file2, invert_ch2=awg.invert_ch2)
+                pairs[(file1, file2)] = (np.stack((sig1, sig2)), float(sRate) / points, points)
+        keys = list(pairs)
+        rate, lengths = common_rate([pairs[k][1] for k in keys], [pairs[k][2] for k in keys], srate,
+                                    max_srate(awg.idn))
+        with phase('align'):
+            periods = {k: np.clip(resample_periodic(pairs[k][0], n), -1.0, 1.0) for k, n in zip(keys, lengths)}
+
+        # Errors from before are not this sequence's; flash may have lost stored steps
+        read_errors(awg.inst)
+        awg.residency.store.reconcile(awg.inst)
+        # One step per segment; modes sharing a pair differ only in the signs of the samples
+        steps = {1: [], 2: []}
+        for seg in segments:
+            _, file1, file2, ch1_polarity, ch2_polarity = awg.modes[seg.mode]
+            period = periods[(file1, file2)]
+            for ch, polarity in ((1, ch1_polarity), (2, ch2_polarity)):
+                samples = (-period[ch - 1] if polarity == 'INV' else period[ch - 1]).astype('f4')
+                name = awg.residency.upload(awg.inst, ch, samples, awg.cancel)
+                steps[ch].append((name, seg.cycles, seg.play, period.shape[1]))
+        # Storing step arbs on flash selects them; selecting the sequence again also restarts it
+        awg.switcher.invalidate(*ARB_HEADERS)
+
+        names = []
+        with phase('upload'):
+            for ch in (1, 2):
+                name = sequence_name(steps[ch])
+                awg.inst.write_raw(f'SOUR{ch}:DATA:SEQ '.encode('ascii') + sequence_block(name, steps[ch]) + b'\n')
+                names.append(name)
+            # A sequence naming a missing step is not defined; the outputs must not come on then
+            errors = read_errors(awg.inst)
+            if errors:
+                raise SequenceError(f"Sequence not loaded: {'; '.join(errors)}")
+        waveform, output = sequence_settings(names, rate, trigger, awg.ch1_voltage, awg.ch2_voltage)
+        output.update({'OUTP1': output_state, 'OUTP2': output_state})
+        sent = awg.switcher.apply(awg.inst, waveform, output, awg.sync_channels)
+        awg.wait()
+        awg.current_mode = None
+        awg.current_sequence = {'segments': segments, 'srate': srate, 'trigger': trigger, 'names': names,
+                                'rate': rate}
+        return sequence_report(names, rate, segments, steps[1], sent)
+
+
+def resume_sequence(awg, sequence, output_state='ON'):
+    """Restore a current_sequence after a reconnect; returns the SCPI settings sent
+
+    A sequence still selected on both channels (the instrument kept its
+    volatile memory) goes on uninterrupted and only differing settings are
+    written; otherwise it is uploaded and started again from its first step.
+    """
+    with awg.lock:
+        names = sequence['names']
+        if all(awg.switcher.state.matches(f'SOUR{ch}:FUNC:ARB', name) for ch, name in zip((1, 2), names)):
+            waveform, output = sequence_settings(names, sequence['rate'], sequence['trigger'], awg.ch1_voltage,
+                                                 awg.ch2_voltage)
+            output.update({'OUTP1': output_state, 'OUTP2': output_state})
+            sent = awg.switcher.apply(awg.inst, waveform, output, awg.sync_channels)
+            awg.wait()
+            return sent
+        return load_sequence(awg, sequence['segments'], sequence['srate'], sequence['trigger'], output_state)['sent']
+
+
+def sequence_report(names, srate, segments, steps, sent):
+    """Timing of each segment: start and duration in seconds, None once a step waits or loops forever"""
+    report = {'names': names, 'srate': srate, 'segments': [], 'sent': sent}
+    start = 0.0
+    for seg, (_, cycles, play, points) in zip(segments, steps):
+        if play in ('repeat', 'once'):
+            duration = (cycles if play == 'repeat' else 1) * points / srate
+        else:
+            duration = None
+        report['segments'].append({'mode': seg.mode, 'points': points, 'cycles': cycles, 'play': play,
+                                   'start': start, 'duration': duration})
+        start = None if start is None or duration is None else start + duration
+    report['duration'] = start
+    return report
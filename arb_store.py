@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from arb_quantize import dac_hash
+from arb_stream import upload_arb
+from phase_timer import phase
+
+STORE_DIR = 'INT:\\remoteAdded'
+DEFAULT_MANIFEST = os.path.join(os.path.expanduser('~'), '.keysight33600a', 'arb_manifest.json')
+# Arb files kept per instrument; the least recently used beyond this are deleted
+MAX_FILES = 64
+# Manifest section of last-use times: instrument -> {content hash: time.time()}
+LAST_USED = 'last_used'
+
+# Stores of several instruments share one manifest file
+_manifest_lock = threading.Lock()
+
+
+def arb_hash(samples):
+    """Return the content hash of a prepared arb (little-endian float32 samples)"""
+    digest = hashlib.sha1()
+    # Hash in slices so memory-mapped arbs are not copied whole
+    for start in range(0, len(samples), 1 << 20):
+        digest.update(np.ascontiguousarray(samples[start:start + (1 << 20)], dtype='<f4'))
+    return digest.hexdigest()
+
+
+def arb_name(digest):
+    """Return the 12-character arb name used for a content hash"""
+    return 'A' + digest[:11].upper()
+
+
+class ArbStore:
+    """Content-addressed arb files on INT:\\remoteAdded, tracked by a local manifest
+
+    Beyond max_files (None: no limit) the least recently used files are
+    deleted as new ones are stored.
+    """
+
+    def __init__(self, idn, manifest_path=DEFAULT_MANIFEST, max_files=MAX_FILES):
+        # Manufacturer, model and serial identify the instrument (firmware may change)
+        self.instrument = ','.join(part.strip() for part in idn.split(',')[:3])
+        self.manifest_path = manifest_path
+        self.max_files = max_files
+        self.manifest = self._read_manifest()
+        self.stored = self.manifest.setdefault(self.instrument, {})
+        # Entries of older manifests have no time and are evicted first
+        self.last_used = self.manifest.setdefault(LAST_USED, {}).setdefault(self.instrument, {})
+        # Arbs used through this store; never evicted by it
+        self.in_use = set()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Write this instrument's entries back to the manifest, keeping other instruments' entries"""
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with _manifest_lock:
+            self.manifest = self._read_manifest()
+            self.manifest[self.instrument] = self.stored
+            for digest in [digest for digest in self.last_used if digest not in self.stored]:
+                del self.last_used[digest]
+            self.manifest.setdefault(LAST_USED, {})[self.instrument] = self.last_used
+            tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def path(name):
+        """Return the instrument file path of a stored arb"""
+        return f'{STORE_DIR}\\{name}.arb'
+
+    def reconcile(self, inst):
+        """Drop manifest entries whose file is no longer on the instrument"""
+        catalog = inst.query(f'MMEM:CAT:DATA:ARB? "{STORE_DIR}"')
+        files = set(re.findall(r'"([^",]+),', catalog))
+        missing = [digest for digest, name in self.stored.items() if f'{name}.arb' not in files]
+        for digest in missing:
+            del self.stored[digest]
+        if missing:
+            self.save()
+        return missing
+
+    def touch(self, digest):
+        """Record that an arb was used now"""
+        self.last_used[digest] = time.time()
+        self.in_use.add(digest)
+
+    def evict(self, inst):
+        """Delete the least recently used arb files beyond max_files; returns their names
+
+        Arbs used through this store are kept, so a preload never evicts its
+        own arbs; the limit then applies again on the next connect.
+        """
+        if self.max_files is None or len(self.stored) <= self.max_files:
+            return []
+        unused = sorted((digest for digest in self.stored if digest not in self.in_use),
+                        key=lambda digest: self.last_used.get(digest, 0))
+        evicted = []
+        for digest in unused[:len(self.stored) - self.max_files]:
+            name = self.stored.pop(digest)
+            inst.write(f'MMEM:DEL "{self.path(name)}"')
+            evicted.append(name)
+        if evicted:
+            self.save()
+        return evicted
+
+    def is_stored(self, digest):
+        """Return True if the arb with this content hash is on the instrument"""
+        return digest in self.stored
+
+    def ensure(self, inst, channel, samples, digest=None, progress=None, cancel=None, dac=False, dither=False):
+        """Make an arb resident on a channel, writing it to flash only if it is new
+
+        Returns the name to use with SOURx:FUNC:ARB. Commands are only queued
+        here; the caller waits for completion once all arbs are sent.
+        """
+        digest = digest or (dac_hash(samples, dither) if dac else arb_hash(samples))
+        name = arb_name(digest)
+        if self.is_stored(digest):
+            # Already on the instrument: load from flash instead of sending over USB
+            path = self.path(self.stored[digest])
+            with phase('mmem_load'):
+                inst.write(f'MMEM:LOAD:DATA{channel} "{path}"')
+            self.touch(digest)
+            self.save()
+            return f'"{path}"'
+        with phase('upload'):
+            upload_arb(inst, channel, name, samples, progress, cancel, dac, dither)
+        with phase('mmem_store'):
+            # MMEM:STOR:DATA stores the channel's selected arb
+            inst.write(f'SOUR{channel}:FUNC:ARB {name}')
+            inst.write(f'MMEM:STOR:DATA{channel} "{self.path(name)}"')
+        self.stored[digest] = name
+        self.touch(digest)
+        self.evict(inst)
+        self.save()
+        return name
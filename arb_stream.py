@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import time
+
+import numpy as np
+
+from arb_quantize import iter_dac_chunks
+
+# Arbs up to this many points go out as one write_binary_values() block
+STREAM_THRESHOLD = 262144
+CHUNK_POINTS = 65536
+
+
+class OperationCancelled(Exception):
+    """An arb upload was abandoned because its cancel event was set"""
+
+
+def iter_chunks(samples, chunk_points=CHUNK_POINTS):
+    """Yield consecutive slices of an array or memmap without copying it whole"""
+    for start in range(0, len(samples), chunk_points):
+        yield samples[start:start + chunk_points]
+
+
+def stream_arb(inst, header, chunks, points, dtype='<f4', progress=None, cancel=None):
+    """Send one IEEE 488.2 definite-length block in pieces as a single message
+
+    header is the command up to the block, e.g. 'SOUR1:DATA:ARB NAME,'.
+    chunks yields sample arrays (a generator, or iter_chunks() over a memmap)
+    adding up to points samples; each is converted to dtype on its own, so
+    the full buffer is never built. Every chunk is written with END
+    suppressed, so the instrument sees one message. progress(sent, total,
+    bytes_per_sec) is called after each chunk. When the cancel event is set
+    between chunks, the partial message is dropped with a device clear and
+    OperationCancelled is raised. Returns the average bytes per second.
+    """
+    dtype = np.dtype(dtype)
+    total = points * dtype.itemsize
+    length = str(total)
+    send_end = inst.send_end
+    sent = 0
+    t0 = time.perf_counter()
+    inst.send_end = False
+    try:
+        inst.write_raw(f'{header}#{len(length)}{length}'.encode('ascii'))
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                inst.clear()
+                raise OperationCancelled(f'{header} cancelled after {sent} of {total} bytes')
+            data = np.ascontiguousarray(chunk, dtype=dtype)
+            inst.write_raw(data.tobytes())
+            sent += data.nbytes
+            if progress is not None:
+                progress(sent, total, sent / max(time.perf_counter() - t0, 1e-9))
+        if sent != total:
+            inst.clear()
+            raise ValueError(f'{header} sent {sent} of {total} bytes')
+        inst.send_end = True
+        inst.write_raw(b'\n')
+    finally:
+        inst.send_end = send_end
+    return total / max(time.perf_counter() - t0, 1e-9)
+
+
+def upload_arb(inst, channel, name, samples, progress=None, cancel=None, dac=False, dither=False):
+    """Upload float samples as SOURx:DATA:ARB name, streaming large arbs in chunks
+
+    With dac, the samples are quantized on the host and sent as int16 codes
+    through SOURx:DATA:ARB:DAC, half the bytes of the float32 path. int16
+    samples are DAC codes already (e.g. from ArbCache.dac_codes()) and go
+    out as they are.
+    """
+    if dac:
+        header = f'SOUR{channel}:DATA:ARB:DAC {name},'
+        if np.asarray(samples[:0]).dtype == np.int16:
+            chunks = iter_chunks(samples)
+        else:
+            chunks = iter_dac_chunks(samples, dither)
+        dtype = '<i2'
+    else:
+        header = f'SOUR{channel}:DATA:ARB {name},'
+        chunks, dtype = iter_chunks(samples), '<f4'
+    if len(samples) <= STREAM_THRESHOLD:
+        values = np.concatenate(list(chunks)) if dac else samples
+        inst.write_binary_values(header, values, datatype='h' if dac else 'f', is_big_endian=False)
+        if progress is not None:
+            nbytes = np.dtype(dtype).itemsize * len(samples)
+            progress(nbytes, nbytes, None)
+        return
+    stream_arb(inst, header, chunks, len(samples), dtype=dtype, progress=progress, cancel=cancel)
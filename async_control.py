@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from functools import partial
+
+from arb_stream import OperationCancelled
+
+# Queue priorities: lower runs first
+PRIORITY_STOP = 0
+PRIORITY_NORMAL = 1
+
+
+class InstrumentController:
+    """asyncio front end of one Keysight33600A with a single command queue
+
+    Every driver call goes through one priority queue and runs on one worker
+    thread, so SCPI from different callers never interleaves. Calls are
+    awaitable (await ctl.select_mode(1)) or, from a non-async thread such as
+    Tk, submitted with request() which returns a concurrent.futures.Future.
+    Each call runs with its own cancel event as the driver's cancel: setting
+    it abandons that call only, before it starts or at its next arb.
+    stop() pre-empts: it sets the running call's cancel event, fails every
+    call still queued and runs ahead of them.
+    """
+
+    def __init__(self, awg):
+        self.awg = awg
+        self._seq = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scpi')
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        # Futures of queued calls that a stop() may cancel
+        self._pending = set()
+        # Cancel event of the call running on the worker thread
+        self._running_cancel = None
+        self._status_lock = threading.Lock()
+        self._status = {'busy': None, 'queued': 0, 'last_error': None, 'last_result': None,
+                        'last_seconds': None}
+        self._thread = threading.Thread(target=self._run_loop, name='instrument-loop', daemon=True)
+        self._ready = threading.Event()
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.PriorityQueue()
+        self._worker = self._loop.create_task(self._work())
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    def _set_status(self, **changes):
+        with self._status_lock:
+            self._status.update(changes)
+
+    def status(self):
+        """Return a snapshot of the controller and driver state without touching the instrument"""
+        with self._status_lock:
+            status = dict(self._status)
+        status.update(connected=self.awg.connected, mode=self.awg.current_mode,
+                      last_completion=self.awg.last_completion)
+        return status
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, name, args, cancel, future = await self._queue.get()
+            self._pending.discard(future)
+            self._set_status(queued=self._queue.qsize())
+            if future.done():
+                continue
+            if cancel.is_set():
+                future.set_exception(OperationCancelled(f'{name} cancelled before it ran'))
+                continue
+            # An abort meant for another call never reaches this one
+            self.awg.cancel = cancel
+            self._running_cancel = cancel
+            self._set_status(busy=name)
+            t0 = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self._executor, partial(getattr(self.awg, name), *args))
+            except Exception as e:
+                self._set_status(last_error=f'{name}: {e}')
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self._set_status(last_result=name, last_error=None)
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._running_cancel = None
+                # Direct driver calls (e.g. a supervisor reconnect) start uncancelled
+                self.awg.cancel = threading.Event()
+                self._set_status(busy=None, last_seconds=time.perf_counter() - t0)
+
+    def _enqueue(self, name, args, priority, cancel):
+        future = self._loop.create_future()
+        self._queue.put_nowait((priority, next(self._seq), name, args, cancel, future))
+        if name != 'stop':
+            self._pending.add(future)
+        self._set_status(queued=self._queue.qsize())
+        return future
+
+    def _cancel_queued(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+    async def _call(self, name, args, cancel, priority=PRIORITY_NORMAL):
+        if name == 'stop':
+            if self._running_cancel is not None:
+                self._running_cancel.set()
+            self._cancel_queued()
+            priority = PRIORITY_STOP
+        return await self._enqueue(name, args, priority, cancel)
+
+    def request(self, name, *args, cancel=None):
+        """Queue a driver call from any thread; returns a concurrent.futures.Future
+
+        cancel is the call's cancel event (a new one if None); setting it
+        makes the call fail with OperationCancelled.
+        """
+        if cancel is None:
+            cancel = threading.Event()
+        return asyncio.run_coroutine_threadsafe(self._call(name, args, cancel), self._loop)
+
+    async def call(self, name, *args):
+        """Queue a driver call and await its result (from any event loop)"""
+        return await asyncio.wrap_future(self.request(name, *args))
+
+    async def connect(self):
+        return await self.call('connect')
+
+    async def preload(self):
+        return await self.call('preload')
+
+    async def select_mode(self, mode_num):
+        return await self.call('select_mode', mode_num)
+
+    async def output(self, on):
+        return await self.call('output', on)
+
+    async def stop(self):
+        return await self.call('stop')
+
+    def shutdown(self, close=True):
+        """Close the instrument (stopping outputs) and end the worker thread"""
+        if close:
+            try:
+                self.request('close').result()
+            except (CancelledError, Exception):
+                pass
+        asyncio.run_coroutine_threadsafe(self._stop_worker(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=True)
+
+    async def _stop_worker(self):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+
+class ModeScheduler:
+    """Latest-wins mode switching on top of an InstrumentController
+
+    Only one switch runs at a time. Requests made meanwhile replace each
+    other, and when the running switch ends only the newest target is
+    applied, so any number of presses during one switch costs one more. A
+    running switch that is still uploading arbs the new target does not use
+    (or still queued) is aborted through its cancel event; if the target comes back
+    to the running pair the abort is withdrawn, and a switch that was
+    aborted anyway is run again for the target. stop() drops the pending
+    target and goes ahead of everything through the controller.
+    """
+
+    def __init__(self, ctl):
+        self.ctl = ctl
+        self._lock = threading.Lock()
+        self.target = None
+        self._running = None
+        # Cancel event of the running switch's call
+        self._cancel = None
+        # Futures of requests for the current target
+        self._waiters = []
+        self.requested = 0
+        self.switches = 0
+        self.aborted = 0
+
+    def _pair(self, mode_num):
+        return self.ctl.awg.modes[mode_num][1:3]
+
+    def request(self, mode_num):
+        """Ask for a mode; returns a Future that is cancelled if a newer request supersedes it"""
+        waiter = Future()
+        started = None
+        with self._lock:
+            self.requested += 1
+            for superseded in self._waiters:
+                superseded.cancel()
+            self._waiters = [waiter]
+            self.target = mode_num
+            if self._running is None:
+                started = self._start(mode_num)
+            elif self._pair(self._running) != self._pair(mode_num):
+                # The running switch may be uploading arbs that are no longer wanted
+                self._cancel.set()
+                self.aborted += 1
+            elif self._cancel.is_set():
+                # Back to the running pair (A -> B -> A): its upload is wanted again
+                self._cancel.clear()
+        self._watch(started)
+        return waiter
+
+    def _start(self, mode_num):
+        """Queue a switch; returns (mode, future) for _watch() once the lock is released"""
+        self._running = mode_num
+        self._cancel = threading.Event()
+        self.switches += 1
+        return mode_num, self.ctl.request('select_mode', mode_num, cancel=self._cancel)
+
+    def _watch(self, started):
+        # A future already done runs the callback at once, and it takes the lock
+        if started is not None:
+            mode_num, future = started
+            future.add_done_callback(partial(self._finished, mode_num))
+
+    def _finished(self, mode_num, future):
+        with self._lock:
+            self._running = None
+            if self.target is None:
+                # Stopped while switching
+                return
+            # A switch cancelled on the way was not a result for the target
+            cancelled = future.cancelled() or isinstance(future.exception(), OperationCancelled)
+            started = None
+            if self.target != mode_num or cancelled:
+                started = self._start(self.target)
+            else:
+                self.target = None
+                waiters, self._waiters = self._waiters, []
+        if started is not None:
+            self._watch(started)
+            return
+        for waiter in waiters:
+            if not waiter.set_running_or_notify_cancel():
+                continue
+            if future.cancelled():
+                waiter.set_exception(CancelledError())
+            elif future.exception() is not None:
+                waiter.set_exception(future.exception())
+            else:
+                waiter.set_result(future.result())
+
+    def stop(self):
+        """Drop the pending target and stop the outputs ahead of any queued work"""
+        with self._lock:
+            self.target = None
+            for waiter in self._waiters:
+                waiter.cancel()
+            self._waiters = []
+        return self.ctl.request('stop')
+
+    def stats(self):
+        """Return how many switches were requested, run and aborted"""
+        return {'requested': self.requested, 'switches': self.switches, 'aborted': self.aborted}
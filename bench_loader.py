@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Benchmark waveform file loading: original csv.reader loop vs the shared NumPy loader"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from waveform_loader import load_waveform_with_time
+
+
+def legacy_load_waveform_with_time(filename):
+    """The per-line loader previously copied into every script (space-separated only)"""
+    times = []
+    values = []
+
+    with open(filename, 'r') as f:
+        reader = csv.reader(f, delimiter=' ')
+        for t, p in reader:
+            times.append(float(t))
+            values.append(float(p))
+
+    return np.array(times), np.array(values)
+
+
+def write_test_file(path, points, delimiter, header):
+    """Write a synthetic modal waveform with a 20 ns step"""
+    t = np.arange(points) * 2e-8
+    v = 0.4 * np.sin(2 * np.pi * 25e3 * t) + 0.2 * np.sin(2 * np.pi * 50e3 * t)
+    np.savetxt(path, np.column_stack((t, v)), fmt='%.10g', delimiter=delimiter,
+               header=header, comments='')
+
+
+def measure(loader, path):
+    """Return (seconds, peak traced MiB) of one load"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    loader(path)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, nargs='+', default=[2000, 200000, 2000000])
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'format':>6} {'legacy s':>9} {'legacy MiB':>10} {'new s':>8} {'new MiB':>8} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for points in args.points:
+            dat = os.path.join(tmp, f'w{points}.dat')
+            write_test_file(dat, points, ' ', '')
+            legacy_s, legacy_mib = measure(legacy_load_waveform_with_time, dat)
+            new_s, new_mib = measure(load_waveform_with_time, dat)
+            print(f"{points:>10} {'dat':>6} {legacy_s:>9.3f} {legacy_mib:>10.1f} {new_s:>8.3f} "
+                  f"{new_mib:>8.1f} {legacy_s / new_s:>7.1f}x")
+
+            # The legacy loader cannot read comma-separated files with a header
+            csv_path = os.path.join(tmp, f'w{points}.csv')
+            write_test_file(csv_path, points, ',', 'time_s,value')
+            new_s, new_mib = measure(load_waveform_with_time, csv_path)
+            print(f"{points:>10} {'csv':>6} {'n/a':>9} {'n/a':>10} {new_s:>8.3f} {new_mib:>8.1f} {'':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Benchmark mode-switch latency: full re-upload (before) vs resident arbs + state diff (after)
+
+Runs against the sim_33600a simulator by default, or a real 33600A with --resource.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from arb_residency import ArbResidency
+from keysight_33600a import MODES
+from mode_switch import ModeSwitcher, mode_settings
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+TRANSITIONS = [(1, 3), (3, 1), (2, 4), (4, 2), (1, 2), (2, 3), (3, 4), (4, 1)]
+
+
+def synthetic_align(file1, file2, invert_ch2=True, points=2000):
+    """Stand-in for align_waveforms() that does not need the waveform files"""
+    t = np.arange(points) / points
+    phase = 0.0 if '25k' in file1 else 1.0
+    sig1 = np.sin(2 * np.pi * t + phase).astype('f4')
+    sig2 = np.sin(2 * np.pi * t + phase + np.pi).astype('f4')
+    if invert_ch2:
+        sig2 = -sig2
+    return sig1, sig2, str(points * 25e3), points, t
+
+
+def resync(inst):
+    """Track On plus phase sync, as done by the selectors"""
+    inst.write('SOUR1:TRACK OFF')
+    inst.write('SOUR2:TRACK OFF')
+    inst.write('SOUR2:TRACK ON')
+    inst.write('*WAI')
+    inst.write('SOUR2:PHAS:SYNC')
+    inst.write('SOUR2:PHAS 0')
+    inst.write('*WAI')
+
+
+def switch_before(inst, mode_num):
+    """The original run_mode(): clear, re-align, re-upload, store and fully reconfigure"""
+    _, file1, file2, ch1_polarity, ch2_polarity = MODES[mode_num]
+    inst.write('OUTP1 OFF')
+    inst.write('OUTP2 OFF')
+    inst.write('SOUR2:TRACK OFF')
+    inst.write('*WAI')
+    sig1, sig2, sRate, points, _ = synthetic_align(file1, file2)
+    arb1, arb2 = 'MODAL_84DEG', 'MODAL_264DEG'
+    for channel, name, sig in ((1, arb1, sig1), (2, arb2, sig2)):
+        inst.write(f'SOUR{channel}:DATA:VOL:CLE')
+        inst.write_binary_values(f'SOUR{channel}:DATA:ARB {name},', sig, datatype='f', is_big_endian=False)
+        inst.write('*WAI')
+        inst.write(f'MMEM:STOR:DATA "INT:\\remoteAdded\\{name}.arb"')
+    waveform, output = mode_settings(arb1, arb2, sRate, points, ch1_polarity, ch2_polarity, 1.2, 1.2)
+    # One write per setting, as the original scripts did
+    for header, value in waveform.items():
+        inst.write(f'{header} {value}')
+    resync(inst)
+    for header, value in output.items():
+        inst.write(f'{header} {value}')
+
+
+def switch_after(inst, mode_num, residency, switcher):
+    """Resident arbs plus a diff against the last applied state"""
+    _, file1, file2, ch1_polarity, ch2_polarity = MODES[mode_num]
+    arb1, arb2, sRate, points = residency.pair(file1, file2)
+    waveform, output = mode_settings(arb1, arb2, sRate, points, ch1_polarity, ch2_polarity, 1.2, 1.2)
+    return switcher.apply(inst, waveform, output, resync)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resource', help='VISA resource of a real 33600A (default: simulator)')
+    parser.add_argument('--repeat', type=int, default=5, help='switches per transition')
+    parser.add_argument('--message-latency', type=float, default=0.002, help='simulator seconds per USB message')
+    parser.add_argument('--command-latency', type=float, default=0.0002, help='simulator seconds per command')
+    parser.add_argument('--byte-latency', type=float, default=1e-6, help='simulator seconds per byte')
+    args = parser.parse_args()
+
+    if args.resource:
+        import pyvisa as visa
+        inst = visa.ResourceManager().open_resource(args.resource)
+        inst.write('FORM:BORD SWAP')
+    else:
+        rm = SimulatedResourceManager(message_latency=args.message_latency, command_latency=args.command_latency,
+                                      byte_latency=args.byte_latency)
+        inst = rm.open_resource(SIM_RESOURCE)
+        inst.write('FORM:BORD SWAP')
+
+    # The original path clears volatile memory, so measure it before preloading
+    before = {}
+    for start, target in TRANSITIONS:
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            switch_before(inst, target)
+            times.append(time.perf_counter() - t0)
+        before[(start, target)] = times
+
+    residency = ArbResidency()
+    residency.clear(inst)
+    pairs = list(dict.fromkeys((m[1], m[2]) for m in MODES.values()))
+    residency.preload(inst, pairs, synthetic_align)
+    switcher = ModeSwitcher()
+
+    print(f"{'transition':>10} {'before ms':>10} {'after ms':>10} {'after cmds':>10}")
+    for start, target in TRANSITIONS:
+        after = []
+        sent = []
+        for _ in range(args.repeat):
+            switch_after(inst, start, residency, switcher)
+            t0 = time.perf_counter()
+            sent = switch_after(inst, target, residency, switcher)
+            after.append(time.perf_counter() - t0)
+        print(f"{start:>4} -> {target:<3} {np.median(before[(start, target)]) * 1e3:>10.2f} "
+              f"{np.median(after) * 1e3:>10.2f} {len(sent):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""Mode-switch latency suite: per-phase p50/p95/p99 for every mode transition
+
+Each transition is run --repeat times through Keysight33600A.select_mode() against
+the sim_33600a simulator (default) or a real 33600A (--resource). Phases are
+parse, align, upload, mmem_store, mmem_load, configure, sync and complete. --level picks how
+much has to be redone per switch:
+
+    warm   arbs already resident in volatile memory
+    flash  volatile memory and the arb cache are cleared, arbs are on INT:\\remoteAdded
+    cold   as flash, and the arbs are uploaded and stored again
+
+Results are printed and written as JSON (--json); --compare exits non-zero when
+a transition's p50 or p95 regressed against an earlier run.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from arb_cache import ArbCache
+from keysight_33600a import Keysight33600A
+from phase_timer import PhaseTimer
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+PHASES = ('parse', 'align', 'upload', 'mmem_store', 'mmem_load', 'configure', 'sync', 'complete')
+TRANSITIONS = [(1, 2), (1, 3), (1, 4), (2, 1), (2, 3), (2, 4), (3, 1), (3, 2), (3, 4), (4, 1), (4, 2), (4, 3)]
+PERCENTILES = (50, 95, 99)
+
+
+def reset_level(awg, level, cache_dir):
+    """Undo whatever the switch must redo at this level"""
+    if level == 'warm':
+        return
+    awg.residency.clear(awg.inst)
+    awg.arb_cache.memo.evict()
+    for path in glob.glob(os.path.join(cache_dir, '*')):
+        os.remove(path)
+    if level == 'cold':
+        awg.residency.store.stored.clear()
+
+
+def summarize(samples):
+    """Return {p50, p95, p99, mean, max} in milliseconds"""
+    ms = np.asarray(samples) * 1e3
+    summary = {f'p{p}': float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary['mean'] = float(ms.mean())
+    summary['max'] = float(ms.max())
+    return summary
+
+
+def run(awg, transitions, repeat, level, cache_dir):
+    """Return {'a->b': {phase: summary}} over repeat switches per transition"""
+    timer = PhaseTimer()
+    results = {}
+    for start, target in transitions:
+        samples = {name: [] for name in PHASES + ('total',)}
+        for _ in range(repeat):
+            awg.select_mode(start)
+            reset_level(awg, level, cache_dir)
+            timer.lap()
+            t0 = time.perf_counter()
+            with timer:
+                awg.select_mode(target)
+            total = time.perf_counter() - t0
+            phases = timer.lap()
+            for name in PHASES:
+                samples[name].append(phases.get(name, 0.0))
+            samples['total'].append(total)
+        results[f'{start}->{target}'] = {name: summarize(values) for name, values in samples.items()}
+    return results
+
+
+def print_table(results):
+    print(f"{'transition':>10} {'phase':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for transition, phases in results.items():
+        for name, summary in phases.items():
+            if summary['max'] == 0:
+                continue
+            print(f"{transition:>10} {name:>10} {summary['p50']:>9.3f} {summary['p95']:>9.3f} {summary['p99']:>9.3f}")
+
+
+def compare(results, baseline, threshold):
+    """Print total p50/p95 ratios against a baseline run; returns the regressed transitions"""
+    regressed = []
+    print(f"\n{'transition':>10} {'p50 ratio':>10} {'p95 ratio':>10}")
+    for transition, phases in results.items():
+        if transition not in baseline:
+            continue
+        old = baseline[transition]['total']
+        new = phases['total']
+        ratios = [new[p] / old[p] if old[p] > 0 else 1.0 for p in ('p50', 'p95')]
+        flag = ' REGRESSION' if max(ratios) > threshold else ''
+        print(f"{transition:>10} {ratios[0]:>10.2f} {ratios[1]:>10.2f}{flag}")
+        if flag:
+            regressed.append(transition)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resource', help='VISA resource of a real 33600A (default: simulator)')
+    parser.add_argument('--repeat', type=int, default=20, help='switches per transition')
+    parser.add_argument('--level', choices=('warm', 'flash', 'cold'), default='warm')
+    parser.add_argument('--transitions', nargs='+', help='e.g. 1-2 1-3 (default: all 12)')
+    parser.add_argument('--message-latency', type=float, default=0.002, help='simulator seconds per USB message')
+    parser.add_argument('--command-latency', type=float, default=0.0002, help='simulator seconds per command')
+    parser.add_argument('--byte-latency', type=float, default=1e-6, help='simulator seconds per byte')
+    parser.add_argument('--flash-byte-latency', type=float, default=2e-7, help='simulator seconds per flash byte')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--trace', help='write a Chrome trace JSON of every SCPI command to this file')
+    parser.add_argument('--trace-errors', action='store_true',
+                        help='query SYST:ERR? after every traced command (slow; errors show in the trace)')
+    parser.add_argument('--threshold', type=float, default=1.2, help='regression ratio for --compare')
+    parser.add_argument('--dac', action='store_true', help='upload int16 DAC codes instead of float32')
+    parser.add_argument('--dither', action='store_true', help='dither the DAC codes')
+    args = parser.parse_args()
+
+    transitions = TRANSITIONS
+    if args.transitions:
+        transitions = [tuple(int(m) for m in t.split('-')) for t in args.transitions]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if args.resource:
+            awg = Keysight33600A(args.resource, arb_cache=ArbCache(cache_dir), dac=args.dac, dither=args.dither)
+        else:
+            rm = SimulatedResourceManager(message_latency=args.message_latency, command_latency=args.command_latency,
+                                          byte_latency=args.byte_latency,
+                                          flash_byte_latency=args.flash_byte_latency)
+            awg = Keysight33600A(SIM_RESOURCE, arb_cache=ArbCache(cache_dir), rm=rm, dac=args.dac,
+                                 dither=args.dither)
+        awg.connect()
+        awg.preload()
+        traced = awg.inst
+        traced.enabled = bool(args.trace or args.trace_errors)
+        traced.check_errors = args.trace_errors
+        try:
+            results = run(awg, transitions, args.repeat, args.level, cache_dir)
+            quantization = awg.quantization()
+        finally:
+            traced.enabled = False
+            awg.close()
+
+    print_table(results)
+    if quantization is not None:
+        print(f"\nDAC codes of {quantization['arbs']} arbs: peak error {quantization['peak_error']:.2e} "
+              f"(float32 path {quantization['float_peak_error']:.2e}), SNR {quantization['snr_db']:.1f} dB, "
+              f"{quantization['clipped']} clipped, {quantization['bytes']} bytes "
+              f"(float32 {quantization['float_bytes']})")
+    if args.trace:
+        traced.export(args.trace)
+        print(f"\n{'command':>24} {'count':>6} {'total ms':>9} {'max ms':>8} {'bytes':>9}")
+        for header, (count, total, worst, nbytes) in traced.summary()[:10]:
+            print(f"{header[:24]:>24} {count:>6} {total:>9.2f} {worst:>8.3f} {nbytes:>9}")
+    if args.trace_errors:
+        errors = [event for event in traced.events if 'error' in event]
+        print(f"\n{len(errors)} commands raised instrument errors")
+        for event in errors[:10]:
+            print(f"  {event['command'][:40]}: {event['error']}")
+    report = {
+        'config': {'resource': args.resource or 'simulator', 'repeat': args.repeat, 'level': args.level,
+                   'dac': args.dac, 'dither': args.dither,
+                   'message_latency': args.message_latency, 'command_latency': args.command_latency,
+                   'byte_latency': args.byte_latency},
+        'transitions': results,
+        'quantization': quantization,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['transitions']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Benchmark waveform preparation: pairwise align_waveforms loop (before) vs one prepare_loaded batch (after)
+
+Throughput is in output points per second. Parsing is excluded (see
+bench_loader.py); the library is the four modal/ONEPERIOD_* files plus
+synthetic mode pairs.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from waveform_batch import prepare_loaded
+from waveform_loader import load_waveform_with_time
+
+
+def legacy_align_loaded(times1, values1, times2, values2, invert_ch2=True, normalize=True):
+    """The pairwise alignment previously in waveform_loader.align_waveforms()"""
+    t_start = max(times1[0], times2[0])
+    t_end = min(times1[-1], times2[-1])
+    dt_unified = min(np.mean(np.diff(times1)), np.mean(np.diff(times2)))
+    unified_times = np.arange(t_start, t_end + dt_unified, dt_unified)
+    aligned_values1 = np.interp(unified_times, times1, values1)
+    aligned_values2 = np.interp(unified_times, times2, values2)
+    if normalize:
+        max_abs1 = max(np.abs(aligned_values1))
+        max_abs2 = max(np.abs(aligned_values2))
+        if max_abs1 != 0:
+            aligned_values1 = aligned_values1 / max_abs1
+        if max_abs2 != 0:
+            aligned_values2 = aligned_values2 / max_abs2
+    if invert_ch2:
+        aligned_values2 = -aligned_values2
+    return (aligned_values1.astype('f4'), aligned_values2.astype('f4'),
+            str(1 / dt_unified), len(unified_times), unified_times)
+
+
+def synthetic_pair(rng, points):
+    """Two channels of one period of a two-tone modal waveform, 180 degrees apart"""
+    freq = rng.choice([25e3, 47e3])
+    t = np.arange(points) / (points * freq)
+    phase = rng.uniform(0, 2 * np.pi)
+    v = 0.4 * np.sin(2 * np.pi * freq * t + phase) + 0.2 * np.sin(4 * np.pi * freq * t + 2 * phase)
+    return [(t, v), (t, -v)]
+
+
+def library(pairs, points, modal_dir='modal', seed=0):
+    """Return the ONEPERIOD_A..D pairs plus synthetic ones, as lists of (times, values)"""
+    a, b, c, d = (load_waveform_with_time(glob.glob(os.path.join(modal_dir, f'ONEPERIOD_{x}_*.csv'))[0])
+                  for x in 'ABCD')
+    rng = np.random.default_rng(seed)
+    return [[a, b], [c, d]] + [synthetic_pair(rng, points) for _ in range(pairs)]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', type=int, nargs='+', default=[0, 16, 256], help='synthetic mode pairs added')
+    parser.add_argument('--points', type=int, default=2000, help='points per synthetic waveform')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'pairs':>6} {'before Mpts/s':>14} {'after Mpts/s':>13} {'speedup':>8}")
+    for pairs in args.pairs:
+        groups = library(pairs, args.points)
+        before_s, results = best_of(args.repeat, lambda: [
+            legacy_align_loaded(t1, v1, t2, v2) for (t1, v1), (t2, v2) in groups])
+        before_points = sum(2 * result[3] for result in results)
+        invert = [False, True] * len(groups)
+        after_s, batch = best_of(args.repeat, lambda: prepare_loaded(groups, invert))
+        after_points = batch.signals.size
+        print(f"{len(groups):>6} {before_points / before_s / 1e6:>14.1f} {after_points / after_s / 1e6:>13.1f} "
+              f"{(after_points / after_s) / (before_points / before_s):>7.1f}x")
+    # The legacy time step is off by the rounding of the last time stamp in ONEPERIOD_A/B
+    a_b = library(0, args.points)[0]
+    legacy = legacy_align_loaded(a_b[0][0], a_b[0][1], a_b[1][0], a_b[1][1])
+    batch = prepare_loaded([a_b], [False, True])
+    print(f"ONEPERIOD_A/B: before {float(legacy[2]) / legacy[3]:.1f} Hz, after {batch.sRates[0] / batch.points:.1f} Hz")
+
+
+if __name__ == "__main__":
+    main()
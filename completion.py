@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import time
+
+ESR_OPC = 0x01
+STB_ESB = 0x20
+
+
+class CompletionTimeout(Exception):
+    """The instrument did not report operation complete within the timeout"""
+
+
+def wait_complete(inst, timeout=10.0, method='opc', poll_interval=0.0005):
+    """Block until every pending operation has finished; returns the seconds waited
+
+    method 'opc' queries *OPC? with the session timeout raised to the given
+    timeout. method 'poll' clears the event status register with *ESR?, sends
+    *OPC and polls the status byte for the event status bit (read_stb(), the
+    USBTMC status request, when the session has it, *ESR? otherwise), so the
+    host can give up at the timeout without waiting on a blocked read.
+    """
+    t0 = time.perf_counter()
+    if method == 'opc':
+        previous = inst.timeout
+        inst.timeout = int(timeout * 1000)
+        try:
+            inst.query('*OPC?')
+        except Exception as e:
+            if 'TMO' in str(e) or isinstance(e, TimeoutError):
+                raise CompletionTimeout(f'*OPC? did not answer within {timeout} s') from e
+            raise
+        finally:
+            inst.timeout = previous
+    elif method == 'poll':
+        # An OPC bit left set by an earlier *OPC (e.g. a wait that timed out) would end
+        # this wait at once, so read *ESR? before arming; *CLS would also empty the
+        # error queue. Only the OPC bit may raise ESB; *ESR? at the end clears it again
+        inst.query('*ESR?;*ESE 1;*OPC')
+        read_stb = getattr(inst, 'read_stb', None)
+        while True:
+            if read_stb is not None:
+                done = read_stb() & STB_ESB
+            else:
+                done = int(inst.query('*ESR?')) & ESR_OPC
+            if done:
+                break
+            if time.perf_counter() - t0 > timeout:
+                raise CompletionTimeout(f'Operation not complete after {timeout} s')
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 0.05)
+        if read_stb is not None:
+            inst.query('*ESR?')
+    else:
+        raise ValueError(f'Unknown completion method {method!r}')
+    return time.perf_counter() - t0
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Find the 33600A to talk to: last good resource first, then a bounded-time scan"""
+
+import json
+import os
+import re
+import threading
+import time
+
+KEYSIGHT_VID = 0x0957
+PID_33600A = 0x5707
+
+USB_RESOURCE = re.compile(r'^USB\d*::(0x[0-9A-Fa-f]+|\d+)::(0x[0-9A-Fa-f]+|\d+)::([^:]+)::', re.IGNORECASE)
+# VISA resource query for 33600A units on USB; lists without opening anything
+USB_QUERY = f'USB?*::{KEYSIGHT_VID:#06x}::{PID_33600A:#06x}::?*::INSTR'
+# VISA interfaces scanned for other resources; serial ports (ASRL) are never probed
+INTERFACES = ('USB', 'TCPIP', 'GPIB')
+
+DEFAULT_RESOURCE_CACHE = os.path.join(os.path.expanduser('~'), '.keysight33600a', 'last_resource.json')
+# Seconds a cold start may spend finding the instrument, and one *IDN? probe at most
+CONNECT_BUDGET = 2.0
+PROBE_TIMEOUT = 0.5
+
+
+class DiscoveryError(Exception):
+    """No 33600A answered within the connect budget"""
+
+
+def usb_ids(resource):
+    """Return (vid, pid, serial) of a USB VISA resource string, or None"""
+    match = USB_RESOURCE.match(resource)
+    if not match:
+        return None
+    return int(match.group(1), 0), int(match.group(2), 0), match.group(3)
+
+
+def is_33600a(resource):
+    ids = usb_ids(resource)
+    return ids is not None and ids[:2] == (KEYSIGHT_VID, PID_33600A)
+
+
+def parse_idn(idn):
+    """Return (maker, model, serial, firmware) of an *IDN? reply"""
+    fields = [field.strip() for field in idn.split(',')]
+    return tuple(fields + [''] * (4 - len(fields)))[:4]
+
+
+def idn_matches(idn, serial=None):
+    """True when *IDN? names a 33600 series model, and the serial if one is given"""
+    _, model, idn_serial, _ = parse_idn(idn)
+    return model.startswith('336') and (serial is None or idn_serial == serial)
+
+
+def discover(rm):
+    """Return the VISA resources of every connected 33600A, sorted by serial"""
+    return sorted((r for r in rm.list_resources(USB_QUERY) if is_33600a(r)), key=lambda r: usb_ids(r)[2])
+
+
+def list_resources(rm, query, timeout=None):
+    """Return rm.list_resources(query), or () if it fails or takes longer than timeout seconds
+
+    Listing can block for seconds (e.g. LAN discovery), so with a timeout it
+    runs on a daemon thread that is left behind when time is up.
+    """
+    found = []
+
+    def run():
+        try:
+            found.extend(rm.list_resources(query))
+        except Exception:
+            pass
+
+    if timeout is None:
+        run()
+        return tuple(found)
+    if timeout <= 0:
+        return ()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return () if thread.is_alive() else tuple(found)
+
+
+def load_cached(path=DEFAULT_RESOURCE_CACHE):
+    """Return the last good {'resource', 'idn'}, or None"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remember(resource, idn, path=DEFAULT_RESOURCE_CACHE):
+    """Record the resource that answered, for the next start"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'resource': resource, 'idn': idn}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def probe(rm, resource, timeout):
+    """Open resource and ask *IDN? within timeout seconds; returns (session, idn) or None"""
+    timeout_ms = max(int(timeout * 1000), 1)
+    try:
+        session = rm.open_resource(resource, open_timeout=timeout_ms)
+    except Exception:
+        return None
+    default_timeout = session.timeout
+    try:
+        session.timeout = timeout_ms
+        idn = session.query('*IDN?').strip()
+    except Exception:
+        session.close()
+        return None
+    session.timeout = default_timeout
+    return session, idn
+
+
+def candidates(rm, cached=None, serial=None, interfaces=INTERFACES, deadline=None):
+    """Yield resources worth probing, most likely first
+
+    The cached resource comes first, then 33600A units on USB, then the other
+    resources VISA lists on interfaces (USB, LAN, GPIB by default). USB
+    resources carry the serial, so with a serial the ones that cannot match
+    are never opened. Listing stops at deadline (a time.perf_counter() value).
+    """
+    seen = set()
+
+    def remaining():
+        return None if deadline is None else deadline - time.perf_counter()
+
+    def wanted(resource):
+        ids = usb_ids(resource)
+        if resource in seen or (serial is not None and ids is not None and ids[2] != serial):
+            return False
+        seen.add(resource)
+        return True
+
+    if cached and wanted(cached['resource']):
+        yield cached['resource']
+    usb = list_resources(rm, USB_QUERY, remaining())
+    for resource in sorted(usb, key=lambda r: usb_ids(r)[2] if usb_ids(r) else r):
+        if wanted(resource):
+            yield resource
+    for interface in interfaces:
+        for resource in list_resources(rm, f'{interface}?*', remaining()):
+            if not is_33600a(resource) and wanted(resource):
+                yield resource
+
+
+def resolve(rm, serial=None, budget=CONNECT_BUDGET, cache_path=DEFAULT_RESOURCE_CACHE, interfaces=INTERFACES):
+    """Open the first 33600A that answers; returns (resource, session, idn)
+
+    Resources are probed in candidates() order with *IDN? until one reports a
+    33600 series model (and serial, if given) or budget seconds have passed,
+    listing included, in which case DiscoveryError is raised. The winner is remembered in
+    cache_path so the next start usually needs a single probe.
+    """
+    deadline = time.perf_counter() + budget
+    for resource in candidates(rm, load_cached(cache_path), serial, interfaces, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        found = probe(rm, resource, min(remaining, PROBE_TIMEOUT))
+        if found is None:
+            continue
+        session, idn = found
+        if idn_matches(idn, serial):
+            remember(resource, idn, cache_path)
+            return resource, session, idn
+        session.close()
+    wanted = f'33600A {serial}' if serial else '33600A'
+    raise DiscoveryError(f'No {wanted} answered within {budget:.1f} s')
@@ -1,286 +1,128 @@
 #!/usr/bin/env python
 
-import pyvisa as visa
-import numpy as np
-import csv
+import argparse
 
-def load_waveform_with_time(filename):
-    """讀取波形文件並返回時間和數值數據"""
-    times = []
-    values = []
-    
-    with open(filename, 'r') as f:
-        reader = csv.reader(f, delimiter=' ')
-        for t, p in reader:
-            times.append(float(t))
-            values.append(float(p))
-    
-    return np.array(times), np.array(values)
+from keysight_33600a import Keysight33600A
 
-def align_waveforms(file1, file2, invert_ch2=True):
-    """讀取兩個波形檔案並對齊時間軸"""
-    print(f"   讀取檔案 1: {file1}")
-    times1, values1 = load_waveform_with_time(file1)
-    
-    print(f"   讀取檔案 2: {file2}")
-    times2, values2 = load_waveform_with_time(file2)
-    
-    print(f"   檔案 1: {len(times1)} 點, 時間範圍: {times1[0]:.6f} - {times1[-1]:.6f} 秒")
-    print(f"   檔案 2: {len(times2)} 點, 時間範圍: {times2[0]:.6f} - {times2[-1]:.6f} 秒")
-    
-    # 找到共同的時間範圍
-    t_start = max(times1[0], times2[0])
-    t_end = min(times1[-1], times2[-1])
-    
-    print(f"   共同時間範圍: {t_start:.6f} - {t_end:.6f} 秒")
-    
-    # 計算統一的採樣率（使用較高的採樣率）
-    dt1 = np.mean(np.diff(times1))
-    dt2 = np.mean(np.diff(times2))
-    dt_unified = min(dt1, dt2)  # 使用較小的時間間隔（較高採樣率）
-    
-    print(f"   檔案 1 採樣間隔: {dt1:.8f} 秒")
-    print(f"   檔案 2 採樣間隔: {dt2:.8f} 秒")
-    print(f"   統一採樣間隔: {dt_unified:.8f} 秒")
-    
-    # 創建統一的時間軸
-    unified_times = np.arange(t_start, t_end + dt_unified, dt_unified)
-    
-    # 插值到統一時間軸
-    aligned_values1 = np.interp(unified_times, times1, values1)
-    aligned_values2 = np.interp(unified_times, times2, values2)
-    
-    # 正規化信號
-    #aligned_values1 = aligned_values1 / max(np.abs(aligned_values1))
-    #aligned_values2 = aligned_values2 / max(np.abs(aligned_values2))
-    
-    # *** 對 Channel 2 進行反相 ***
-    if invert_ch2:
-        aligned_values2 = -aligned_values2
-        print("   - Channel 2 波形數據已反相")
-    
-    # 計算採樣率
-    sRate = str(1 / dt_unified)
-    
-    print(f"   對齊後: {len(unified_times)} 點, 採樣率: {sRate} Hz")
-    
-    return (aligned_values1.astype('f4'), aligned_values2.astype('f4'), 
-            sRate, len(unified_times), unified_times)
+# 模式說明：(模式名稱, 選單說明)
+MODE_LABELS = {
+    1: ("Mode 1 (25k-50k Hz)", "Mode 1 (25k-50k Hz, CH1:Normal, CH2:Inverted)"),
+    2: ("Mode 2 (47k-94k Hz)", "Mode 2 (47k-94k Hz, CH1:Normal, CH2:Inverted)"),
+    3: ("Mode 3 (25k-50k Hz, CH1 Inverted)", "Mode 3 (25k-50k Hz, CH1:Inverted, CH2:Normal)"),
+    4: ("Mode 4 (47k-94k Hz, CH1 Inverted)", "Mode 4 (47k-94k Hz, CH1:Inverted, CH2:Normal)"),
+}
 
-def setup_sync_internal(inst):
-    """設定 Sync Internal (Track On) 功能"""
-    print("正在設定 Sync Internal (Track On)...")
-    
-    # 先確保兩個通道都關閉追蹤
-    inst.write('SOUR1:TRACK OFF')
-    inst.write('SOUR2:TRACK OFF')
-    
-    # 讓 Channel 2 追蹤 Channel 1 (這就是 Sync Internal 的核心)
-    inst.write('SOUR2:TRACK ON')
-    
-    # 可選：明確指定追蹤類型
-    # inst.write('SOUR2:TRACK:FREQ ON')   # 追蹤頻率
-    # inst.write('SOUR2:TRACK:PHASE ON')  # 追蹤相位
-    
-    inst.write('*WAI')
-    print("   - Channel 2 現在會自動追蹤 Channel 1 的頻率和相位變化")
-    print("   - 這等同於前端面板的 'Sync Internal' 功能")
-
-def run_mode(inst, mode_num):
-    """執行指定模式的波形輸出"""
-    
-    # 統一電壓設定 - 只需修改這兩行就能控制所有模式的電壓
-    ch1_voltage = 1.2  # Channel 1 電壓 (所有模式共用)
-    ch2_voltage = 1.2  # Channel 2 電壓 (所有模式共用)
-    
-    # 根據模式選擇波形檔案和極性設定
-    if mode_num == 1:
-        file1 = 'modal/25k_50k_84p88deg_2000pts.dat'
-        file2 = 'modal/25k_50k_264p88deg_2000pts.dat'
-        mode_name = "Mode 1 (25k-50k Hz)"
-        ch1_polarity = 'NORM'
-        ch2_polarity = 'INV'
-    elif mode_num == 2:
-        file1 = 'modal/47k_94k_57p32deg_2000pts.dat'
-        file2 = 'modal/47k_94k_237p32deg_2000pts.dat'
-        mode_name = "Mode 2 (47k-94k Hz)"
-        ch1_polarity = 'NORM'
-        ch2_polarity = 'INV'
-    elif mode_num == 3:
-        file1 = 'modal/25k_50k_84p88deg_2000pts.dat'
-        file2 = 'modal/25k_50k_264p88deg_2000pts.dat'
-        mode_name = "Mode 3 (25k-50k Hz, CH1 Inverted)"
-        ch1_polarity = 'INV'
-        ch2_polarity = 'NORM'
-    else:  # mode_num == 4
-        file1 = 'modal/47k_94k_57p32deg_2000pts.dat'
-        file2 = 'modal/47k_94k_237p32deg_2000pts.dat'
-        mode_name = "Mode 4 (47k-94k Hz, CH1 Inverted)"
-        ch1_polarity = 'INV'
-        ch2_polarity = 'NORM'
-    
+def run_mode(awg, mode_num):
+    """執行指定模式的波形輸出（只送出與目前狀態不同的設定）"""
+    mode_name = MODE_LABELS[mode_num][0]
     print(f"\n=== 切換到 {mode_name} ===")
-    
-    # 先關閉輸出
-    inst.write('OUTP1 OFF')
-    inst.write('OUTP2 OFF')
-    
-    # 重要：先關閉追蹤功能，以便獨立配置每個通道
-    inst.write('SOUR2:TRACK OFF')
-    inst.write('*WAI')
-    
-    # 讀取並對齊波形 (Channel 2 反相)
-    print("正在讀取並對齊模態波形文件...")
-    sig1, sig2, sRate, points, unified_times = align_waveforms(file1, file2, invert_ch2=True)
-    
-    # 上傳 Channel 1 波形
-    print("正在上傳 Channel 1 波形...")
-    inst.write("DISP:TEXT 'Uploading CH1 Modal'")
-    inst.write('SOUR1:DATA:VOL:CLE')
-    inst.write_binary_values('SOUR1:DATA:ARB MODAL_84DEG,', sig1, datatype='f', is_big_endian=False)
-    inst.write('*WAI')
-    inst.write('MMEM:STOR:DATA "INT:\\remoteAdded\\MODAL_84DEG.arb"')
-    
-    # 上傳 Channel 2 波形
-    print("正在上傳 Channel 2 波形...")
-    inst.write("DISP:TEXT 'Uploading CH2 Modal'")
-    inst.write('SOUR2:DATA:VOL:CLE')
-    inst.write_binary_values('SOUR2:DATA:ARB MODAL_264DEG,', sig2, datatype='f', is_big_endian=False)
-    inst.write('*WAI')
-    inst.write('MMEM:STOR:DATA "INT:\\remoteAdded\\MODAL_264DEG.arb"')
-    
-    # 配置雙通道參數（但保持輸出關閉）
-    print("正在配置雙通道參數...")
-    
-    # 配置 Channel 1 參數
-    inst.write('SOUR1:FUNC ARB')
-    inst.write('SOUR1:FUNC:ARB MODAL_84DEG')
-    inst.write('SOUR1:FUNC:ARB:SRAT ' + sRate)
-    inst.write(f'SOUR1:VOLT {ch1_voltage}')
-    inst.write('SOUR1:VOLT:OFFS 0')
-    
-    # 配置 Channel 2 參數
-    inst.write('SOUR2:FUNC ARB')
-    inst.write('SOUR2:FUNC:ARB MODAL_264DEG')
-    inst.write('SOUR2:FUNC:ARB:SRAT ' + sRate)
-    inst.write(f'SOUR2:VOLT {ch2_voltage}')
-    inst.write('SOUR2:VOLT:OFFS 0')
-    
-    # 設置基本頻率和相位
-    freq = float(sRate) / points
-    inst.write(f'SOUR1:FREQ {freq}')
-    inst.write(f'SOUR2:FREQ {freq}')
-    inst.write('SOUR1:PHAS 0')
-    inst.write('SOUR2:PHAS 0')
-    inst.write('*WAI')
-    
-    # *** 新增：設定 Sync Internal (Track On) ***
-    setup_sync_internal(inst)
-    
-    # 讓 Channel 2 同步到 Channel 1 的相位
-    print("正在同步 Channel 2 相位到 Channel 1...")
-    inst.write('SOUR2:PHAS:SYNC')    # Channel 2 同步到 Channel 1
-    inst.write('SOUR2:PHAS 0')       # Channel 2 相位設為 0
-    inst.write('*WAI')
-    print("   - Channel 2 已同步到 Channel 1")
-    
-    # 在 Track 設定完成後，根據模式設定通道極性
-    print("正在設定通道極性...")
-    inst.write(f'OUTP1:POL {ch1_polarity}')  # Channel 1 極性
-    inst.write(f'OUTP2:POL {ch2_polarity}')  # Channel 2 極性
+
+    # 波形設定改變時才會關閉輸出、關閉追蹤並重新同步；
+    # 共用同一組波形的模式（1↔3、2↔4）只需切換極性
+    freq, sent = awg.select_mode(mode_num)
+    _, _, _, ch1_polarity, ch2_polarity = awg.modes[mode_num]
+    print(f"   - 送出 {len(sent)} 個設定: {', '.join(sent) if sent else '無變更'}")
     print(f"   - Channel 1 極性: {ch1_polarity}, Channel 2 極性: {ch2_polarity}")
-    
-    # 設定同步輸出（可選）
-    print("正在設定同步輸出...")
-    inst.write('OUTP:SYNC ON')           # 啟用同步輸出
-    inst.write('OUTP:SYNC:SOURCE CH1')   # 同步信號來自 Channel 1
-    inst.write('OUTP:SYNC:MODE MARK')    # 同步模式為標記
-    
-    # 最後同時啟用兩個通道輸出
-    print("正在啟用雙通道輸出...")
-    inst.write('OUTP1 ON')
-    inst.write('OUTP2 ON')
-    inst.write('*WAI')
-    
-    # 清除顯示信息
-    inst.write("DISP:TEXT ''")
-    
-    # 驗證 Track 狀態
-    try:
-        track_status = inst.query('SOUR2:TRACK?')
-        print(f"   - Channel 2 Track 狀態: {'ON' if track_status.strip() == '1' else 'OFF'}")
-    except:
-        print("   - 無法查詢 Track 狀態")
-    
+    # 由狀態快取回答，不需再查詢儀器
+    track = str(awg.setting('SOUR2:TRACK')).upper()
+    print(f"   - Channel 2 Track 狀態: {'ON' if track in ('ON', '1') else 'OFF'}")
+    print(f"   - 儀器完成時間: {awg.last_completion * 1e3:.1f} ms")
     print(f"✅ {mode_name} 已啟用！基頻: {freq:.2f} Hz")
-    print("✅ Sync Internal (Track On) 已啟用")
     return freq
 
-# 主程式
-if __name__ == "__main__":
-    print("=== 雙通道模態波形選擇器 (4 模式版本) ===")
-    
+def run_sequence(awg, pattern):
+    """在儀器上依序播放多個模式（例如 "forward 200, right 50"），段落之間不經過主機"""
+    print(f"\n=== 序列播放: {pattern} ===")
+    report = awg.play_sequence(pattern)
+    print(f"   - 共用取樣率: {report['srate'] / 1e6:g} MSa/s")
+    for seg in report['segments']:
+        name = awg.modes[seg['mode']][0]
+        start = f"{seg['start'] * 1e3:.3f} ms" if seg['start'] is not None else "等待觸發後"
+        print(f"   - {name}: {seg['points']} 點 x {seg['cycles']} 週期 ({seg['play']})，開始於 {start}")
+    if report['duration'] is not None:
+        print(f"✅ 序列已啟用！固定時序部分共 {report['duration'] * 1e3:.3f} ms")
+    else:
+        print("✅ 序列已啟用！輸入 t 送出觸發以前進到下一段")
+    return report
+
+def print_progress(sent, total, rate):
+    """顯示波形上傳進度"""
+    speed = f", {rate / 1e6:.2f} MB/s" if rate else ""
+    print(f"\r   - 上傳中: {sent * 100 // total}% ({sent / 1e6:.1f}/{total / 1e6:.1f} MB{speed})   ",
+          end="\n" if sent >= total else "", flush=True)
+
+def upload_options():
+    """命令列選項：--dac 在主機量化為 int16 DAC 碼後上傳（資料量為 float32 的一半），--dither 加入抖動"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dac', action='store_true', help='以 int16 DAC 碼上傳波形')
+    parser.add_argument('--dither', action='store_true', help='量化時加入抖動')
+    args = parser.parse_args()
+    return {'dac': args.dac, 'dither': args.dither}
+
+def print_quantization(awg):
+    """顯示 DAC 量化誤差（與 float32 上傳相比），未使用 --dac 時不顯示"""
+    report = awg.quantization()
+    if report is None:
+        return
+    print(f"   - DAC 量化 ({report['arbs']} 個波形{'，含抖動' if report['dither'] else ''}): "
+          f"峰值誤差 {report['peak_error']:.2e} (float32: {report['float_peak_error']:.2e})，"
+          f"SNR {report['snr_db']:.1f} dB，截斷 {report['clipped']} 點，"
+          f"上傳 {report['bytes'] / 1e6:.2f} MB (float32: {report['float_bytes'] / 1e6:.2f} MB)")
+
+def main(awg, title):
+    """連線、預先上傳波形並持續選擇模式"""
+    print(f"=== {title} ===")
+
     # 連接設備
     print("正在連接設備...")
-    rm = visa.ResourceManager()
-    inst = rm.open_resource('USB0::0x0957::0x5707::MY59001615::0::INSTR')
-    
-    try:
-        inst.control_ren(6)
-    except:
-        pass
-    
-    print(f"已連接到: {inst.query('*IDN?').strip()}")
-    
-    # 確保輸出關閉
-    inst.write('OUTP1 OFF')
-    inst.write('OUTP2 OFF')
-    
-    # 設定目錄
-    inst.write("MMEMORY:MDIR \"INT:\\remoteAdded\"")
-    inst.write('FORM:BORD SWAP')
-    
+    print(f"已連接到: {awg.connect()}")
+    print(f"連線耗時: {awg.connect_seconds * 1e3:.0f} ms (目標 {awg.connect_budget:.1f} s 內，含自動搜尋設備)")
+
+    # 一次上傳所有波形，之後切換模式只需選擇常駐波形
+    print("正在預先上傳所有模式波形...")
+    awg.progress = print_progress
+    for ch, arbs in awg.preload().items():
+        print(f"   - Channel {ch} 常駐波形: {', '.join(arbs.values())}")
+    print_quantization(awg)
+
     # 持續選擇模式
     while True:
         try:
             print("\n" + "="*50)
             print("選擇模式：")
-            print("1 - Mode 1 (25k-50k Hz, CH1:Normal, CH2:Inverted)")
-            print("2 - Mode 2 (47k-94k Hz, CH1:Normal, CH2:Inverted)")
-            print("3 - Mode 3 (25k-50k Hz, CH1:Inverted, CH2:Normal)")
-            print("4 - Mode 4 (47k-94k Hz, CH1:Inverted, CH2:Normal)")
+            for mode_num, (_, description) in MODE_LABELS.items():
+                print(f"{mode_num} - {description}")
             print("5 - 退出程式")
-            
-            user_input = input("輸入選擇 (1, 2, 3, 4, 或 5): ").strip()
-            
-            if user_input == '1' or user_input.lower() == 'mode1':
-                freq = run_mode(inst, 1)
-            elif user_input == '2' or user_input.lower() == 'mode2':
-                freq = run_mode(inst, 2)
-            elif user_input == '3' or user_input.lower() == 'mode3':
-                freq = run_mode(inst, 3)
-            elif user_input == '4' or user_input.lower() == 'mode4':
-                freq = run_mode(inst, 4)
+            print("s - 序列播放 (例如: forward 200, right 50, backward until trigger)")
+            print("t - 送出觸發 (序列中等待觸發的段落)")
+
+            user_input = input("輸入選擇 (1, 2, 3, 4, 5, s 或 t): ").strip()
+
+            if user_input in ('1', '2', '3', '4') or user_input.lower() in ('mode1', 'mode2', 'mode3', 'mode4'):
+                run_mode(awg, int(user_input[-1]))
+            elif user_input.lower() == 's':
+                run_sequence(awg, input("輸入序列: ").strip())
+            elif user_input.lower() == 't':
+                awg.trigger()
+                print("已送出觸發")
             elif user_input == '5':
                 print("正在關閉輸出...")
-                inst.write('OUTP1 OFF')
-                inst.write('OUTP2 OFF')
-                # 關閉 Track 功能
-                inst.write('SOUR2:TRACK OFF')
-                inst.close()
+                awg.close()
                 print("程式已退出")
                 break
             else:
-                print("❌ 無效輸入！請輸入 1, 2, 3, 4, 或 5")
-                
+                print("❌ 無效輸入！請輸入 1, 2, 3, 4, 5, s 或 t")
+
         except KeyboardInterrupt:
             print("\n正在關閉輸出...")
-            inst.write('OUTP1 OFF')
-            inst.write('OUTP2 OFF')
-            inst.write('SOUR2:TRACK OFF')
-            inst.close()
+            awg.close()
             print("程式已取消")
             break
         except Exception as e:
             print(f"❌ 發生錯誤: {e}")
             print("請重新選擇")
+
+# 主程式
+if __name__ == "__main__":
+    # 統一電壓設定 - 只需修改這兩個參數就能控制所有模式的電壓
+    main(Keysight33600A(ch1_voltage=1.2, ch2_voltage=1.2, normalize=False, **upload_options()), "雙通道模態波形選擇器 (4 模式版本)")
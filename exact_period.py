@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Exact-period arbs: pick a point count and SRAT for one whole period, FFT-resample onto it
+
+    python exact_period.py modal/ONEPERIOD_A_*.csv modal/ONEPERIOD_B_*.csv --points 500
+"""
+
+import argparse
+
+import numpy as np
+
+from phase_timer import phase
+from waveform_batch import load_batch, prepare_loaded
+
+# Highest SRAT per model; 33611A/33612A are the 80 MHz units
+MAX_SRATE = {'33611A': 660e6, '33612A': 660e6, '33621A': 1e9, '33622A': 1e9}
+DEFAULT_MAX_SRATE = 660e6
+MIN_SRATE = 1e-6
+# Shortest arb of the 33600A (the 33500B takes 8)
+MIN_POINTS = 32
+MAX_POINTS = 4_000_000
+# SRAT is programmed with this resolution (Sa/s)
+SRATE_RESOLUTION = 1e-6
+
+
+def max_srate(idn=None):
+    """Return the highest sample rate of the model named in *IDN? (the slower models' limit if unknown)"""
+    model = idn.split(',')[1].strip() if idn and idn.count(',') >= 1 else None
+    return MAX_SRATE.get(model, DEFAULT_MAX_SRATE)
+
+
+def choose_grid(freq, points, srate_limit=DEFAULT_MAX_SRATE, min_points=MIN_POINTS, max_points=MAX_POINTS,
+                search=0.01):
+    """Return (points, srate) so that points / srate is one period of freq, within the instrument limits
+
+    points is the wanted length. It is lowered until srate fits, and then
+    nudged (by up to search of itself) to the count whose srate lands on the
+    SRAT resolution; with an integer frequency every count does.
+    """
+    limit = int(min(points, max_points, np.floor(srate_limit / freq)))
+    if limit < min_points or freq * min_points < MIN_SRATE:
+        raise ValueError(f"No arb length for {freq} Hz within {min_points}..{max_points} points "
+                         f"and {srate_limit:g} Sa/s")
+    candidates = np.arange(max(min_points, int(limit * (1 - search))), limit + 1)
+    srates = freq * candidates
+    residual = np.abs(np.round(srates / SRATE_RESOLUTION) * SRATE_RESOLUTION - srates)
+    # Smallest residual first, then the longest (closest to the wanted) length
+    best = np.lexsort((-candidates, residual))[0]
+    return int(candidates[best]), float(np.round(srates[best] / SRATE_RESOLUTION) * SRATE_RESOLUTION)
+
+
+def resample_periodic(signals, points):
+    """Band-limited resampling of whole periods (rows of a 2-D array) to points samples each
+
+    The rows are treated as periodic, so there is no edge effect at the wrap:
+    the spectrum is truncated or zero-padded and transformed back, all rows
+    in one rfft/irfft pair.
+    """
+    signals = np.atleast_2d(np.asarray(signals, dtype=np.float64))
+    n = signals.shape[1]
+    if points == n:
+        return signals.copy()
+    spectrum = np.fft.rfft(signals, axis=1)
+    resampled = np.zeros((signals.shape[0], points // 2 + 1), dtype=spectrum.dtype)
+    m = min(n, points)
+    resampled[:, :m // 2 + 1] = spectrum[:, :m // 2 + 1]
+    if m % 2 == 0:
+        # The +-m/2 components meet in one Nyquist bin when shrinking, and split when growing
+        resampled[:, m // 2] *= 2.0 if points < n else 0.5
+    return np.fft.irfft(resampled, points, axis=1) * (points / n)
+
+
+def period_report(freq, points, srate, signals):
+    """Residual period error of the programmed arb and the jump at its wrap
+
+    period_error is relative to the source period; drift is the phase a
+    channel gains per second against the source frequency. wrap_jump is the
+    step from the last sample back to the first over the largest step inside
+    the arb: about 1 or less means no glitch at the wrap.
+    """
+    played = float(f'{srate:.15g}') / points
+    period_error = abs(1 / played - 1 / freq) * freq
+    steps = np.abs(np.diff(signals, axis=1)).max(axis=1)
+    wraps = np.abs(signals[:, 0] - signals[:, -1])
+    return {
+        'freq': freq,
+        'points': points,
+        'srate': srate,
+        'played_freq': played,
+        'period_error': period_error,
+        'period_error_s': period_error / freq,
+        'drift_deg_per_s': period_error * freq * 360,
+        'wrap_jump': float(np.max(wraps / np.where(steps == 0, 1.0, steps))),
+        'bytes': 4 * points,
+    }
+
+
+def exact_period_loaded(group, invert=None, normalize=True, points=None, srate_limit=DEFAULT_MAX_SRATE):
+    """Exact-period arbs of one group of loaded (times, values) one-period waveforms
+
+    The group is first put on its native common grid (waveform_batch), which
+    fixes the period; points defaults to the native length. Returns
+    (signals, srate, points, times, report) with float32 rows.
+    """
+    native = prepare_loaded([group], invert, normalize=False)
+    freq = float(native.sRates[0]) / native.points
+    points, srate = choose_grid(freq, native.points if points is None else points, srate_limit)
+    signals = resample_periodic(native.signals, points)
+    if normalize:
+        peak = np.abs(signals).max(axis=1, keepdims=True)
+        signals /= np.where(peak == 0, 1.0, peak)
+    # Band limiting can overshoot a waveform that touches full scale
+    np.clip(signals, -1.0, 1.0, out=signals)
+    report = period_report(freq, points, srate, signals)
+    times = native.t_starts[0] + np.arange(points) / srate
+    return signals.astype('f4'), srate, points, times, report
+
+
+def exact_period_pair(file1, file2, invert_ch2=True, normalize=True, points=None, srate_limit=DEFAULT_MAX_SRATE):
+    """align_waveforms() with an exact-period grid: returns (sig1, sig2, sRate, points, unified_times, report)"""
+    loaded = load_batch((file1, file2))
+    with phase('align'):
+        signals, srate, points, times, report = exact_period_loaded(
+            [loaded[file1], loaded[file2]], [False, invert_ch2], normalize, points, srate_limit)
+    return signals[0], signals[1], str(srate), points, times, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file1')
+    parser.add_argument('file2')
+    parser.add_argument('--points', type=int, nargs='+', default=[None], help='arb lengths to try (default: native)')
+    parser.add_argument('--model', default=None, help='e.g. 33622A, for its SRAT limit')
+    args = parser.parse_args()
+
+    loaded = load_batch((args.file1, args.file2))
+    group = [loaded[args.file1], loaded[args.file2]]
+    native = prepare_loaded([group], [False, True])
+    print(f"Native grid: {native.points} points at {native.sRates[0]:.9g} Sa/s "
+          f"({float(native.sRates[0]) / native.points:.6f} Hz)")
+    limit = MAX_SRATE.get(args.model, DEFAULT_MAX_SRATE)
+    print(f"{'points':>8} {'SRAT Sa/s':>16} {'freq Hz':>14} {'period err':>11} {'drift deg/s':>12} "
+          f"{'wrap jump':>10} {'bytes':>8}")
+    for points in args.points:
+        *_, report = exact_period_loaded(group, [False, True], points=points, srate_limit=limit)
+        print(f"{report['points']:>8} {report['srate']:>16.6f} {report['played_freq']:>14.6f} "
+              f"{report['period_error']:>11.2e} {report['drift_deg_per_s']:>12.2e} "
+              f"{report['wrap_jump']:>10.2f} {report['bytes']:>8}")
+
+
+if __name__ == "__main__":
+    main()
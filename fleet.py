@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Drive several 33600A units in parallel: discover, connect, preload and switch modes"""
+
+import argparse
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pyvisa as visa
+
+from arb_cache import ArbCache
+from discovery import discover
+from keysight_33600a import Keysight33600A
+
+# One instrument's outcome of a fleet call
+FleetResult = namedtuple('FleetResult', 'resource ok value error seconds')
+
+
+class Fleet:
+    """A set of Keysight33600A drivers whose calls fan out over a thread pool"""
+
+    def __init__(self, resources, rm=None, **awg_kwargs):
+        self.rm = rm if rm is not None else visa.ResourceManager()
+        # One arb cache for all instruments, so each waveform pair is prepared once
+        awg_kwargs.setdefault('arb_cache', ArbCache())
+        self.awgs = {resource: Keysight33600A(resource, rm=self.rm, **awg_kwargs) for resource in resources}
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.awgs), 1), thread_name_prefix='fleet')
+
+    @classmethod
+    def discover(cls, rm=None, **awg_kwargs):
+        """Build a fleet of every 33600A found on the bus"""
+        rm = rm if rm is not None else visa.ResourceManager()
+        return cls(discover(rm), rm, **awg_kwargs)
+
+    def _timed(self, resource, name, args):
+        t0 = time.perf_counter()
+        try:
+            value = getattr(self.awgs[resource], name)(*args)
+        except Exception as e:
+            return FleetResult(resource, False, None, e, time.perf_counter() - t0)
+        return FleetResult(resource, True, value, None, time.perf_counter() - t0)
+
+    def run(self, name, *args, resources=None):
+        """Call a driver method on every instrument at once; returns {resource: FleetResult}
+
+        One instrument failing does not stop the others; check each result's ok.
+        """
+        resources = list(self.awgs) if resources is None else resources
+        futures = {r: self._executor.submit(self._timed, r, name, args) for r in resources}
+        return {r: future.result() for r, future in futures.items()}
+
+    def connect(self):
+        return self.run('connect')
+
+    def preload(self):
+        return self.run('preload')
+
+    def select_mode(self, mode_num):
+        return self.run('select_mode', mode_num)
+
+    def output(self, on):
+        return self.run('output', on)
+
+    def stop(self):
+        return self.run('stop')
+
+    def close(self):
+        results = self.run('close')
+        self._executor.shutdown(wait=True)
+        return results
+
+
+def print_results(title, results):
+    print(f"{title}:")
+    for resource, result in results.items():
+        status = 'ok' if result.ok else f'FAILED: {result.error}'
+        print(f"  {resource:<48} {result.seconds * 1e3:>8.1f} ms  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', type=int, default=1, help='mode to switch every instrument to')
+    parser.add_argument('--voltage', type=float, default=1.2, help='CH1 and CH2 amplitude')
+    args = parser.parse_args()
+
+    fleet = Fleet.discover(ch1_voltage=args.voltage, ch2_voltage=args.voltage)
+    if not fleet.awgs:
+        print("No 33600A found")
+        return
+    t0 = time.perf_counter()
+    try:
+        for title, call in (('connect', fleet.connect), ('preload', fleet.preload),
+                            (f'mode {args.mode}', lambda: fleet.select_mode(args.mode))):
+            print_results(title, call())
+    finally:
+        fleet.close()
+    print(f"{len(fleet.awgs)} instruments in {time.perf_counter() - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import re
+
+
+def normalize(value):
+    """Return a comparable form of a setting as written or as the instrument reports it
+
+    '1.2' and '+1.20000000000000E+00' compare equal, as do ON and 1, and
+    arb names with or without quotes and in any case.
+    """
+    text = str(value).strip().strip('"').upper()
+    text = {'ON': '1', 'OFF': '0'}.get(text, text)
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+class InstrumentState:
+    """Write-through shadow of the instrument's settings
+
+    write() sends a setting only when it differs from the known value and
+    query() answers from the shadow when the value is known, so neither costs
+    a round trip in the common case. Settings are keyed by their short-form
+    SCPI header (e.g. 'SOUR1:VOLT'); a missing header is unknown. reconcile()
+    reads a set of headers back from the instrument in one compound query,
+    after a connect or whenever the shadow may be stale.
+    """
+
+    def __init__(self):
+        # SCPI header -> last value written or read
+        self.known = {}
+        self.writes = 0
+        self.elided = 0
+        self.queries = 0
+        self.answered = 0
+
+    def get(self, header, default=None):
+        return self.known.get(header, default)
+
+    def __contains__(self, header):
+        return header in self.known
+
+    def __setitem__(self, header, value):
+        """Record a value the instrument took without it being written through the shadow"""
+        self.known[header] = value
+
+    def matches(self, header, value):
+        return header in self.known and normalize(self.known[header]) == normalize(value)
+
+    def invalidate(self, *headers):
+        """Forget the known value of some headers (or of all headers)"""
+        if not headers:
+            self.known.clear()
+        for header in headers:
+            self.known.pop(header, None)
+
+    def changes(self, settings):
+        """Return the (header, value) settings that differ from the known state"""
+        return [(header, value) for header, value in settings.items() if not self.matches(header, value)]
+
+    def write(self, inst, header, value, force=False):
+        """Send one setting unless the instrument already has it; returns True if it was sent"""
+        if not force and self.matches(header, value):
+            self.elided += 1
+            return False
+        inst.write(f'{header} {value}')
+        self.known[header] = value
+        self.writes += 1
+        return True
+
+    def query(self, inst, header):
+        """Return a setting, asking the instrument only when it is unknown"""
+        self.queries += 1
+        if header in self.known:
+            self.answered += 1
+            return self.known[header]
+        value = inst.query(f'{header}?').strip()
+        self.known[header] = value
+        return value
+
+    def reconcile(self, inst, headers):
+        """Read headers back in one compound query; returns the headers whose shadow value was wrong
+
+        If the reply does not have one value per header (e.g. a header the
+        instrument rejected), every header is left unknown.
+        """
+        headers = list(headers)
+        reply = inst.query(';'.join(f':{header}?' for header in headers)).strip()
+        values = re.split(r';(?=(?:[^"]*"[^"]*")*[^"]*$)', reply)
+        if len(values) != len(headers):
+            self.invalidate(*headers)
+            return headers
+        stale = [header for header, value in zip(headers, values)
+                 if header not in self.known or normalize(self.known[header]) != normalize(value)]
+        self.known.update(zip(headers, (value.strip() for value in values)))
+        return stale
+
+    def stats(self):
+        return {'writes': self.writes, 'elided': self.elided, 'queries': self.queries, 'answered': self.answered}
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+import threading
+import time
+from functools import partial
+
+import pyvisa as visa
+
+from arb_cache import ArbCache
+from arb_quantize import worst_report
+from arb_residency import ArbResidency, OperationCancelled
+from arb_sequence import load_sequence, resume_sequence
+from arb_store import STORE_DIR, ArbStore
+from completion import wait_complete
+from discovery import CONNECT_BUDGET, INTERFACES, DiscoveryError, parse_idn, resolve
+from mode_switch import ARB_HEADERS, ModeSwitcher, mode_settings
+from phase_timer import phase
+from scpi_trace import TracedSession
+
+# Mode table: number -> (name, file 1, file 2, channel 1 polarity, channel 2 polarity)
+MODES = {
+    1: ('Forward', 'modal/ONEPERIOD_A_25k_50k_84p88deg_2000pts.csv', 'modal/ONEPERIOD_B_25k_50k_264p88deg_2000pts.csv',
+        'NORM', 'INV'),
+    2: ('Right', 'modal/ONEPERIOD_C_47k_94k_57p32deg_2000pts.csv', 'modal/ONEPERIOD_D_47k_94k_237p32deg_2000pts.csv',
+        'NORM', 'INV'),
+    3: ('Backward', 'modal/ONEPERIOD_A_25k_50k_84p88deg_2000pts.csv', 'modal/ONEPERIOD_B_25k_50k_264p88deg_2000pts.csv',
+        'INV', 'NORM'),
+    4: ('Left', 'modal/ONEPERIOD_C_47k_94k_57p32deg_2000pts.csv', 'modal/ONEPERIOD_D_47k_94k_237p32deg_2000pts.csv',
+        'INV', 'NORM'),
+}
+
+
+class Keysight33600A:
+    """Dual-channel Keysight 33600A driver for modal waveform output
+
+    Owns the VISA session, the arbs resident in each channel's volatile memory,
+    the last applied channel configuration and the Track/phase sync setup.
+    """
+
+    def __init__(self, resource=None, modes=MODES, ch1_voltage=1.2, ch2_voltage=1.2,
+                 normalize=False, invert_ch2=True, arb_cache=None, rm=None, trace=False,
+                 completion='opc', timeout=10.0, progress=None, dac=False, dither=False,
+                 serial=None, connect_budget=CONNECT_BUDGET, arb_points=None, arb_rms_error=None,
+                 arb_peak_error=None, trace_errors=False, interfaces=INTERFACES):
+        # VISA resource; None finds the instrument (by serial, if given) with discovery.resolve
+        self.resource = resource
+        self.serial = serial
+        self.connect_budget = connect_budget
+        # VISA interfaces discovery probes besides the 33600A units on USB
+        self.interfaces = interfaces
+        # True once the resource was found by discovery; reconnects search again
+        self.discovered = False
+        # Seconds the last connect() took, discovery included
+        self.connect_seconds = None
+        self.modes = modes
+        self.ch1_voltage = ch1_voltage
+        self.ch2_voltage = ch2_voltage
+        self.normalize = normalize
+        self.invert_ch2 = invert_ch2
+        # Resample every arb to this many points per period, SRAT chosen to match (exact_period)
+        self.arb_points = arb_points
+        # Or the shortest arbs within this RMS/peak error, relative to peak (arb_compact)
+        self.arb_rms_error = arb_rms_error
+        self.arb_peak_error = arb_peak_error
+        self.arb_cache = arb_cache if arb_cache is not None else ArbCache()
+
+        # Injected resource manager (e.g. sim_33600a.SimulatedResourceManager); pyvisa's by default
+        self.rm = rm
+        self.inst = None
+        # Initial state of the session's SCPI tracing; toggle later with inst.enabled
+        self.trace = trace
+        # Query SYST:ERR? after every traced command and record errors in the trace
+        self.trace_errors = trace_errors
+        # How to wait for the instrument (see completion.wait_complete) and for how long
+        self.completion = completion
+        self.timeout = timeout
+        # Seconds the last preload or mode switch waited for the instrument to finish
+        self.last_completion = None
+        # progress(sent bytes, total bytes, bytes/sec) while arbs are uploaded
+        self.progress = progress
+        # Quantize arbs on the host and upload int16 DAC codes (half the USB bytes)
+        self.dac = dac
+        self.dither = dither
+        self.idn = None
+        self.residency = ArbResidency()
+        self.switcher = ModeSwitcher()
+        self.current_mode = None
+        # Pattern played by play_sequence() (see arb_sequence.load_sequence), None in a mode
+        self.current_sequence = None
+        # One caller at a time talks SCPI; set cancel to abandon an upload in progress
+        self.lock = threading.RLock()
+        self.cancel = threading.Event()
+
+    @property
+    def connected(self):
+        return self.inst is not None
+
+    def connect(self):
+        """Open the session and put the instrument in a known idle state; returns *IDN?"""
+        with self.lock:
+            t0 = time.perf_counter()
+            self._open()
+            # One compound query, so the first mode switch only sends what differs
+            self.switcher.invalidate()
+            self.switcher.reconcile(self.inst)
+            self.switcher.write(self.inst, 'OUTP1', 'OFF')
+            self.switcher.write(self.inst, 'OUTP2', 'OFF')
+            self.inst.write(f'MMEMORY:MDIR "{STORE_DIR}"')
+            self.inst.write('FORM:BORD SWAP')
+            self.residency = ArbResidency(store=ArbStore(self.idn), progress=self._upload_progress,
+                                          dac=self.dac, dither=self.dither, quantize=self.arb_cache.dac_codes)
+            self.current_mode = None
+            self.current_sequence = None
+            self.connect_seconds = time.perf_counter() - t0
+            return self.idn
+
+    def _open(self, serial=None):
+        """Open the VISA session (finding the instrument first if needed) and read *IDN?
+
+        With a serial only that unit is accepted (DiscoveryError otherwise),
+        whatever serial the driver was created with.
+        """
+        if self.rm is None:
+            self.rm = visa.ResourceManager()
+        serial = serial or self.serial
+        if self.resource is None or self.discovered:
+            self.resource, session, self.idn = resolve(self.rm, serial, self.connect_budget,
+                                                         interfaces=self.interfaces)
+            self.discovered = True
+            self.inst = TracedSession(session, enabled=self.trace, check_errors=self.trace_errors)
+        else:
+            self.inst = TracedSession(self.rm.open_resource(self.resource), enabled=self.trace,
+                                      check_errors=self.trace_errors)
+            idn = self.inst.query('*IDN?').strip()
+            if serial and parse_idn(idn)[2] != serial:
+                self.inst.close()
+                self.inst = None
+                raise DiscoveryError(f'{self.resource} answered as {idn}, not the 33600A {serial}')
+            self.idn = idn
+        try:
+            self.inst.control_ren(6)
+        except Exception:
+            pass
+
+    def ping(self, timeout=1.0):
+        """Read the status byte with *STB? within timeout seconds; raises if the session is dead"""
+        with self.lock:
+            if self.inst is None:
+                raise ConnectionError('Not connected')
+            default_timeout = self.inst.timeout
+            self.inst.timeout = int(timeout * 1000)
+            try:
+                return int(self.inst.query('*STB?'))
+            finally:
+                self.inst.timeout = default_timeout
+
+    def reconnect(self):
+        """Reopen a lost session and restore the running mode or sequence; returns {channel: arbs re-loaded}
+
+        The arbs still in volatile memory (DATA:VOL:CAT?) are kept. Lost ones
+        are loaded again, from INT:\\remoteAdded when stored there. The mode and
+        output state are written again in full, as the instrument may have
+        been reset. Only the unit of the lost session (by its *IDN? serial) is
+        accepted, so a discovered instrument is never swapped for another one.
+        A sequence the instrument kept plays on; a lost one is started again.
+        """
+        with self.lock:
+            t0 = time.perf_counter()
+            mode, sequence = self.current_mode, self.current_sequence
+            outputs_on = self.switcher.state.matches('OUTP1', 'ON')
+            serial = parse_idn(self.idn)[2] if self.idn else None
+            if self.inst is not None:
+                try:
+                    self.inst.close()
+                except Exception:
+                    pass
+                self.inst = None
+            self._open(serial)
+            # Nothing is re-sent if the instrument kept its settings
+            self.switcher.invalidate()
+            self.switcher.reconcile(self.inst)
+            self.inst.write(f'MMEMORY:MDIR "{STORE_DIR}"')
+            self.inst.write('FORM:BORD SWAP')
+            loaded = list(self.residency.pairs)
+            lost = self.residency.reconcile(self.inst)
+            missing = [pair for pair in loaded if pair not in self.residency.pairs]
+            if missing:
+                # Flash may have been cleared too; only files still there are loaded from it
+                self.residency.store.reconcile(self.inst)
+                self.residency.preload(self.inst, missing, partial(self.align, invert_ch2=self.invert_ch2))
+                self.switcher.invalidate(*ARB_HEADERS)
+            # Restoring is not a switch a STOP or an abort was meant for; one
+            # still pending applies to the next switch again
+            aborting = self.cancel.is_set()
+            self.cancel.clear()
+            try:
+                if mode is not None:
+                    self._apply_mode(mode, 'ON' if outputs_on else 'OFF')
+                elif sequence is not None:
+                    resume_sequence(self, sequence, 'ON' if outputs_on else 'OFF')
+                else:
+                    self.output(False)
+            finally:
+                if aborting:
+                    self.cancel.set()
+            self.wait()
+            self.connect_seconds = time.perf_counter() - t0
+            return lost
+
+    def _upload_progress(self, sent, total, rate):
+        if self.progress is not None:
+            self.progress(sent, total, rate)
+
+    def mode_pairs(self):
+        """Return the distinct (file1, file2) waveform pairs used by the mode table"""
+        pairs = []
+        for _, file1, file2, _, _ in self.modes.values():
+            if (file1, file2) not in pairs:
+                pairs.append((file1, file2))
+        return pairs
+
+    def align(self, file1, file2, invert_ch2=True):
+        """Return the aligned channel pair, from the arb cache when possible"""
+        return self.arb_cache.prepare_pair(file1, file2, invert_ch2=invert_ch2, normalize=self.normalize,
+                                           points=self.arb_points, rms_error=self.arb_rms_error,
+                                           peak_error=self.arb_peak_error)
+
+    def preload(self):
+        """Upload every distinct arb of the mode table into volatile memory once"""
+        with self.lock:
+            self.inst.write("DISP:TEXT 'Uploading Modal Arbs'")
+            self.residency.clear(self.inst)
+            # Arbs already on INT:\remoteAdded are loaded from flash instead of re-sent
+            self.residency.store.reconcile(self.inst)
+            try:
+                self.residency.preload(self.inst, self.mode_pairs(), partial(self.align, invert_ch2=self.invert_ch2),
+                                       self.cancel)
+            finally:
+                self.inst.write("DISP:TEXT ''")
+                # Storing arbs selects them, so the switcher no longer knows FUNC:ARB
+                self.switcher.invalidate(*ARB_HEADERS)
+            self.wait()
+            return self.residency.resident
+
+    def wait(self):
+        """Wait until the instrument has finished every queued command; returns the seconds waited"""
+        with phase('complete'):
+            self.last_completion = wait_complete(self.inst, self.timeout, self.completion)
+        return self.last_completion
+
+    def quantization(self):
+        """Return the worst quantization_report() of the arbs uploaded as DAC codes, or None"""
+        return worst_report(self.residency.reports.values())
+
+    def setting(self, header):
+        """Return a setting such as 'SOUR2:TRACK', from the state cache when known"""
+        with self.lock:
+            return self.switcher.state.query(self.inst, header)
+
+    def setup_sync_internal(self, inst):
+        """Setup Sync Internal (Track On): Channel 2 tracks Channel 1"""
+        inst.write('SOUR1:TRACK OFF')
+        inst.write('SOUR2:TRACK OFF')
+        inst.write('SOUR2:TRACK ON')
+        # Phase sync must not start before Track is on; this waits inside the instrument
+        inst.write('*WAI')
+
+    def sync_channels(self, inst):
+        """Setup Track On and synchronize Channel 2 phase to Channel 1"""
+        self.setup_sync_internal(inst)
+        inst.write('SOUR2:PHAS:SYNC')
+        inst.write('SOUR2:PHAS 0')
+
+    def select_mode(self, mode_num):
+        """Switch to a mode, sending only the settings that change; returns (freq, sent commands)"""
+        return self._apply_mode(mode_num, 'ON')
+
+    def _apply_mode(self, mode_num, output_state):
+        with self.lock:
+            _, file1, file2, ch1_polarity, ch2_polarity = self.modes[mode_num]
+            if (file1, file2) not in self.residency.pairs:
+                # Not preloaded (or lost after a clear): load this pair on demand,
+                # from flash only where the manifest still matches the instrument
+                try:
+                    self.residency.store.reconcile(self.inst)
+                    self.residency.preload(self.inst, [(file1, file2)],
+                                           partial(self.align, invert_ch2=self.invert_ch2), self.cancel)
+                finally:
+                    self.switcher.invalidate(*ARB_HEADERS)
+            if self.cancel.is_set():
+                raise OperationCancelled(f'Switch to mode {mode_num} cancelled')
+            arb1, arb2, sRate, points = self.residency.pair(file1, file2)
+
+            # Modes sharing a waveform pair only change polarity
+            waveform, output = mode_settings(arb1, arb2, sRate, points, ch1_polarity, ch2_polarity,
+                                             self.ch1_voltage, self.ch2_voltage)
+            output.update({'OUTP1': output_state, 'OUTP2': output_state})
+            sent = self.switcher.apply(self.inst, waveform, output, self.sync_channels)
+            self.wait()
+            self.current_mode = mode_num
+            self.current_sequence = None
+            return float(sRate) / points, sent
+
+    def play_sequence(self, pattern, srate=None, trigger='BUS'):
+        """Play a pattern of modes such as 'forward 200, right 50' as an arb sequence; returns its report
+
+        Segments follow each other on the instrument (see arb_sequence). A
+        step that waits for a trigger advances on trigger().
+        """
+        return load_sequence(self, pattern, srate, trigger)
+
+    def trigger(self):
+        """Send a bus trigger (*TRG)"""
+        with self.lock:
+            self.inst.write('*TRG')
+
+    def output(self, on):
+        """Enable or disable both channel outputs"""
+        state = 'ON' if on else 'OFF'
+        with self.lock:
+            self.switcher.write(self.inst, 'OUTP1', state)
+            self.switcher.write(self.inst, 'OUTP2', state)
+
+    def stop(self):
+        """Disable both outputs and Track"""
+        with self.lock:
+            self.output(False)
+            self.switcher.write(self.inst, 'SOUR2:TRACK', 'OFF')
+
+    def close(self, stop=True):
+        """Close the session, stopping the outputs first unless stop is False"""
+        with self.lock:
+            if self.inst is None:
+                return
+            try:
+                if stop:
+                    self.stop()
+            finally:
+                self.inst.close()
+                self.inst = None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+from instrument_state import InstrumentState
+from phase_timer import phase
+from scpi_batch import CommandBatch
+
+
+def mode_settings(arb1, arb2, sRate, points, ch1_polarity, ch2_polarity, ch1_voltage, ch2_voltage):
+    """Build the (waveform, output) SCPI settings of a mode as ordered header -> value dicts"""
+    freq = float(sRate) / points
+    waveform = {
+        'SOUR1:FUNC': 'ARB',
+        'SOUR1:FUNC:ARB': arb1,
+        'SOUR1:FUNC:ARB:SRAT': sRate,
+        'SOUR1:VOLT': str(ch1_voltage),
+        'SOUR1:VOLT:OFFS': '0',
+        'SOUR2:FUNC': 'ARB',
+        'SOUR2:FUNC:ARB': arb2,
+        'SOUR2:FUNC:ARB:SRAT': sRate,
+        'SOUR2:VOLT': str(ch2_voltage),
+        'SOUR2:VOLT:OFFS': '0',
+        'SOUR1:FREQ': str(freq),
+        'SOUR2:FREQ': str(freq),
+        'SOUR1:PHAS': '0',
+        'SOUR2:PHAS': '0',
+    }
+    # Polarity is applied after Track is set up, outputs are enabled last
+    output = {
+        'OUTP1:POL': ch1_polarity,
+        'OUTP2:POL': ch2_polarity,
+        'OUTP:SYNC': 'ON',
+        'OUTP:SYNC:SOURCE': 'CH1',
+        'OUTP:SYNC:MODE': 'MARK',
+        'OUTP1': 'ON',
+        'OUTP2': 'ON',
+    }
+    return waveform, output
+
+
+# Selecting an arb sets its channel's sample rate, and the sample rate sets the frequency
+COUPLED = {
+    'SOUR1:FUNC:ARB': ('SOUR1:FUNC:ARB:SRAT', 'SOUR1:FREQ'),
+    'SOUR2:FUNC:ARB': ('SOUR2:FUNC:ARB:SRAT', 'SOUR2:FREQ'),
+    'SOUR1:FUNC:ARB:SRAT': ('SOUR1:FREQ',),
+    'SOUR2:FUNC:ARB:SRAT': ('SOUR2:FREQ',),
+}
+# Settings changed behind the switcher's back when arbs are uploaded, stored or loaded
+ARB_HEADERS = tuple(COUPLED) + ('SOUR1:FREQ', 'SOUR2:FREQ')
+
+
+def mode_headers():
+    """Return every header a mode switch relies on, for InstrumentState.reconcile()"""
+    waveform, output = mode_settings('', '', 1, 1, 'NORM', 'NORM', 0, 0)
+    return list(waveform) + list(output) + ['SOUR1:TRACK', 'SOUR2:TRACK']
+
+
+class ModeSwitcher:
+    """Switch modes by sending only the settings that differ from the instrument's known state"""
+
+    def __init__(self, state=None):
+        # Shadow of the instrument settings; missing headers are unknown
+        self.state = state if state is not None else InstrumentState()
+
+    def invalidate(self, *headers):
+        """Forget the known value of some headers (or of all headers)"""
+        self.state.invalidate(*headers)
+
+    def reconcile(self, inst):
+        """Read the mode settings back from the instrument; returns the headers that were stale"""
+        return self.state.reconcile(inst, mode_headers())
+
+    def write(self, inst, header, value):
+        """Write one setting unless the instrument already has it; returns True if it was sent"""
+        if not self.state.write(inst, header, value):
+            return False
+        if header in COUPLED:
+            self.state.invalidate(*COUPLED[header])
+        return True
+
+    def changes(self, settings):
+        """Return the settings whose value differs from the known state"""
+        return self.state.changes(settings)
+
+    def apply(self, inst, waveform, output, resync):
+        """Apply a mode; waveform changes are made with Track off and followed by resync(inst)
+
+        Each group of commands is sent as one compound message (see CommandBatch).
+        """
+        sent = []
+        batch = CommandBatch(inst)
+        try:
+            if self.changes(waveform) or not self.state.matches('SOUR2:TRACK', 'ON'):
+                with phase('configure'):
+                    # Turn outputs and Track off so each channel can be configured independently
+                    for header, value in (('OUTP1', 'OFF'), ('OUTP2', 'OFF'), ('SOUR2:TRACK', 'OFF')):
+                        if self.write(batch, header, value):
+                            sent.append(f'{header} {value}')
+                    # One at a time: a new arb or sample rate makes the following settings unknown
+                    for header, value in waveform.items():
+                        if self.write(batch, header, value):
+                            sent.append(f'{header} {value}')
+                    batch.flush()
+                with phase('sync'):
+                    resync(batch)
+                    batch.flush()
+                self.state['SOUR1:TRACK'] = 'OFF'
+                self.state['SOUR2:TRACK'] = 'ON'
+                sent.append('SOUR2:TRACK ON')
+            # Polarity and outputs only after Track is on
+            with phase('configure'):
+                for header, value in output.items():
+                    if self.write(batch, header, value):
+                        sent.append(f'{header} {value}')
+                batch.flush()
+        except Exception:
+            # Unsent or failed commands were already recorded as state
+            self.invalidate()
+            raise
+        return sent
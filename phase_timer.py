@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import threading
+import time
+from contextlib import contextmanager
+
+# The timer collecting phases on this thread, if any
+_active = threading.local()
+
+
+class PhaseTimer:
+    """Accumulate wall time per named phase while active on the current thread
+
+    Code marks its phases with phase(name); they are only timed inside
+    "with timer:", so the markers cost one attribute lookup otherwise.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_active, 'timer', None)
+        _active.timer = self
+        return self
+
+    def __exit__(self, *exc):
+        _active.timer = self._outer
+        self._outer = None
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def lap(self):
+        """Return the accumulated {phase: seconds} and start over"""
+        phases, self.phases = self.phases, {}
+        return phases
+
+
+@contextmanager
+def _timed(timer, name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - t0)
+
+
+class _NoPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    """Context manager timing a phase into the active PhaseTimer (no-op without one)"""
+    timer = getattr(_active, 'timer', None)
+    if timer is None:
+        return _NO_PHASE
+    return _timed(timer, name)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""Precompile a modal waveform library into the arb cache on a process pool
+
+    python precompile.py modal/ --workers 8 --normalize
+
+Every channel pair is parsed, resampled (and with --dac quantized to int16 DAC
+codes) in a worker process and stored in the on-disk ArbCache, so drivers using
+the same cache directory and options start with every arb prepared.
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from arb_cache import DEFAULT_CACHE_DIR, ArbCache
+from arb_quantize import worst_report
+from phase_timer import PhaseTimer, phase
+
+WAVEFORM_EXTENSIONS = ('.csv', '.dat', '.txt')
+# e.g. ONEPERIOD_A_25k_50k_84p88deg_2000pts.csv: frequencies, phase, points
+FREQUENCY_TOKEN = re.compile(r'\d+(?:p\d+)?k_\d+(?:p\d+)?k', re.IGNORECASE)
+PHASE_TOKEN = re.compile(r'(\d+(?:p\d+)?)deg', re.IGNORECASE)
+POINTS_TOKEN = re.compile(r'\d+pts', re.IGNORECASE)
+
+
+def waveform_files(paths):
+    """Expand directories to the waveform files in them; returns sorted paths"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(WAVEFORM_EXTENSIONS))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def library_pairs(files):
+    """Pair files with the same frequencies and point count whose phases are 180 degrees apart
+
+    The lower phase goes to channel 1, as in the mode table. Returns
+    (pairs, unpaired files).
+    """
+    groups = {}
+    unpaired = []
+    for f in files:
+        name = os.path.basename(f)
+        freq, phase_deg, points = FREQUENCY_TOKEN.search(name), PHASE_TOKEN.search(name), POINTS_TOKEN.search(name)
+        if not (freq and phase_deg):
+            unpaired.append(f)
+            continue
+        key = (os.path.dirname(f), freq.group(0).lower(), points.group(0).lower() if points else '')
+        degrees = float(phase_deg.group(1).replace('p', '.'))
+        groups.setdefault(key, []).append((degrees, f))
+    pairs = []
+    for members in groups.values():
+        members.sort()
+        used = set()
+        for i, (degrees, f) in enumerate(members):
+            if i in used:
+                continue
+            partner = next((j for j, (other, _) in enumerate(members)
+                            if j not in used and j != i and abs(other - (degrees + 180) % 360) < 1e-6), None)
+            if partner is None:
+                unpaired.append(f)
+                continue
+            used.update((i, partner))
+            pairs.append((f, members[partner][1]))
+    return sorted(pairs), sorted(unpaired)
+
+
+def compile_pair(cache_dir, file1, file2, invert_ch2=True, normalize=True, dac=False, dither=False, arb_points=None,
+                 rms_error=None, peak_error=None):
+    """Prepare one pair into the cache (runs in a worker process); returns its report"""
+    cache = ArbCache(cache_dir)
+    t0 = time.perf_counter()
+    with PhaseTimer() as timer:
+        (sig1, sig2, sRate, points, _), key, ident, built = cache.build_pair(
+            file1, file2, invert_ch2, normalize, index=False, points=arb_points, rms_error=rms_error,
+            peak_error=peak_error)
+        quantization = None
+        if dac:
+            with phase('quantize'):
+                # Stored under their own key, where the driver's dac path looks them up
+                quantization = [cache.dac_codes(sig, dither)[1] for sig in (sig1, sig2)]
+    return {
+        'files': (file1, file2),
+        'key': key,
+        'ident': ident,
+        'built': built,
+        'points': points,
+        'sRate': sRate,
+        'source_bytes': os.path.getsize(file1) + os.path.getsize(file2),
+        'phases': timer.lap(),
+        'seconds': time.perf_counter() - t0,
+        'quantization': quantization,
+    }
+
+
+def precompile(pairs, cache_dir=DEFAULT_CACHE_DIR, workers=None, invert_ch2=True, normalize=True,
+               dac=False, dither=False, arb_points=None, rms_error=None, peak_error=None, on_result=None):
+    """Prepare every pair into the cache; returns (reports in completion order, wall seconds)
+
+    With workers=1 the pairs run in this process. on_result(report) is called
+    as each pair finishes. The cache index is updated once at the end, so the
+    workers never write it concurrently.
+    """
+    options = (invert_ch2, normalize, dac, dither, arb_points, rms_error, peak_error)
+    reports = []
+    t0 = time.perf_counter()
+    if workers == 1:
+        for file1, file2 in pairs:
+            reports.append(compile_pair(cache_dir, file1, file2, *options))
+            if on_result is not None:
+                on_result(reports[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(compile_pair, cache_dir, file1, file2, *options) for file1, file2 in pairs]
+            for future in as_completed(futures):
+                reports.append(future.result())
+                if on_result is not None:
+                    on_result(reports[-1])
+    built = {report['ident']: report['key'] for report in reports if report['built']}
+    if built:
+        ArbCache(cache_dir).update_index(built)
+    return reports, time.perf_counter() - t0
+
+
+def print_report(report):
+    phases = report['phases']
+    name1, name2 = (os.path.basename(f) for f in report['files'])
+    rate = 2 * report['points'] / report['seconds'] / 1e6
+    line = (f"  {name1} + {name2}: {report['points']} pts, {float(report['sRate']) / 1e6:g} MSa/s, "
+            f"parse {phases.get('parse', 0) * 1e3:.0f} ms, align {phases.get('align', 0) * 1e3:.0f} ms, ")
+    if report['quantization']:
+        worst = worst_report(report['quantization'])
+        line += (f"quantize {phases.get('quantize', 0) * 1e3:.0f} ms (peak error {worst['peak_error']:.2e}, "
+                 f"float32 {worst['float_peak_error']:.2e}, {worst['clipped']} clipped), ")
+    status = 'built' if report['built'] else 'cached'
+    print(line + f"{rate:.1f} Mpts/s, {status}")
+
+
+def print_summary(reports, wall, workers):
+    points = sum(2 * report['points'] for report in reports)
+    busy = sum(report['seconds'] for report in reports)
+    source_mb = sum(report['source_bytes'] for report in reports) / 1e6
+    built = sum(report['built'] for report in reports)
+    print(f"{len(reports)} pairs ({built} built, {len(reports) - built} cached), {points} points in {wall:.2f} s: "
+          f"{points / wall / 1e6:.1f} Mpts/s, {source_mb / wall:.1f} MB/s of source files")
+    print(f"{workers} workers, {busy:.2f} s of pair work: {busy / wall:.1f}x over serial, "
+          f"{busy / wall / workers * 100:.0f}% parallel efficiency")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='*', default=['modal'], help='waveform files or directories')
+    parser.add_argument('--in-order', action='store_true',
+                        help='pair the files as given (file1 file2 file1 file2 ...) instead of by name')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (1: serial)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--normalize', action='store_true', help='as the GUI and the 2-mode script')
+    parser.add_argument('--no-invert-ch2', dest='invert_ch2', action='store_false')
+    parser.add_argument('--dac', action='store_true', help='also store every arb\'s int16 DAC codes (as the driver\'s dac)')
+    parser.add_argument('--dither', action='store_true', help='dither the DAC codes (as the driver\'s dither)')
+    parser.add_argument('--points', type=int, default=None,
+                        help='exact-period arbs of this many points (as the driver\'s arb_points)')
+    parser.add_argument('--rms-error', type=float, default=None,
+                        help='shortest arbs within this RMS error, relative to peak (see arb_compact.py)')
+    parser.add_argument('--peak-error', type=float, default=None, help='the same for the peak error')
+    args = parser.parse_args()
+
+    if args.in_order:
+        files = args.paths
+        if len(files) % 2:
+            parser.error('--in-order needs an even number of files')
+        pairs, unpaired = list(zip(files[::2], files[1::2])), []
+    else:
+        pairs, unpaired = library_pairs(waveform_files(args.paths))
+    for f in unpaired:
+        print(f"Skipped (no 180 degree partner): {f}")
+    if not pairs:
+        parser.error('no waveform pairs found')
+
+    print(f"Precompiling {len(pairs)} pairs into {args.cache_dir} with {args.workers} workers")
+    reports, wall = precompile(pairs, args.cache_dir, args.workers, args.invert_ch2, args.normalize,
+                               args.dac, args.dither, args.points, args.rms_error, args.peak_error,
+                               on_result=print_report)
+    print_summary(reports, wall, args.workers)
+
+
+if __name__ == "__main__":
+    main()
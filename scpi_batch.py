@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# Conservative compound message size; well below the 33600A's input buffer
+MAX_MESSAGE = 1024
+
+
+class CommandBatch:
+    """Collect SCPI commands and send them as few compound messages as possible
+
+    Commands are joined as ':CMD1;:CMD2', so each is parsed from the root
+    and runs in the order it was added. No *WAI is appended; wait for
+    completion (see completion.wait_complete) where it matters. A batch is
+    sent when the next command would exceed max_bytes, on flush(), before a
+    query, and when a with-block ends. Flush where the instrument must have
+    finished one group of commands before the host sends the next. Note that
+    an instrument error in one command may discard the rest of its message.
+    """
+
+    def __init__(self, inst, max_bytes=MAX_MESSAGE):
+        self.inst = inst
+        self.max_bytes = max_bytes
+        self.pending = []
+        self._size = 0
+        self.messages = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Do not send half a configuration after an error
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def write(self, command):
+        """Queue one command (same call as the session's write)"""
+        command = command.strip()
+        if not command.startswith(('*', ':')):
+            command = ':' + command
+        size = len(command) + 1
+        if self.pending and self._size + size > self.max_bytes:
+            self.flush()
+        self.pending.append(command)
+        self._size += size
+
+    def flush(self):
+        """Send the queued commands as one compound message"""
+        if not self.pending:
+            return
+        message = ';'.join(self.pending)
+        self.discard()
+        self.inst.write(message)
+        self.messages += 1
+
+    def discard(self):
+        """Drop the queued commands without sending them"""
+        self.pending = []
+        self._size = 0
+
+    def query(self, command):
+        """Flush, then query, so the response reflects every queued command"""
+        self.flush()
+        return self.inst.query(command)
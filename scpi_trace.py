@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import json
+import threading
+import time
+from collections import deque
+
+
+class TracedSession:
+    """VISA session wrapper recording every command's bytes and round-trip time
+
+    Tracing can be switched on and off at runtime with .enabled; when it is off
+    each call costs one attribute check before going straight to the session.
+    With check_errors, SYST:ERR? is queried after every traced command (slow,
+    but shows exactly which command raised an instrument error); a message
+    written in pieces with send_end off is checked once, after its last piece.
+    """
+
+    _OWN = frozenset(('session', 'enabled', 'check_errors', 'events', '_t0'))
+
+    def __init__(self, session, enabled=False, check_errors=False, max_events=100000):
+        self.session = session
+        self.enabled = enabled
+        self.check_errors = check_errors
+        self.events = deque(maxlen=max_events)
+        self._t0 = time.perf_counter()
+
+    # Anything not traced (timeout, clear, close, ...) goes to the session
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __setattr__(self, name, value):
+        if name in self._OWN:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.session, name, value)
+
+    def _record(self, command, nbytes, start, response=None):
+        end = time.perf_counter()
+        event = {'command': command, 'bytes': nbytes, 'start': start - self._t0, 'rtt': end - start,
+                 'thread': threading.get_ident()}
+        if response is not None:
+            event['response'] = response[:80]
+        # A query now would land inside the block of a message still being sent
+        if self.check_errors and getattr(self.session, 'send_end', True):
+            error = self.session.query('SYST:ERR?').strip()
+            if not error.startswith(('+0', '0')):
+                event['error'] = error
+        self.events.append(event)
+
+    def write(self, message, *args, **kwargs):
+        if not self.enabled:
+            return self.session.write(message, *args, **kwargs)
+        start = time.perf_counter()
+        result = self.session.write(message, *args, **kwargs)
+        self._record(message, len(message) + 1, start)
+        return result
+
+    def write_raw(self, message):
+        if not self.enabled:
+            return self.session.write_raw(message)
+        start = time.perf_counter()
+        result = self.session.write_raw(message)
+        self._record(message[:40].decode('latin-1', 'replace'), len(message), start)
+        return result
+
+    def write_binary_values(self, message, values, *args, **kwargs):
+        if not self.enabled:
+            return self.session.write_binary_values(message, values, *args, **kwargs)
+        start = time.perf_counter()
+        result = self.session.write_binary_values(message, values, *args, **kwargs)
+        nbytes = getattr(values, 'nbytes', 4 * len(values))
+        self._record(f'{message}<block {nbytes} bytes>', len(message) + nbytes + 1, start)
+        return result
+
+    def query(self, message, *args, **kwargs):
+        if not self.enabled:
+            return self.session.query(message, *args, **kwargs)
+        start = time.perf_counter()
+        response = self.session.query(message, *args, **kwargs)
+        self._record(message, len(message) + 1 + len(response), start, response)
+        return response
+
+    def read(self, *args, **kwargs):
+        if not self.enabled:
+            return self.session.read(*args, **kwargs)
+        start = time.perf_counter()
+        response = self.session.read(*args, **kwargs)
+        self._record('<read>', len(response), start, response)
+        return response
+
+    def clear_trace(self):
+        self.events.clear()
+
+    def summary(self):
+        """Return per-header (count, total ms, max ms, bytes), slowest total first"""
+        headers = {}
+        for event in self.events:
+            header = event['command'].split(' ', 1)[0].split('<', 1)[0]
+            count, total, worst, nbytes = headers.get(header, (0, 0.0, 0.0, 0))
+            rtt = event['rtt'] * 1e3
+            headers[header] = (count + 1, total + rtt, max(worst, rtt), nbytes + event['bytes'])
+        return sorted(headers.items(), key=lambda item: item[1][1], reverse=True)
+
+    def chrome_trace(self):
+        """Return the trace as Chrome trace-event JSON (chrome://tracing, Perfetto)"""
+        events = []
+        for event in self.events:
+            args = {'bytes': event['bytes']}
+            for key in ('response', 'error'):
+                if key in event:
+                    args[key] = event[key]
+            events.append({'name': event['command'][:60], 'cat': 'error' if 'error' in event else 'scpi',
+                           'ph': 'X', 'ts': event['start'] * 1e6, 'dur': event['rtt'] * 1e6,
+                           'pid': 1, 'tid': event['thread'], 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, filename):
+        """Write the Chrome trace JSON to filename"""
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f)
@@ -1,24 +1,35 @@
 #!/usr/bin/env python
 
+import argparse
 import tkinter as tk
 from tkinter import messagebox
-import pyvisa as visa
-import numpy as np
-import csv
-import threading
+from concurrent.futures import CancelledError
+from async_control import InstrumentController, ModeScheduler
+from keysight_33600a import Keysight33600A
+from supervisor import SessionSupervisor
 
 class SimpleModalSelectorGUI:
-    def __init__(self, root):
+    def __init__(self, root, dac=False, dither=False):
         self.root = root
         self.root.title("Dual Modal Selector")
         self.root.geometry("300x350")
         self.root.resizable(False, False)
         
         # Device connection status
-        self.inst = None
+        # dac: upload host-quantized int16 codes (half the bytes of float32)
+        self.awg = Keysight33600A(ch1_voltage=0.8, ch2_voltage=1.8, normalize=True, dac=dac, dither=dither)
+        # Every instrument call goes through one queue on one worker thread
+        self.ctl = InstrumentController(self.awg)
+        # Rapid button presses only apply the latest mode
+        self.scheduler = ModeScheduler(self.ctl)
+        # Health-checks the session and reconnects if the USB link drops
+        self.supervisor = SessionSupervisor(self.awg)
         self.connected = False
         self.current_mode = None
         self.is_running = False
+        # Latest (sent, total, bytes/sec) of an arb upload, set from the worker thread
+        self.upload_progress = None
+        self.awg.progress = lambda sent, total, rate: setattr(self, 'upload_progress', (sent, total, rate))
         
         # Create GUI elements
         self.create_widgets()
@@ -82,35 +93,83 @@ class SimpleModalSelectorGUI:
     
     def connect_device(self):
         """Connect to Keysight 33600A device"""
+        self.status_label.config(text="Status: Connecting...", fg="orange")
+        self._when_done(self.ctl.request('connect'), self._on_connected, self._on_connect_failed)
+    
+    def _on_connected(self, device_id):
+        # Upload every distinct arb once; mode switches only select resident arbs
+        self.status_label.config(text=f"Connected in {self.awg.connect_seconds * 1e3:.0f} ms, uploading...",
+                                 fg="orange")
+        future = self.ctl.request('preload')
+        self._when_done(future, self._on_preloaded, self._on_connect_failed)
+        self._show_upload_progress(future)
+    
+    def _show_upload_progress(self, future):
+        """Show upload percentage and speed until the preload is done"""
+        if future.done():
+            return
+        if self.upload_progress is not None:
+            sent, total, rate = self.upload_progress
+            speed = f", {rate / 1e6:.1f} MB/s" if rate else ""
+            self.status_label.config(text=f"Status: Uploading {sent * 100 // total}%{speed}", fg="orange")
+        self.root.after(100, self._show_upload_progress, future)
+    
+    def _connected_text(self):
+        """Connected status with the cold-start connect time (discovery included) against its budget"""
+        text = f"Status: Connected ({self.awg.connect_seconds * 1e3:.0f} ms / {self.awg.connect_budget:.0f} s)"
+        report = self.awg.quantization()
+        if report is not None:
+            # DAC codes against what the float32 path would have given
+            text += (f"\nDAC peak error {report['peak_error']:.1e} (float {report['float_peak_error']:.1e}), "
+                     f"{report['clipped']} clipped")
+        return text
+    
+    def _on_preloaded(self, resident):
+        self.connected = True
+        self.status_label.config(text=self._connected_text(), fg="green")
+        self.update_button_states()
+        self.supervisor.start()
+        self._poll_status()
+    
+    def _on_connect_failed(self, error):
+        self.connected = False
+        self.status_label.config(text="Status: Connection Failed", fg="red")
+        messagebox.showerror("Error", f"Connection failed:\n{str(error)}")
+        self.update_button_states()
+    
+    def _when_done(self, future, on_result, on_error=None):
+        """Call on_result(result) or on_error(exception) on the Tk thread once future is done"""
+        if not future.done():
+            self.root.after(20, self._when_done, future, on_result, on_error)
+            return
         try:
-            self.status_label.config(text="Status: Connecting...", fg="orange")
-            self.root.update()
-            
-            rm = visa.ResourceManager()
-            self.inst = rm.open_resource('USB0::0x0957::0x5707::MY59001615::0::INSTR')
-            
-            try:
-                self.inst.control_ren(6)
-            except:
-                pass
-            
-            # Test connection
-            device_id = self.inst.query('*IDN?').strip()
-            
-            # Initialize device
-            self.inst.write('OUTP1 OFF')
-            self.inst.write('OUTP2 OFF')
-            self.inst.write("MMEMORY:MDIR \"INT:\\remoteAdded\"")
-            self.inst.write('FORM:BORD SWAP')
-            
-            self.connected = True
-            self.status_label.config(text="Status: Connected", fg="green")
-            self.update_button_states()
-            
+            result = future.result()
+        except CancelledError:
+            return
         except Exception as e:
-            self.connected = False
-            self.status_label.config(text="Status: Connection Failed", fg="red")
-            self.update_button_states()
+            if on_error is not None:
+                on_error(e)
+            return
+        on_result(result)
+    
+    def _poll_status(self):
+        """Show whether the instrument is busy (no SCPI, reads the controller's snapshot)"""
+        if not self.connected:
+            return
+        status = self.ctl.status()
+        progress = self.upload_progress
+        if self.supervisor.state == 'reconnecting':
+            self.status_label.config(text="Status: Reconnecting...", fg="orange")
+        elif self.supervisor.state == 'lost':
+            self.status_label.config(text="Status: Connection Lost", fg="red")
+        elif status['busy'] and progress is not None and progress[0] < progress[1]:
+            sent, total, rate = progress
+            self.status_label.config(text=f"Status: Uploading {sent * 100 // total}%", fg="orange")
+        elif status['busy']:
+            self.status_label.config(text="Status: Busy", fg="orange")
+        else:
+            self.status_label.config(text=self._connected_text(), fg="green")
+        self.root.after(200, self._poll_status)
     
     def select_mode(self, mode_num):
         """Select and configure mode"""
@@ -118,32 +177,25 @@ class SimpleModalSelectorGUI:
             messagebox.showwarning("Warning", "Please connect device first!")
             return
         
-        # Stop current output if running
-        if self.is_running:
-            self.stop_all_outputs()
+        # Queued on the instrument controller; the GUI never waits for the device
+        mode_names = {1: "Forward", 2: "Right", 3: "Backward", 4: "Left"}
+        self.mode_label.config(text=f"Mode: Setting {mode_names[mode_num]}...")
         
-        # Run mode configuration in background thread
-        threading.Thread(target=self._run_mode_thread, args=(mode_num,), daemon=True).start()
-    
-    def _run_mode_thread(self, mode_num):
-        """Execute mode configuration in background thread"""
-        try:
-            # Update GUI status
-            mode_names = {1: "Forward", 2: "Right", 3: "Backward", 4: "Left"}
-            self.root.after(0, lambda: self.mode_label.config(text=f"Mode: Setting {mode_names[mode_num]}..."))
-            
-            # Execute mode configuration
-            freq = self.run_mode(mode_num)
+        def done(result):
             self.current_mode = mode_num
-            
-            # Update GUI
-            self.root.after(0, lambda: self.mode_label.config(text=f"Mode: {mode_names[mode_num]}"))
-            self.root.after(0, lambda: self.pause_btn.config(text="PAUSE"))
-            self.root.after(0, lambda: setattr(self, 'is_running', True))
-            
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Mode setup failed:\n{str(e)}"))
-            self.root.after(0, lambda: self.mode_label.config(text="Mode: Setup Failed"))
+            done_ms = self.awg.last_completion * 1e3
+            self.mode_label.config(text=f"Mode: {mode_names[mode_num]} (done in {done_ms:.0f} ms)")
+            self.pause_btn.config(text="PAUSE")
+            self.is_running = True
+        
+        def failed(e):
+            # A dead link is found and reconnected right away instead of at the next check
+            self.supervisor.check_now()
+            messagebox.showerror("Error", f"Mode setup failed:\n{str(e)}")
+            self.mode_label.config(text="Mode: Setup Failed")
+        
+        # Superseded requests are cancelled and leave the label to the newer one
+        self._when_done(self.scheduler.request(mode_num), done, failed)
     
     def toggle_output(self):
         """Toggle output on/off"""
@@ -155,38 +207,35 @@ class SimpleModalSelectorGUI:
             messagebox.showwarning("Warning", "Please select a mode first!")
             return
         
-        try:
-            if self.is_running:
-                # Pause output
-                self.inst.write('OUTP1 OFF')
-                self.inst.write('OUTP2 OFF')
-                self.pause_btn.config(text="START")
-                self.is_running = False
-            else:
-                # Start output
-                self.inst.write('OUTP1 ON')
-                self.inst.write('OUTP2 ON')
-                self.pause_btn.config(text="PAUSE")
-                self.is_running = True
-                
-        except Exception as e:
+        # Pause output if running, start it otherwise
+        start = not self.is_running
+        
+        def done(result):
+            self.pause_btn.config(text="PAUSE" if start else "START")
+            self.is_running = start
+        
+        def failed(e):
+            self.supervisor.check_now()
             messagebox.showerror("Error", f"Output control failed:\n{str(e)}")
+        
+        self._when_done(self.ctl.request('output', start), done, failed)
     
     def stop_all_outputs(self):
         """Stop all outputs"""
         if not self.connected:
             return
         
-        try:
-            self.inst.write('OUTP1 OFF')
-            self.inst.write('OUTP2 OFF')
-            self.inst.write('SOUR2:TRACK OFF')
+        # STOP pre-empts any pending or in-progress mode switch
+        def done(result):
             self.is_running = False
             self.pause_btn.config(text="START")
             self.mode_label.config(text="Mode: Stopped")
-            
-        except Exception as e:
+        
+        def failed(e):
+            self.supervisor.check_now()
             messagebox.showerror("Error", f"Stop output failed:\n{str(e)}")
+        
+        self._when_done(self.scheduler.stop(), done, failed)
     
     def update_button_states(self):
         """Update button states"""
@@ -201,172 +250,21 @@ class SimpleModalSelectorGUI:
     
     def exit_program(self):
         """Exit program"""
-        if self.connected:
-            try:
-                self.inst.write('OUTP1 OFF')
-                self.inst.write('OUTP2 OFF')
-                self.inst.write('SOUR2:TRACK OFF')
-                self.inst.close()
-            except:
-                pass
+        self.supervisor.stop()
+        # Stops the outputs and closes the session before the worker ends
+        self.ctl.shutdown(close=self.connected)
         
         self.root.quit()
         self.root.destroy()
-    
-    # Core functionality from original program
-    def load_waveform_with_time(self, filename):
-        """Load waveform file and return time and value data"""
-        times = []
-        values = []
-        
-        with open(filename, 'r') as f:
-            reader = csv.reader(f, delimiter=' ')
-            for t, p in reader:
-                times.append(float(t))
-                values.append(float(p))
-        
-        return np.array(times), np.array(values)
-    
-    def align_waveforms(self, file1, file2, invert_ch2=True):
-        """Load and align two waveform files"""
-        times1, values1 = self.load_waveform_with_time(file1)
-        times2, values2 = self.load_waveform_with_time(file2)
-        
-        # Find common time range
-        t_start = max(times1[0], times2[0])
-        t_end = min(times1[-1], times2[-1])
-        
-        # Calculate unified sampling rate
-        dt1 = np.mean(np.diff(times1))
-        dt2 = np.mean(np.diff(times2))
-        dt_unified = min(dt1, dt2)
-        
-        # Create unified time axis
-        unified_times = np.arange(t_start, t_end + dt_unified, dt_unified)
-        
-        # Interpolate to unified time axis
-        aligned_values1 = np.interp(unified_times, times1, values1)
-        aligned_values2 = np.interp(unified_times, times2, values2)
-        
-        # Normalize signals
-        aligned_values1 = aligned_values1 / max(np.abs(aligned_values1))
-        aligned_values2 = aligned_values2 / max(np.abs(aligned_values2))
-        
-        # Invert Channel 2 if needed
-        if invert_ch2:
-            aligned_values2 = -aligned_values2
-        
-        # Calculate sampling rate
-        sRate = str(1 / dt_unified)
-        
-        return (aligned_values1.astype('f4'), aligned_values2.astype('f4'), 
-                sRate, len(unified_times), unified_times)
-    
-    def setup_sync_internal(self):
-        """Setup Sync Internal (Track On) functionality"""
-        self.inst.write('SOUR1:TRACK OFF')
-        self.inst.write('SOUR2:TRACK OFF')
-        self.inst.write('SOUR2:TRACK ON')
-        self.inst.write('*WAI')
-    
-    def run_mode(self, mode_num):
-        """Execute specified mode waveform output"""
-        
-        # Select waveform files and polarity settings based on mode
-        if mode_num == 1:  # Forward
-            file1 = 'modal/25k_50k_84p88deg_2000pts.dat'
-            file2 = 'modal/25k_50k_264p88deg_2000pts.dat'
-            ch1_polarity = 'NORM'
-            ch2_polarity = 'INV'
-        elif mode_num == 2:  # Right
-            file1 = 'modal/47k_94k_57p32deg_2000pts.dat'
-            file2 = 'modal/47k_94k_237p32deg_2000pts.dat'
-            ch1_polarity = 'NORM'
-            ch2_polarity = 'INV'
-        elif mode_num == 3:  # Backward
-            file1 = 'modal/25k_50k_84p88deg_2000pts.dat'
-            file2 = 'modal/25k_50k_264p88deg_2000pts.dat'
-            ch1_polarity = 'INV'
-            ch2_polarity = 'NORM'
-        else:  # mode_num == 4, Left
-            file1 = 'modal/47k_94k_57p32deg_2000pts.dat'
-            file2 = 'modal/47k_94k_237p32deg_2000pts.dat'
-            ch1_polarity = 'INV'
-            ch2_polarity = 'NORM'
-        
-        # Turn off outputs
-        self.inst.write('OUTP1 OFF')
-        self.inst.write('OUTP2 OFF')
-        
-        # Turn off tracking function
-        self.inst.write('SOUR2:TRACK OFF')
-        self.inst.write('*WAI')
-        
-        # Load and align waveforms
-        sig1, sig2, sRate, points, unified_times = self.align_waveforms(file1, file2, invert_ch2=True)
-        
-        # Upload Channel 1 waveform
-        self.inst.write('SOUR1:DATA:VOL:CLE')
-        self.inst.write_binary_values('SOUR1:DATA:ARB MODAL_84DEG,', sig1, datatype='f', is_big_endian=False)
-        self.inst.write('*WAI')
-        self.inst.write('MMEM:STOR:DATA "INT:\\remoteAdded\\MODAL_84DEG.arb"')
-        
-        # Upload Channel 2 waveform
-        self.inst.write('SOUR2:DATA:VOL:CLE')
-        self.inst.write_binary_values('SOUR2:DATA:ARB MODAL_264DEG,', sig2, datatype='f', is_big_endian=False)
-        self.inst.write('*WAI')
-        self.inst.write('MMEM:STOR:DATA "INT:\\remoteAdded\\MODAL_264DEG.arb"')
-        
-        # Configure dual channel parameters
-        # Configure Channel 1
-        self.inst.write('SOUR1:FUNC ARB')
-        self.inst.write('SOUR1:FUNC:ARB MODAL_84DEG')
-        self.inst.write('SOUR1:FUNC:ARB:SRAT ' + sRate)
-        self.inst.write('SOUR1:VOLT 0.8')
-        self.inst.write('SOUR1:VOLT:OFFS 0')
-        
-        # Configure Channel 2
-        self.inst.write('SOUR2:FUNC ARB')
-        self.inst.write('SOUR2:FUNC:ARB MODAL_264DEG')
-        self.inst.write('SOUR2:FUNC:ARB:SRAT ' + sRate)
-        self.inst.write('SOUR2:VOLT 1.8')
-        self.inst.write('SOUR2:VOLT:OFFS 0')
-        
-        # Set basic frequency and phase
-        freq = float(sRate) / points
-        self.inst.write(f'SOUR1:FREQ {freq}')
-        self.inst.write(f'SOUR2:FREQ {freq}')
-        self.inst.write('SOUR1:PHAS 0')
-        self.inst.write('SOUR2:PHAS 0')
-        self.inst.write('*WAI')
-        
-        # Setup Sync Internal (Track On)
-        self.setup_sync_internal()
-        
-        # Synchronize Channel 2 phase to Channel 1
-        self.inst.write('SOUR2:PHAS:SYNC')
-        self.inst.write('SOUR2:PHAS 0')
-        self.inst.write('*WAI')
-        
-        # Set channel polarity based on mode
-        self.inst.write(f'OUTP1:POL {ch1_polarity}')
-        self.inst.write(f'OUTP2:POL {ch2_polarity}')
-        
-        # Setup sync output
-        self.inst.write('OUTP:SYNC ON')
-        self.inst.write('OUTP:SYNC:SOURCE CH1')
-        self.inst.write('OUTP:SYNC:MODE MARK')
-        
-        # Enable both channel outputs
-        self.inst.write('OUTP1 ON')
-        self.inst.write('OUTP2 ON')
-        self.inst.write('*WAI')
-        
-        return freq
 
 def main():
+    parser = argparse.ArgumentParser(description="Dual Modal Selector")
+    parser.add_argument('--dac', action='store_true', help='upload int16 DAC codes instead of float32')
+    parser.add_argument('--dither', action='store_true', help='dither the DAC codes')
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = SimpleModalSelectorGUI(root)
+    app = SimpleModalSelectorGUI(root, args.dac, args.dither)
     
     # Set close event
     root.protocol("WM_DELETE_WINDOW", app.exit_program)
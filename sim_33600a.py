@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+"""Offline Keysight 33600A stand-in for benchmarks and tests
+
+Models per-channel arb volatile memory, IEEE 488.2 binary block parsing for
+DATA:ARB and DATA:SEQ, MMEM arb storage, Track/phase state, the error queue, and per-command
+and per-byte latency. Use it in-process through SimulatedResourceManager (a
+drop-in for pyvisa.ResourceManager) or as a SCPI socket server on port 5025:
+
+    python sim_33600a.py --port 5025
+"""
+
+import argparse
+import re
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+IDN = 'Keysight Technologies,33622A,SIM0000001,A.02.03-3.15-03.64-52.44-02'
+SIM_RESOURCE = 'USB0::0x0957::0x5707::SIM0000001::0::INSTR'
+
+# Long-form SCPI keywords mapped to the short forms used by the scripts
+KEYWORDS = {
+    'SOURCE': 'SOUR', 'OUTPUT': 'OUTP', 'FUNCTION': 'FUNC', 'VOLTAGE': 'VOLT', 'OFFSET': 'OFFS',
+    'FREQUENCY': 'FREQ', 'PHASE': 'PHAS', 'TRAC': 'TRACK', 'MMEMORY': 'MMEM', 'POLARITY': 'POL',
+    'SRATE': 'SRAT', 'DISPLAY': 'DISP', 'SEQUENCE': 'SEQ', 'VOLATILE': 'VOL', 'CLEAR': 'CLE',
+    'CATALOG': 'CAT', 'STORE': 'STOR', 'SYSTEM': 'SYST', 'ERROR': 'ERR', 'SYNCHRONIZE': 'SYNC',
+    'TRIGGER': 'TRIG', 'ARBITRARY': 'ARB', 'FORMAT': 'FORM', 'BORDER': 'BORD', 'MODE': 'MODE',
+    'DELETE': 'DEL',
+}
+# Subsystems that belong to SOURce[1|2] when the SOURce node is omitted
+SOURCE_SUBSYSTEMS = {'FUNC', 'VOLT', 'FREQ', 'PHAS', 'TRACK', 'DATA', 'BURS', 'APPL', 'AM', 'FM', 'SWE'}
+# *RST values of the settings the scripts read back (canonical headers)
+DEFAULTS = {
+    'OUTP1': 'OFF', 'OUTP2': 'OFF', 'OUTP1:POL': 'NORM', 'OUTP2:POL': 'NORM',
+    'OUTP:SYNC': 'ON', 'OUTP:SYNC:SOUR': 'CH1', 'OUTP:SYNC:MODE': 'NORM',
+}
+CHANNEL_DEFAULTS = {
+    'FUNC': 'SIN', 'FUNC:ARB': '"INT:\\BUILTIN\\EXP_RISE.ARB"', 'FUNC:ARB:SRAT': '+4.00000000000000E+04',
+    'FREQ': '+1.00000000000000E+03', 'VOLT': '+1.00000000000000E-01', 'VOLT:OFFS': '+0.00000000000000E+00',
+    'PHAS': '+0.00000000000000E+00', 'TRACK': 'OFF',
+}
+DEFAULTS.update({f'SOUR{ch}:{header}': value for ch in (1, 2) for header, value in CHANNEL_DEFAULTS.items()})
+ARB_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_]{0,11}$')
+SEQ_PLAY = {'ONCE', 'ONCEWAITTRIG', 'REPEAT', 'REPEATINF', 'REPEATTILTRIG'}
+SEQ_MARKER = {'MAINTAIN', 'LOWATSTART', 'HIGHATSTART', 'HIGHATSTARTGOLOW'}
+# Shortest arb the 33600A accepts
+ARB_MIN_POINTS = 32
+
+
+def canonical_header(header):
+    """Return the canonical short-form header, e.g. 'SOURce1:FUNCtion:ARB' -> 'SOUR1:FUNC:ARB'"""
+    parts = []
+    for keyword in header.upper().strip(':').split(':'):
+        match = re.match(r'^([A-Z*]+)(\d*)$', keyword)
+        if match:
+            keyword = KEYWORDS.get(match.group(1), match.group(1)) + match.group(2)
+        parts.append(keyword)
+    if parts[0] == 'SOUR':
+        parts[0] = 'SOUR1'
+    elif parts[0] in SOURCE_SUBSYSTEMS:
+        parts.insert(0, 'SOUR1')
+    elif parts[0] == 'OUTP' and (len(parts) == 1 or parts[1] == 'POL'):
+        parts[0] = 'OUTP1'
+    return ':'.join(parts)
+
+
+def split_commands(message):
+    """Split a program message (bytes) at ';' outside quotes and binary blocks"""
+    commands = []
+    start = 0
+    i = 0
+    quote = None
+    n = len(message)
+    while i < n:
+        c = message[i:i + 1]
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in (b'"', b"'"):
+            quote = c
+        elif c == b'#' and i + 1 < n and message[i + 1:i + 2].isdigit():
+            digits = int(message[i + 1:i + 2])
+            if digits == 0:
+                # Indefinite-length block runs to the end of the message
+                i = n
+                continue
+            length = int(message[i + 2:i + 2 + digits])
+            i += 2 + digits + length
+            continue
+        elif c == b';':
+            commands.append(message[start:i])
+            start = i + 1
+        i += 1
+    commands.append(message[start:])
+    return [command.strip() for command in commands if command.strip()]
+
+
+def parse_block(data):
+    """Return the payload of an IEEE 488.2 definite-length binary block"""
+    if not data.startswith(b'#'):
+        raise ValueError('Expected binary block')
+    digits = int(data[1:2])
+    if digits == 0:
+        return data[2:].rstrip(b'\n')
+    length = int(data[2:2 + digits])
+    payload = data[2 + digits:2 + digits + length]
+    if len(payload) != length:
+        raise ValueError('Truncated binary block')
+    return payload
+
+
+class SCPIError(Exception):
+    """An error pushed onto the simulated instrument's error queue"""
+
+    def __init__(self, code, message):
+        super().__init__(f'{code:+d},"{message}"')
+        self.code = code
+        self.message = message
+
+
+class Simulated33600A:
+    """Instrument state machine: feed complete program messages to handle()"""
+
+    def __init__(self, idn=IDN, command_latency=0.0, byte_latency=0.0, flash_byte_latency=0.0,
+                 arb_memory=4_000_000, message_latency=0.0):
+        self.idn = idn
+        # message_latency is paid once per program message (USB transaction),
+        # command_latency once per command in it
+        self.message_latency = message_latency
+        self.command_latency = command_latency
+        self.byte_latency = byte_latency
+        self.flash_byte_latency = flash_byte_latency
+        self.arb_memory = arb_memory
+        self.lock = threading.Lock()
+        # Sessions opened before the link dropped stay dead after it comes back
+        self.link = 0
+        self.plugged = True
+        self.reset()
+        # Flash storage survives *RST and reconnects: path -> float samples
+        self.files = {}
+        self.stats = {'messages': 0, 'commands': 0, 'bytes': 0, 'flash_writes': 0}
+
+    def reset(self):
+        """*RST: restore default settings and clear volatile memory"""
+        self.settings = dict(DEFAULTS)
+        self.volatile = {1: {}, 2: {}}
+        # channel -> {sequence name: [(arb, repeat, play, marker mode, marker point)]}
+        self.sequences = {1: {}, 2: {}}
+        self.errors = []
+        self.big_endian = True
+        self.esr = 0
+        self.ese = 0
+        self.phase_syncs = 0
+
+    def unplug(self):
+        """Drop the USB link: every open session fails, new ones cannot be opened"""
+        self.plugged = False
+        self.link += 1
+
+    def replug(self):
+        self.plugged = True
+
+    def power_cycle(self):
+        """Turn the instrument off and on: volatile memory and settings are lost, flash files kept"""
+        with self.lock:
+            self.reset()
+            self.link += 1
+
+    # Message handling
+
+    def handle(self, message):
+        """Execute one program message (bytes); returns the response bytes or None"""
+        if isinstance(message, str):
+            message = message.encode('latin-1')
+        with self.lock:
+            self.stats['messages'] += 1
+            self.stats['bytes'] += len(message)
+            time.sleep(self.message_latency + self.byte_latency * len(message))
+            responses = []
+            path = ''
+            for command in split_commands(message.rstrip(b'\r\n')):
+                self.stats['commands'] += 1
+                time.sleep(self.command_latency)
+                header, _, args = command.partition(b' ')
+                header = header.decode('latin-1')
+                if header.startswith(':'):
+                    header = header[1:]
+                elif not header.startswith('*') and path:
+                    header = path + header
+                if not header.startswith('*') and ':' in header:
+                    path = header.rsplit(':', 1)[0] + ':'
+                try:
+                    response = self.execute(header, args.strip())
+                except SCPIError as e:
+                    self.push_error(e.code, e.message)
+                    response = None
+                if response is not None:
+                    responses.append(response)
+            if responses:
+                return (';'.join(responses) + '\n').encode('latin-1')
+            return None
+
+    def push_error(self, code, message):
+        self.errors.append(f'{code:+d},"{message}"')
+        # ESR bit 5: command error (-1xx), bit 4: execution error
+        self.esr |= 0x20 if -200 < code <= -100 else 0x10
+
+    def execute(self, header, args):
+        """Execute one command; args is bytes (binary blocks are kept intact)"""
+        query = header.endswith('?')
+        canon = canonical_header(header.rstrip('?'))
+        # Binary data commands keep their raw bytes; everything else is text
+        text = None if re.match(r'SOUR[12]:DATA:(ARB|SEQ)', canon) else args.decode('latin-1')
+
+        if canon.startswith('*'):
+            return self.common(canon, query, text)
+        handler = self.special(canon, query)
+        if handler is not None:
+            return handler(canon, args if text is None else text)
+        if query:
+            if canon not in self.settings:
+                raise SCPIError(-113, 'Undefined header')
+            value = self.settings[canon]
+            return {'ON': '1', 'OFF': '0'}.get(value, value)
+        self.settings[canon] = text.strip().upper() if text and not text.strip().startswith('"') else text
+        return None
+
+    def common(self, canon, query, text):
+        if canon == '*IDN':
+            return self.idn
+        if canon == '*RST':
+            self.reset()
+        elif canon == '*CLS':
+            self.errors.clear()
+            self.esr = 0
+        elif canon == '*OPC':
+            if query:
+                return '1'
+            self.esr |= 0x01
+        elif canon == '*ESR':
+            value, self.esr = self.esr, 0
+            return str(value)
+        elif canon == '*ESE':
+            if query:
+                return str(self.ese)
+            self.ese = int(text)
+        elif canon == '*STB':
+            return str(self.status_byte())
+        elif canon in ('*WAI', '*TRG'):
+            pass
+        else:
+            raise SCPIError(-113, 'Undefined header')
+        return None
+
+    def status_byte(self):
+        stb = 0x04 if self.errors else 0
+        if self.esr & self.ese:
+            stb |= 0x20
+        return stb
+
+    def special(self, canon, query):
+        """Return the handler of commands that do more than store a setting"""
+        if canon == 'SYST:ERR' and query:
+            return lambda c, a: self.errors.pop(0) if self.errors else '+0,"No error"'
+        if canon == 'FORM:BORD':
+            return self.format_border
+        if re.match(r'SOUR[12]:DATA:ARB(:DAC)?$', canon):
+            return self.data_arb
+        if re.match(r'SOUR[12]:DATA:SEQ$', canon) and not query:
+            return self.data_seq
+        if re.match(r'SOUR[12]:DATA:VOL:CLE$', canon):
+            return self.volatile_clear
+        if re.match(r'SOUR[12]:DATA:VOL:CAT$', canon) and query:
+            return self.volatile_catalog
+        if re.match(r'SOUR[12]:FUNC:ARB$', canon) and not query:
+            return self.select_arb
+        if re.match(r'SOUR[12]:PHAS:SYNC$', canon):
+            return self.phase_sync
+        if re.match(r'MMEM:STOR:DATA[12]?$', canon):
+            return self.mmem_store
+        if re.match(r'MMEM:LOAD:DATA[12]?$', canon):
+            return self.mmem_load
+        if canon == 'MMEM:CAT:DATA:ARB' and query:
+            return self.mmem_catalog
+        if canon == 'MMEM:DEL' and not query:
+            return self.mmem_delete
+        if canon == 'MMEM:MDIR':
+            return lambda c, a: None
+        if canon == 'DISP:TEXT':
+            return lambda c, a: None
+        return None
+
+    @staticmethod
+    def channel(canon):
+        match = re.search(r'(?:SOUR|DATA)([12])', canon)
+        return int(match.group(1)) if match else 1
+
+    # Command handlers
+
+    def format_border(self, canon, text):
+        self.big_endian = text.strip().upper() in ('NORM', 'NORMAL')
+        self.settings['FORM:BORD'] = 'NORM' if self.big_endian else 'SWAP'
+
+    def data_arb(self, canon, args):
+        name, _, block = args.partition(b',')
+        name = name.decode('latin-1').strip()
+        if not ARB_NAME.match(name):
+            raise SCPIError(-224, 'Illegal parameter value')
+        payload = parse_block(block.strip())
+        if canon.endswith(':DAC'):
+            samples = np.frombuffer(payload, dtype='>i2' if self.big_endian else '<i2') / 32767.0
+        else:
+            samples = np.frombuffer(payload, dtype='>f4' if self.big_endian else '<f4').astype(np.float64)
+        self.load_volatile(self.channel(canon), name, samples)
+
+    def data_seq(self, canon, args):
+        payload = parse_block(args.strip()).decode('latin-1')
+        fields = [field.strip() for field in re.findall(r'"[^"]*"|[^,]+', payload)]
+        if len(fields) < 6 or (len(fields) - 1) % 5:
+            raise SCPIError(-224, 'Illegal parameter value; sequence needs name and 5 fields per step')
+        name = fields[0].strip('"')
+        if not ARB_NAME.match(name):
+            raise SCPIError(-224, 'Illegal parameter value')
+        channel = self.channel(canon)
+        steps = []
+        for i in range(1, len(fields), 5):
+            arb, repeat, play, marker, point = fields[i:i + 5]
+            arb = arb.strip('"')
+            if arb not in self.volatile[channel]:
+                raise SCPIError(-785, f'Arb waveform not in volatile memory: {arb}')
+            if play.upper() not in SEQ_PLAY or marker.upper() not in SEQ_MARKER:
+                raise SCPIError(-224, 'Illegal parameter value')
+            if not 1 <= int(repeat) <= 1_000_000 or not 0 <= int(point) < len(self.volatile[channel][arb]):
+                raise SCPIError(-222, 'Data out of range')
+            steps.append((arb, int(repeat), play, marker, int(point)))
+        self.sequences[channel][name] = steps
+
+    def sequence_points(self, channel, name):
+        """Return the samples a sequence plays through its deterministic steps (repeat and once)"""
+        total = 0
+        for arb, repeat, play, _, _ in self.sequences[channel][name]:
+            if play.upper() not in ('REPEAT', 'ONCE'):
+                break
+            total += len(self.volatile[channel][arb]) * (repeat if play.upper() == 'REPEAT' else 1)
+        return total
+
+    def load_volatile(self, channel, name, samples):
+        if len(samples) < ARB_MIN_POINTS:
+            raise SCPIError(-222, 'Data out of range; arb too short')
+        if np.any(np.abs(samples) > 1.0 + 1e-6):
+            raise SCPIError(-222, 'Data out of range; values must be between -1 and 1')
+        used = sum(len(s) for n, s in self.volatile[channel].items() if n != name)
+        if used + len(samples) > self.arb_memory:
+            raise SCPIError(-781, 'Not enough memory')
+        self.volatile[channel][name] = np.array(samples, dtype=np.float64)
+
+    def volatile_clear(self, canon, args):
+        channel = self.channel(canon)
+        self.volatile[channel].clear()
+        self.sequences[channel].clear()
+        self.settings[f'SOUR{channel}:FUNC:ARB'] = DEFAULTS[f'SOUR{channel}:FUNC:ARB']
+
+    def volatile_catalog(self, canon, args):
+        return ','.join(f'"{name}"' for name in self.volatile[self.channel(canon)])
+
+    def select_arb(self, canon, text):
+        name = text.strip().strip('"')
+        channel = self.channel(canon)
+        if name not in self.volatile[channel] and name not in self.sequences[channel]:
+            raise SCPIError(-785, 'Arb waveform not in volatile memory')
+        self.settings[canon] = name
+
+    def phase_sync(self, canon, args):
+        self.phase_syncs += 1
+
+    def mmem_store(self, canon, text):
+        channel = int(canon[-1]) if canon[-1].isdigit() else 1
+        name = self.settings.get(f'SOUR{channel}:FUNC:ARB')
+        if name is None or name not in self.volatile[channel]:
+            raise SCPIError(-256, 'No arb selected to store')
+        samples = self.volatile[channel][name]
+        time.sleep(self.flash_byte_latency * 4 * len(samples))
+        self.files[text.strip().strip('"')] = samples.copy()
+        self.stats['flash_writes'] += 1
+
+    def mmem_load(self, canon, text):
+        channel = int(canon[-1]) if canon[-1].isdigit() else 1
+        path = text.strip().strip('"')
+        if path not in self.files:
+            raise SCPIError(-256, 'File name not found')
+        self.load_volatile(channel, path, self.files[path])
+
+    def mmem_delete(self, canon, text):
+        path = text.strip().strip('"')
+        if path not in self.files:
+            raise SCPIError(-256, 'File name not found')
+        del self.files[path]
+
+    def mmem_catalog(self, canon, text):
+        folder = text.strip().strip('"').rstrip('\\') + '\\'
+        entries = [f'"{path[len(folder):]},ARB,{4 * len(samples)}"'
+                   for path, samples in self.files.items()
+                   if path.startswith(folder) and '\\' not in path[len(folder):]]
+        used = sum(4 * len(samples) for samples in self.files.values())
+        return ','.join([str(used), str(64_000_000 - used)] + entries)
+
+
+class SimulatedSession:
+    """pyvisa Resource stand-in connected to a Simulated33600A"""
+
+    def __init__(self, instrument, resource_name=SIM_RESOURCE):
+        self.instrument = instrument
+        self.resource_name = resource_name
+        self.link = instrument.link
+        self.timeout = 2000
+        self.send_end = True
+        self.read_termination = None
+        self.write_termination = '\n'
+        self._pending = b''
+        self._output = []
+
+    def control_ren(self, mode):
+        pass
+
+    def _check_link(self):
+        if not self.instrument.plugged or self.link != self.instrument.link:
+            raise ConnectionError(f'VI_ERROR_CONN_LOST: {self.resource_name}')
+
+    def read_stb(self):
+        self._check_link()
+        return self.instrument.status_byte()
+
+    def clear(self):
+        """Device clear: drop partial input and pending output"""
+        self._pending = b''
+        self._output = []
+
+    def write_raw(self, message):
+        # Like USBTMC, the message is only complete once END is sent
+        self._check_link()
+        self._pending += message
+        if self.send_end:
+            message, self._pending = self._pending, b''
+            response = self.instrument.handle(message)
+            if response is not None:
+                self._output.append(response)
+        return len(message)
+
+    def write(self, message, termination=None, encoding=None):
+        return self.write_raw((message + (termination or self.write_termination)).encode('latin-1'))
+
+    def write_binary_values(self, message, values, datatype='f', is_big_endian=False, termination=None,
+                            encoding=None, header_fmt='ieee'):
+        dtype = np.dtype(datatype).newbyteorder('>' if is_big_endian else '<')
+        payload = np.asarray(values, dtype=dtype).tobytes()
+        length = str(len(payload))
+        block = f'#{len(length)}{length}'.encode('ascii') + payload
+        return self.write_raw(message.encode('latin-1') + block + (termination or self.write_termination).encode())
+
+    def read_raw(self, size=None):
+        self._check_link()
+        if not self._output:
+            raise TimeoutError('VI_ERROR_TMO: no response pending')
+        return self._output.pop(0)
+
+    def read(self, termination=None, encoding=None):
+        return self.read_raw().decode('latin-1').rstrip('\n')
+
+    def query(self, message, delay=None):
+        self.write(message)
+        return self.read()
+
+    def close(self):
+        self.clear()
+
+
+class SimulatedResourceManager:
+    """pyvisa ResourceManager stand-in serving simulated instruments by resource name"""
+
+    def __init__(self, instruments=None, **latency):
+        # resource name -> Simulated33600A; one instrument by default
+        self.instruments = instruments or {SIM_RESOURCE: Simulated33600A(**latency)}
+
+    @classmethod
+    def with_instruments(cls, count, **latency):
+        """A resource manager serving count simulated instruments with distinct serials"""
+        instruments = {}
+        for i in range(1, count + 1):
+            serial = f'SIM{i:07d}'
+            idn = IDN.replace('SIM0000001', serial)
+            instruments[f'USB0::0x0957::0x5707::{serial}::0::INSTR'] = Simulated33600A(idn, **latency)
+        return cls(instruments)
+
+    def list_resources(self, query='?*::INSTR'):
+        # VISA '?*' matches any run of characters, '?' any one
+        pattern = re.escape(query).replace(r'\?\*', '.*').replace(r'\?', '.')
+        return tuple(r for r in self.instruments if re.fullmatch(pattern, r, re.IGNORECASE))
+
+    def open_resource(self, resource_name, **kwargs):
+        if resource_name not in self.instruments:
+            raise ValueError(f'No simulated instrument at {resource_name}')
+        if not self.instruments[resource_name].plugged:
+            raise ConnectionError(f'VI_ERROR_RSRC_NFOUND: {resource_name}')
+        session = SimulatedSession(self.instruments[resource_name], resource_name)
+        for key, value in kwargs.items():
+            setattr(session, key, value)
+        return session
+
+    def close(self):
+        pass
+
+
+class _SCPIHandler(socketserver.BaseRequestHandler):
+    """Raw socket SCPI: newline-terminated messages, binary blocks passed through"""
+
+    def handle(self):
+        buffer = b''
+        while True:
+            data = self.request.recv(1 << 16)
+            if not data:
+                return
+            buffer += data
+            while True:
+                end = self._message_end(buffer)
+                if end is None:
+                    break
+                message, buffer = buffer[:end], buffer[end + 1:]
+                response = self.server.instrument.handle(message)
+                if response is not None:
+                    self.request.sendall(response)
+
+    @staticmethod
+    def _message_end(buffer):
+        """Index of the newline ending the first complete message, skipping binary blocks"""
+        i = 0
+        while i < len(buffer):
+            c = buffer[i:i + 1]
+            if c == b'#' and i + 1 < len(buffer) and buffer[i + 1:i + 2].isdigit():
+                digits = int(buffer[i + 1:i + 2])
+                if i + 2 + digits > len(buffer):
+                    return None
+                length = int(buffer[i + 2:i + 2 + digits] or 0)
+                i += 2 + digits + length
+                continue
+            if c == b'\n':
+                return i
+            i += 1
+        return None
+
+
+def serve(instrument, host='127.0.0.1', port=5025):
+    """Serve a simulated instrument as a raw SCPI socket (TCPIP::host::port::SOCKET)"""
+    server = socketserver.ThreadingTCPServer((host, port), _SCPIHandler)
+    server.daemon_threads = True
+    server.allow_reuse_address = True
+    server.instrument = instrument
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5025)
+    parser.add_argument('--message-latency', type=float, default=0.0, help='seconds per program message')
+    parser.add_argument('--command-latency', type=float, default=0.0, help='seconds per SCPI command')
+    parser.add_argument('--byte-latency', type=float, default=0.0, help='seconds per received byte')
+    parser.add_argument('--flash-byte-latency', type=float, default=0.0, help='seconds per byte stored to flash')
+    args = parser.parse_args()
+
+    instrument = Simulated33600A(message_latency=args.message_latency, command_latency=args.command_latency,
+                                 byte_latency=args.byte_latency,
+                                 flash_byte_latency=args.flash_byte_latency)
+    server = serve(instrument, args.host, args.port)
+    print(f"Simulated 33600A listening on TCPIP::{args.host}::{args.port}::SOCKET")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import threading
+
+# Seconds between health checks, and for one *STB? reply at most
+CHECK_INTERVAL = 2.0
+PING_TIMEOUT = 1.0
+
+
+class SessionSupervisor:
+    """Keep a Keysight33600A session alive: periodic *STB? health check, reconnect on failure
+
+    A background thread pings the instrument every interval seconds. The
+    check is skipped while another call holds the driver lock, since that
+    call talks to the instrument anyway. When the ping fails, the driver's
+    reconnect() is retried every interval until it succeeds; it restores the
+    running mode and re-loads only the arbs the instrument lost. state is
+    'ok', 'lost' or 'reconnecting'; on_change(state) is called from the
+    supervisor thread whenever it changes.
+    """
+
+    def __init__(self, awg, interval=CHECK_INTERVAL, ping_timeout=PING_TIMEOUT, on_change=None):
+        self.awg = awg
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.on_change = on_change
+        self.state = 'ok'
+        self.checks = 0
+        self.reconnects = 0
+        self.last_error = None
+        # {channel: [arb names]} re-loaded by the last reconnect
+        self.last_restore = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-supervisor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check_now(self):
+        """Run the next health check right away, e.g. after a call failed"""
+        self._wake.set()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if self.on_change is not None:
+                self.on_change(state)
+
+    def check(self):
+        """Ping the instrument unless it is busy; returns False if the session is dead"""
+        if not self.awg.connected or not self.awg.lock.acquire(blocking=False):
+            return True
+        try:
+            self.checks += 1
+            self.awg.ping(self.ping_timeout)
+            return True
+        except Exception as e:
+            self.last_error = f'{type(e).__name__}: {e}'
+            return False
+        finally:
+            self.awg.lock.release()
+
+    def recover(self):
+        """Reconnect and restore state; returns True on success"""
+        self._set_state('reconnecting')
+        try:
+            self.last_restore = self.awg.reconnect()
+        except Exception as e:
+            self.last_error = f'{type(e).__name__}: {e}'
+            self._set_state('lost')
+            return False
+        self.reconnects += 1
+        self._set_state('ok')
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            # After a failed reconnect, the next attempt is one interval later
+            if self.state == 'ok' and self.check():
+                continue
+            self.recover()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+from functools import partial
+
+# The arb cache, flash manifest and discovery cache default to ~/.keysight33600a;
+# point HOME elsewhere before the modules read it
+os.environ['HOME'] = tempfile.mkdtemp(prefix='keysight33600a-tests-')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import pytest  # noqa: E402
+
+import keysight_33600a  # noqa: E402
+from arb_cache import ArbCache  # noqa: E402
+from arb_store import ArbStore  # noqa: E402
+from keysight_33600a import Keysight33600A  # noqa: E402
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager  # noqa: E402
+
+
+@pytest.fixture
+def make_awg(tmp_path, monkeypatch):
+    """Return a factory of connected drivers on a simulated instrument; every one is closed afterwards
+
+    The drivers of one test share a flash manifest, as processes on one host do.
+    """
+    monkeypatch.setattr(keysight_33600a, 'ArbStore', partial(ArbStore, manifest_path=str(tmp_path / 'manifest.json')))
+    awgs = []
+
+    def make(rm=None, resource=SIM_RESOURCE, arb_cache=None, **kwargs):
+        rm = rm or SimulatedResourceManager()
+        arb_cache = arb_cache or ArbCache(str(tmp_path / f'cache{len(awgs)}'))
+        awg = Keysight33600A(resource, rm=rm, arb_cache=arb_cache, **kwargs)
+        awgs.append(awg)
+        awg.connect()
+        return awg
+
+    yield make
+    for awg in awgs:
+        if awg.connected:
+            awg.close()
+
+
+@pytest.fixture
+def awg(make_awg):
+    """A connected driver with the mode table preloaded"""
+    awg = make_awg()
+    awg.preload()
+    return awg
+
+
+@pytest.fixture
+def sim(awg):
+    return awg.rm.instruments[SIM_RESOURCE]
@@ -0,0 +1,107 @@
+import os
+import shutil
+
+import numpy as np
+
+from arb_cache import AlignedPairCache, ArbCache
+from keysight_33600a import MODES
+
+FILE1, FILE2 = MODES[1][1:3]
+
+
+def copy_pair(tmp_path):
+    files = []
+    for f in (FILE1, FILE2):
+        files.append(str(tmp_path / os.path.basename(f)))
+        shutil.copy(f, files[-1])
+    return files
+
+
+def test_build_then_load_memory_mapped(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    result, key, _, built = ArbCache(cache_dir).build_pair(FILE1, FILE2)
+    assert built
+    cached, cached_key, _, built = ArbCache(cache_dir).build_pair(FILE1, FILE2)
+    assert not built and cached_key == key
+    assert isinstance(cached[0], np.memmap)
+    for fresh, loaded in zip(result[:2], cached[:2]):
+        np.testing.assert_array_equal(fresh, loaded)
+    assert cached[2:4] == result[2:4]
+    np.testing.assert_allclose(cached[4], result[4], rtol=0, atol=1e-15)
+
+
+def test_key_follows_content_and_options(tmp_path):
+    cache = ArbCache(str(tmp_path / 'cache'))
+    file1, file2 = copy_pair(tmp_path)
+    key = cache.key((file1, file2), invert_ch2=True, normalize=True)
+    # Same content elsewhere: same key; other options: another key
+    assert cache.key((FILE1, FILE2), invert_ch2=True, normalize=True) == key
+    assert cache.key((file1, file2), invert_ch2=False, normalize=True) != key
+    with open(file2, 'a') as f:
+        f.write('1e-3,0\n')
+    assert cache.key((file1, file2), invert_ch2=True, normalize=True) != key
+
+
+def test_changed_file_replaces_its_entry(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    file1, file2 = copy_pair(tmp_path)
+    _, old_key, _, _ = ArbCache(cache_dir).build_pair(file1, file2)
+    with open(file1) as f:
+        lines = f.readlines()
+    lines[1] = '0,0.5\n'
+    with open(file1, 'w') as f:
+        f.writelines(lines)
+    _, new_key, _, built = ArbCache(cache_dir).build_pair(file1, file2)
+    assert built and new_key != old_key
+    assert not os.path.exists(os.path.join(cache_dir, old_key + '.npy'))
+
+
+def test_corrupt_entry_is_rebuilt(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    _, key, _, _ = ArbCache(cache_dir).build_pair(FILE1, FILE2)
+    with open(os.path.join(cache_dir, key + '.npy'), 'wb') as f:
+        f.write(b'not an array')
+    _, _, _, built = ArbCache(cache_dir).build_pair(FILE1, FILE2)
+    assert built
+
+
+def test_memo_hits_without_preparing(tmp_path):
+    calls = []
+
+    def prepare(file1, file2, **options):
+        calls.append((file1, file2))
+        return np.zeros(4, 'f4'), np.ones(4, 'f4'), '1e6', 4, np.arange(4.0)
+
+    memo = AlignedPairCache(prepare, maxsize=2)
+    file1, file2 = copy_pair(tmp_path)
+    first = memo.get(file1, file2)
+    assert memo.get(file1, file2) is first
+    assert memo.get(file1, file2, invert_ch2=False) is not first
+    assert len(calls) == 2
+    assert not first[0].flags.writeable
+    assert memo.stats() == {'hits': 1, 'misses': 2, 'evictions': 0, 'size': 2, 'maxsize': 2}
+
+
+def test_memo_is_bounded_and_follows_mtime(tmp_path):
+    memo = AlignedPairCache(lambda *files, **options: (np.zeros(1), np.zeros(1), '1', 1, np.zeros(1)), maxsize=2)
+    file1, file2 = copy_pair(tmp_path)
+    memo.get(file1, file2)
+    memo.get(file2, file1)
+    memo.get(file1, file1)
+    assert memo.stats()['evictions'] == 1 and memo.stats()['size'] == 2
+    # A touched file is prepared again
+    stat = os.stat(file1)
+    os.utime(file1, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    memo.get(file1, file1)
+    assert memo.misses == 4
+    # The old and the new entry of the touched file
+    assert memo.evict(file1) == 2
+    assert memo.evict() == 0 and memo.stats()['size'] == 0
+
+
+def test_prepare_pair_uses_memo(tmp_path):
+    cache = ArbCache(str(tmp_path / 'cache'))
+    first = cache.prepare_pair(FILE1, FILE2)
+    assert cache.prepare_pair(FILE1, FILE2) is first
+    assert cache.prepare_pair(FILE1, FILE2, points=500)[3] == 500
+    assert cache.memo.stats()['hits'] == 1
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import arb_compact
+from arb_compact import (compact_loaded, compact_name, compact_pair, minimum_harmonics, peak_errors, rms_errors,
+                         spectrum_of)
+from exact_period import MIN_POINTS
+from keysight_33600a import MODES
+from sim_33600a import SIM_RESOURCE
+
+
+def series(points=2000, freq=25e3, harmonics=60):
+    """One period of a 1/k^2 harmonic series on two channels, 180 degrees apart"""
+    t = np.arange(points) / (points * freq)
+    k = np.arange(1, harmonics + 1, 2)[:, None]
+    v = (np.cos(2 * np.pi * k * freq * t) / k ** 2).sum(axis=0)
+    return [(t, v), (t, -v)]
+
+
+def truncated(signals, k):
+    spectrum = np.fft.rfft(signals, axis=1)
+    spectrum[:, k + 1:] = 0
+    return np.fft.irfft(spectrum, signals.shape[1], axis=1)
+
+
+def test_errors_match_truncated_signals():
+    signals = np.stack([v for _, v in series(points=256)])
+    spectrum, n, scale = spectrum_of(signals)
+    ks = [1, 5, 17, 40]
+    rms = rms_errors(spectrum, n, scale)
+    peak = peak_errors(spectrum, n, scale, ks)
+    for k, peak_k in zip(ks, peak):
+        error = (truncated(signals, k) - signals) / scale[:, None]
+        assert rms[k] == pytest.approx(np.sqrt((error ** 2).mean(axis=1)).max(), rel=1e-9)
+        assert peak_k == pytest.approx(np.abs(error).max(), rel=1e-9)
+
+
+def test_peak_errors_in_small_passes(monkeypatch):
+    signals = np.stack([v for _, v in series(points=256)])
+    spectrum, n, scale = spectrum_of(signals)
+    ks = np.arange(0, 60)
+    whole = peak_errors(spectrum, n, scale, ks)
+    monkeypatch.setattr(arb_compact, 'PEAK_ELEMENTS', spectrum.size * 3)
+    np.testing.assert_array_equal(peak_errors(spectrum, n, scale, ks), whole)
+
+
+def test_minimum_harmonics():
+    t = np.arange(1000) / 1000
+    two_tones = np.stack((np.sin(2 * np.pi * t) + 0.5 * np.sin(4 * np.pi * t), np.cos(4 * np.pi * t)))
+    assert minimum_harmonics(two_tones, rms=1e-9) == 2
+    assert minimum_harmonics(two_tones, peak=1e-9) == 2
+    with pytest.raises(ValueError):
+        minimum_harmonics(two_tones)
+
+
+def test_modal_pair_compacts_to_minimum():
+    sig1, sig2, sRate, points, times, report = compact_pair(*MODES[1][1:3], rms=1e-3)
+    assert points == MIN_POINTS and len(sig1) == len(sig2) == len(times) == points
+    assert float(sRate) == pytest.approx(25e3 * points)
+    assert report['within_budget'] and report['harmonics'] == 2
+    assert report['reduction'] == pytest.approx(2000 / MIN_POINTS)
+
+
+def test_tighter_budget_needs_more_points():
+    reports = [compact_loaded(series(), [False, True], rms=rms)[4] for rms in (1e-2, 1e-3, 1e-4)]
+    assert [r['points'] for r in reports] == sorted(r['points'] for r in reports)
+    assert reports[0]['points'] < reports[-1]['points']
+    assert all(r['within_budget'] for r in reports)
+    peak = compact_loaded(series(), [False, True], peak=1e-4)[4]
+    assert peak['peak_error'] <= 1e-4
+
+
+def test_compact_name():
+    assert compact_name('modal/ONEPERIOD_A_25k_50k_84p88deg_2000pts.csv', 32) == \
+        'ONEPERIOD_A_25k_50k_84p88deg_32pts.csv'
+    assert compact_name('wave.dat', 64) == 'wave_64pts.dat'
+
+
+def test_driver_uploads_compact_arbs(make_awg):
+    awg = make_awg(arb_rms_error=1e-3)
+    awg.preload()
+    sim = awg.rm.instruments[SIM_RESOURCE]
+    assert all(len(samples) == MIN_POINTS for channel in sim.volatile.values() for samples in channel.values())
+    freq, _ = awg.select_mode(2)
+    assert freq == pytest.approx(47e3)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from arb_quantize import DAC_MAX, iter_dac_chunks, quantization_report, quantize_dac, worst_report
+from arb_stream import upload_arb
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+
+def test_quantize_clips_and_rounds():
+    codes = quantize_dac(np.array([-2.0, -1.0, 0.0, 0.5 / DAC_MAX * 0.9, 1.0, 1.5]))
+    assert codes.dtype == np.int16
+    assert codes.tolist() == [-DAC_MAX, -DAC_MAX, 0, 0, DAC_MAX, DAC_MAX]
+
+
+def test_dither_is_repeatable_across_chunks():
+    samples = np.sin(np.linspace(0, 2 * np.pi, 10000, endpoint=False))
+    first = np.concatenate(list(iter_dac_chunks(samples, dither=True, chunk_points=1000)))
+    again = np.concatenate(list(iter_dac_chunks(samples, dither=True, chunk_points=1000)))
+    np.testing.assert_array_equal(first, again)
+    # Within one LSB of plain rounding, plus the rounding itself
+    assert np.abs(first / DAC_MAX - samples).max() <= 1.5 / DAC_MAX
+
+
+def test_report_against_float_path():
+    report = quantization_report(np.array([-1.5, -0.5, 0.0, 0.5, 1.5]))
+    assert report['clipped'] == 2
+    assert report['bytes'] * 2 == report['float_bytes']
+    inside = quantization_report(np.linspace(-1, 1, 2401))
+    assert inside['clipped'] == 0
+    assert inside['peak_error'] <= 0.5 / DAC_MAX + 1e-12
+    assert inside['extra_rms_error'] == pytest.approx(0, abs=1e-6)
+
+
+def test_worst_report():
+    reports = [quantization_report(np.linspace(-1, 1, 100)), quantization_report(np.linspace(-2, 2, 100))]
+    worst = worst_report(reports)
+    assert worst['arbs'] == 2
+    assert worst['peak_error'] == max(report['peak_error'] for report in reports)
+    assert worst['clipped'] == reports[1]['clipped']
+    assert worst_report([]) is None
+
+
+def test_driver_dac_upload_reports_quantization(make_awg):
+    awg = make_awg(dac=True)
+    assert awg.quantization() is None
+    awg.preload()
+    sim = awg.rm.instruments[SIM_RESOURCE]
+    report = awg.quantization()
+    assert report['arbs'] == 4 and report['clipped'] == 0
+    assert report['peak_error'] <= 0.5 / DAC_MAX + 1e-9
+    awg.select_mode(1)
+    # The instrument holds the codes it was sent
+    file1, file2 = awg.modes[1][1:3]
+    sig1 = awg.align(file1, file2)[0]
+    np.testing.assert_allclose(sim.volatile[1][sim.settings['SOUR1:FUNC:ARB']], sig1, atol=1 / DAC_MAX)
+
+
+def test_float_upload_has_no_report(awg):
+    assert awg.quantization() is None
+
+
+def test_dac_upload_halves_the_bytes():
+    rm = SimulatedResourceManager()
+    inst, sim = rm.open_resource(SIM_RESOURCE), rm.instruments[SIM_RESOURCE]
+    inst.write('FORM:BORD SWAP')
+    samples = np.sin(np.linspace(0, 2 * np.pi, 200_000, endpoint=False)).astype('f4')
+    sent = []
+    for dac in (False, True):
+        before = sim.stats['bytes']
+        upload_arb(inst, 1, 'FLOAT' if not dac else 'CODES', samples, dac=dac)
+        sent.append(sim.stats['bytes'] - before)
+    assert sent[1] < 0.51 * sent[0]
+    np.testing.assert_allclose(sim.volatile[1]['CODES'], samples, atol=0.5 / DAC_MAX + 1e-7)
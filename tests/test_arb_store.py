@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+
+from arb_store import STORE_DIR, ArbStore, arb_hash, arb_name
+from sim_33600a import IDN, SIM_RESOURCE, SimulatedResourceManager
+
+
+def arb(k):
+    return np.sin(np.linspace(0, 2 * np.pi * k, 64, endpoint=False)).astype('f4')
+
+
+def stored_files(sim):
+    return sorted(path.rsplit('\\', 1)[1] for path in sim.files)
+
+
+def connect():
+    rm = SimulatedResourceManager()
+    inst = rm.open_resource(SIM_RESOURCE)
+    inst.write('FORM:BORD SWAP')
+    return inst, rm.instruments[SIM_RESOURCE]
+
+
+def test_ensure_writes_flash_once(tmp_path):
+    inst, sim = connect()
+    manifest = str(tmp_path / 'manifest.json')
+    store = ArbStore(IDN, manifest)
+    name = store.ensure(inst, 1, arb(1))
+    assert name == arb_name(arb_hash(arb(1)))
+    # A later session loads it from flash
+    path = ArbStore(IDN, manifest).ensure(inst, 2, arb(1))
+    assert path == f'"{STORE_DIR}\\{name}.arb"'
+    assert sim.stats['flash_writes'] == 1 and sim.errors == []
+
+
+def test_reconcile_drops_missing_files(tmp_path):
+    inst, sim = connect()
+    store = ArbStore(IDN, str(tmp_path / 'manifest.json'))
+    store.ensure(inst, 1, arb(1))
+    sim.files.clear()
+    assert store.reconcile(inst) == [arb_hash(arb(1))]
+    assert not store.is_stored(arb_hash(arb(1)))
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    inst, sim = connect()
+    manifest = str(tmp_path / 'manifest.json')
+    first = ArbStore(IDN, manifest, max_files=2)
+    names = [first.ensure(inst, 1, arb(k)) for k in (1, 2, 3)]
+    # Arbs a store has used are never evicted by it
+    assert stored_files(sim) == sorted(f'{name}.arb' for name in names)
+    # Next session: arb 1 is used again, so 2 and 3 are the oldest
+    store = ArbStore(IDN, manifest, max_files=2)
+    store.ensure(inst, 1, arb(1))
+    name4 = store.ensure(inst, 1, arb(4))
+    assert stored_files(sim) == sorted([f'{names[0]}.arb', f'{name4}.arb'])
+    assert sim.errors == []
+    with open(manifest) as f:
+        saved = json.load(f)
+    instrument = store.instrument
+    assert sorted(saved[instrument].values()) == sorted([names[0], name4])
+    assert sorted(saved['last_used'][instrument]) == sorted(saved[instrument])
+
+
+def test_manifest_without_last_use_times(tmp_path):
+    inst, sim = connect()
+    manifest = str(tmp_path / 'manifest.json')
+    old = ArbStore(IDN, manifest, max_files=None)
+    old.ensure(inst, 1, arb(1))
+    with open(manifest) as f:
+        saved = json.load(f)
+    del saved['last_used']
+    with open(manifest, 'w') as f:
+        json.dump(saved, f)
+    store = ArbStore(IDN, manifest, max_files=1)
+    store.ensure(inst, 1, arb(2))
+    assert not store.is_stored(arb_hash(arb(1)))
+    assert len(sim.files) == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from completion import CompletionTimeout, ESR_OPC, STB_ESB, wait_complete
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+
+class BusyInstrument:
+    """Session stand-in whose pending operations finish after a number of status polls"""
+
+    def __init__(self, busy_polls, stb=True):
+        self.busy_polls = busy_polls
+        self.esr = 0
+        self.ese = 0
+        self.armed = False
+        self.timeout = 2000
+        self.polls = 0
+        # Status is polled with the status byte, or with *ESR? without one
+        if stb:
+            self.read_stb = self._read_stb
+
+    def _run(self, message):
+        responses = []
+        for command in message.split(';'):
+            command = command.strip().upper()
+            if command == '*OPC':
+                self.armed = True
+            elif command.startswith('*ESE '):
+                self.ese = int(command[5:])
+            elif command == '*ESR?':
+                responses.append(str(self.esr))
+                self.esr = 0
+            elif command == '*OPC?':
+                if self.busy_polls:
+                    raise TimeoutError('VI_ERROR_TMO')
+                responses.append('1')
+        return responses
+
+    def _poll(self):
+        self.polls += 1
+        if self.armed and self.polls > self.busy_polls:
+            self.esr |= ESR_OPC
+            self.armed = False
+
+    def write(self, message):
+        self._run(message)
+
+    def query(self, message):
+        if message == '*ESR?' and not hasattr(self, 'read_stb'):
+            self._poll()
+        return ';'.join(self._run(message))
+
+    def _read_stb(self):
+        self._poll()
+        return STB_ESB if self.esr & self.ese else 0
+
+
+@pytest.mark.parametrize('stb', [True, False])
+def test_poll_waits_for_operation(stb):
+    inst = BusyInstrument(busy_polls=3, stb=stb)
+    wait_complete(inst, method='poll', poll_interval=0)
+    assert inst.polls == 4
+    assert inst.esr == 0
+
+
+@pytest.mark.parametrize('stb', [True, False])
+def test_poll_ignores_stale_opc_bit(stb):
+    # An earlier *OPC completed but its event was never read
+    inst = BusyInstrument(busy_polls=3, stb=stb)
+    inst.esr = ESR_OPC
+    wait_complete(inst, method='poll', poll_interval=0)
+    assert inst.polls == 4
+
+
+def test_poll_timeout():
+    inst = BusyInstrument(busy_polls=10 ** 9)
+    with pytest.raises(CompletionTimeout):
+        wait_complete(inst, timeout=0.01, method='poll', poll_interval=0.001)
+
+
+def test_opc_timeout_restores_session_timeout():
+    inst = BusyInstrument(busy_polls=1)
+    with pytest.raises(CompletionTimeout):
+        wait_complete(inst, timeout=0.5)
+    assert inst.timeout == 2000
+
+
+@pytest.mark.parametrize('method', ['opc', 'poll'])
+def test_simulator_completes(method):
+    inst = SimulatedResourceManager().open_resource(SIM_RESOURCE)
+    inst.write('SOUR1:VOLT 1.5')
+    assert wait_complete(inst, method=method) >= 0
+    assert inst.query('*ESR?').strip() == '0'
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        wait_complete(BusyInstrument(0), method='sleep')
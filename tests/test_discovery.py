@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from discovery import DiscoveryError, candidates, discover, idn_matches, load_cached, resolve, usb_ids
+from sim_33600a import SimulatedResourceManager
+
+OTHER = ('ASRL1::INSTR', 'TCPIP0::192.168.1.20::inst0::INSTR', 'GPIB0::10::INSTR')
+
+
+class ListingResourceManager(SimulatedResourceManager):
+    """Simulated units plus resources that list but do not answer; records what is opened"""
+
+    def __init__(self, instruments=None, list_delay=0.0):
+        super().__init__(instruments)
+        self.list_delay = list_delay
+        self.opened = []
+
+    @classmethod
+    def with_instruments(cls, count, list_delay=0.0):
+        rm = cls(SimulatedResourceManager.with_instruments(count).instruments)
+        rm.list_delay = list_delay
+        return rm
+
+    def list_resources(self, query='?*::INSTR'):
+        time.sleep(self.list_delay)
+        real = super().list_resources(query)
+        saved, self.instruments = self.instruments, dict.fromkeys(OTHER)
+        try:
+            other = super().list_resources(query)
+        finally:
+            self.instruments = saved
+        return real + other
+
+    def open_resource(self, resource_name, **kwargs):
+        self.opened.append(resource_name)
+        return super().open_resource(resource_name, **kwargs)
+
+
+def test_usb_ids_and_idn():
+    assert usb_ids('USB0::0x0957::0x5707::MY59001615::0::INSTR') == (0x0957, 0x5707, 'MY59001615')
+    assert usb_ids('TCPIP0::192.168.1.20::inst0::INSTR') is None
+    assert idn_matches('Agilent Technologies,33622A,MY59001615,A.02.03')
+    assert not idn_matches('Agilent Technologies,33622A,MY59001615,A.02.03', serial='MY00000000')
+    assert not idn_matches('Keysight Technologies,34465A,MY1,A.03')
+
+
+def test_serial_ports_are_never_listed_or_probed():
+    rm = ListingResourceManager.with_instruments(2)
+    listed = list(candidates(rm))
+    assert listed[:2] == sorted(rm.instruments)
+    assert 'ASRL1::INSTR' not in listed
+    assert set(listed[2:]) == {'TCPIP0::192.168.1.20::inst0::INSTR', 'GPIB0::10::INSTR'}
+    assert list(candidates(rm, interfaces=('TCPIP',)))[2:] == ['TCPIP0::192.168.1.20::inst0::INSTR']
+
+
+def test_resolve_by_serial_opens_only_that_unit(tmp_path):
+    rm = ListingResourceManager.with_instruments(3)
+    cache = str(tmp_path / 'last.json')
+    resource, session, idn = resolve(rm, serial='SIM0000002', cache_path=cache)
+    assert usb_ids(resource)[2] == 'SIM0000002' and 'SIM0000002' in idn
+    assert rm.opened == [resource]
+    assert load_cached(cache)['resource'] == resource
+    session.close()
+
+
+def test_resolve_tries_cached_resource_first(tmp_path):
+    rm = ListingResourceManager.with_instruments(2)
+    cache = str(tmp_path / 'last.json')
+    last = sorted(rm.instruments)[1]
+    resolve(rm, serial='SIM0000002', cache_path=cache)[1].close()
+    rm.opened.clear()
+    resource, session, _ = resolve(rm, cache_path=cache)
+    assert resource == last and rm.opened == [last]
+    session.close()
+
+
+def test_resolve_unknown_serial_fails(tmp_path):
+    rm = ListingResourceManager.with_instruments(1)
+    with pytest.raises(DiscoveryError):
+        resolve(rm, serial='MISSING', budget=0.5, cache_path=str(tmp_path / 'last.json'))
+    # The serial is in the USB resource name, so no unit was opened to find out
+    assert not any(resource.startswith('USB') for resource in rm.opened)
+
+
+def test_slow_listing_stays_within_budget(tmp_path):
+    rm = ListingResourceManager.with_instruments(1, list_delay=2.0)
+    t0 = time.perf_counter()
+    with pytest.raises(DiscoveryError):
+        resolve(rm, budget=0.2, cache_path=str(tmp_path / 'last.json'))
+    assert time.perf_counter() - t0 < 1.0
+
+
+def test_discover_lists_units_by_serial():
+    rm = ListingResourceManager.with_instruments(3)
+    assert [usb_ids(r)[2] for r in discover(rm)] == ['SIM0000001', 'SIM0000002', 'SIM0000003']
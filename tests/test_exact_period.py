@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from exact_period import (MIN_POINTS, SRATE_RESOLUTION, choose_grid, exact_period_pair, max_srate,
+                          resample_periodic)
+from keysight_33600a import MODES
+
+
+def test_max_srate_by_model():
+    assert max_srate('Keysight Technologies,33622A,MY1,A.02') == 1e9
+    assert max_srate('Keysight Technologies,33612A,MY1,A.02') == 660e6
+    assert max_srate(None) == 660e6
+
+
+def test_choose_grid_lands_on_srat_resolution():
+    points, srate = choose_grid(25e3, 2000)
+    assert (points, srate) == (2000, 50e6)
+    freq = 47_123.456789
+    points, srate = choose_grid(freq, 2000)
+    assert 1980 <= points <= 2000
+    assert srate == pytest.approx(points * freq, abs=SRATE_RESOLUTION)
+
+
+def test_choose_grid_limits():
+    # 1 GSa/s holds at most 1e9 / 5e6 = 200 points of a 5 MHz period
+    assert choose_grid(5e6, 2000, srate_limit=1e9)[0] == 200
+    with pytest.raises(ValueError):
+        choose_grid(50e6, 2000, srate_limit=1e9)
+    with pytest.raises(ValueError):
+        choose_grid(25e3, MIN_POINTS - 1)
+
+
+@pytest.mark.parametrize('points', [250, 2000, 4096])
+def test_resample_periodic_keeps_tones(points):
+    n = 1000
+    phase = 2 * np.pi * np.arange(n) / n
+    signals = np.stack((np.sin(phase) + 0.3 * np.cos(5 * phase), np.cos(3 * phase)))
+    out = resample_periodic(signals, points)
+    grid = 2 * np.pi * np.arange(points) / points
+    np.testing.assert_allclose(out[0], np.sin(grid) + 0.3 * np.cos(5 * grid), atol=1e-12)
+    np.testing.assert_allclose(out[1], np.cos(3 * grid), atol=1e-12)
+
+
+def test_exact_period_pair_modal():
+    file1, file2 = MODES[2][1:3]
+    sig1, sig2, sRate, points, times, report = exact_period_pair(file1, file2, points=500)
+    assert points == 500 and len(sig1) == len(sig2) == len(times) == 500
+    assert float(sRate) == pytest.approx(47e3 * 500)
+    assert report['period_error'] < 1e-12
+    # One whole period: no step at the wrap beyond the largest step inside
+    assert report['wrap_jump'] <= 1.01
+    assert np.abs(sig1).max() <= 1.0 and np.abs(sig2).max() <= 1.0
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from arb_cache import ArbCache
+from discovery import discover
+from fleet import Fleet
+from sim_33600a import SimulatedResourceManager
+
+
+@pytest.fixture
+def fleet(make_awg, tmp_path):
+    # make_awg points the drivers' flash manifest at tmp_path
+    rm = SimulatedResourceManager.with_instruments(4, message_latency=0.005)
+    fleet = Fleet(discover(rm), rm, arb_cache=ArbCache(str(tmp_path / 'cache')))
+    yield fleet
+    fleet.close()
+
+
+def test_fleet_switches_every_unit(fleet):
+    for results in (fleet.connect(), fleet.preload(), fleet.select_mode(2)):
+        assert all(result.ok for result in results.values())
+    for resource, sim in fleet.rm.instruments.items():
+        assert fleet.awgs[resource].current_mode == 2
+        assert sim.settings['OUTP1'] == 'ON' and sim.errors == []
+    # The shared arb cache prepared each pair once
+    assert fleet.awgs[next(iter(fleet.awgs))].arb_cache.memo.misses == 2
+
+
+def test_fleet_runs_units_in_parallel(fleet):
+    fleet.connect()
+    fleet.preload()
+    t0 = time.perf_counter()
+    results = fleet.select_mode(1)
+    wall = time.perf_counter() - t0
+    assert wall < 0.6 * sum(result.seconds for result in results.values())
+
+
+def test_one_failing_unit_does_not_stop_the_others(fleet):
+    fleet.connect()
+    lost = next(iter(fleet.awgs))
+    fleet.rm.instruments[lost].unplug()
+    results = fleet.select_mode(1)
+    assert not results[lost].ok and results[lost].error is not None
+    assert all(result.ok for resource, result in results.items() if resource != lost)
+    fleet.rm.instruments[lost].replug()
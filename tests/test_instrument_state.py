@@ -0,0 +1,57 @@
+from instrument_state import InstrumentState, normalize
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+
+def session():
+    rm = SimulatedResourceManager()
+    return rm.open_resource(SIM_RESOURCE), rm.instruments[SIM_RESOURCE]
+
+
+def test_normalize():
+    assert normalize('1.2') == normalize('+1.20000000000000E+00')
+    assert normalize('ON') == normalize('1') and normalize('off') == normalize(0)
+    assert normalize('"INT:\\remoteAdded\\A1.arb"') == normalize('int:\\REMOTEADDED\\a1.ARB')
+
+
+def test_write_elides_known_values():
+    inst, sim = session()
+    state = InstrumentState()
+    assert state.write(inst, 'SOUR1:VOLT', '1.2')
+    assert not state.write(inst, 'SOUR1:VOLT', '+1.2E+00')
+    assert state.write(inst, 'SOUR1:VOLT', '1.2', force=True)
+    assert sim.stats['commands'] == 2
+    assert state.stats() == {'writes': 2, 'elided': 1, 'queries': 0, 'answered': 0}
+
+
+def test_query_asks_only_unknown_headers():
+    inst, sim = session()
+    state = InstrumentState()
+    assert normalize(state.query(inst, 'OUTP1')) == normalize('OFF')
+    assert normalize(state.query(inst, 'OUTP1')) == normalize('OFF')
+    assert sim.stats['messages'] == 1
+    state.invalidate('OUTP1')
+    state.query(inst, 'OUTP1')
+    assert sim.stats['messages'] == 2
+    assert state.stats()['answered'] == 1
+
+
+def test_reconcile_finds_stale_headers_in_one_query():
+    inst, sim = session()
+    state = InstrumentState()
+    state.write(inst, 'OUTP1', 'ON')
+    state.write(inst, 'OUTP2:POL', 'INV')
+    # Changed behind the shadow's back, e.g. from the front panel
+    sim.settings['OUTP1'] = 'OFF'
+    messages = sim.stats['messages']
+    stale = state.reconcile(inst, ['OUTP1', 'OUTP2:POL', 'OUTP1:POL'])
+    assert sim.stats['messages'] - messages == 1
+    assert stale == ['OUTP1', 'OUTP1:POL']
+    assert state.matches('OUTP1', 'OFF') and state.matches('OUTP1:POL', 'NORM')
+
+
+def test_reconcile_rejected_header_leaves_all_unknown():
+    inst, _ = session()
+    state = InstrumentState()
+    state['OUTP1'] = 'ON'
+    assert state.reconcile(inst, ['OUTP1', 'BOGUS:HEADER']) == ['OUTP1', 'BOGUS:HEADER']
+    assert 'OUTP1' not in state
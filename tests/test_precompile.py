@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import arb_cache
+import arb_residency
+import arb_stream
+from arb_cache import ArbCache
+from arb_quantize import codes_hash, dac_hash, quantize_arb
+from keysight_33600a import MODES
+from precompile import library_pairs, precompile, waveform_files
+from sim_33600a import SIM_RESOURCE
+
+
+def test_library_pairs_modal_directory():
+    # Paired by frequencies and a 180 degree phase difference, as in the mode table
+    pairs, unpaired = library_pairs(waveform_files(['modal']))
+    assert pairs == sorted({(mode[1], mode[2]) for mode in MODES.values()})
+    assert unpaired == []
+
+
+@pytest.mark.parametrize('dither', [False, True])
+def test_codes_hash_matches_dac_hash(dither):
+    samples = np.sin(np.linspace(0, 2 * np.pi, 70000, endpoint=False)).astype('f4')
+    codes = quantize_arb(samples, dither)
+    assert codes.dtype == np.int16 and len(codes) == len(samples)
+    assert codes_hash(codes) == dac_hash(samples, dither)
+
+
+def test_dac_codes_are_cached(tmp_path):
+    cache = ArbCache(str(tmp_path))
+    samples = np.linspace(-1, 1, 1000, dtype='f4')
+    codes, report = cache.dac_codes(samples)
+    cached, cached_report = ArbCache(str(tmp_path)).dac_codes(samples)
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, codes)
+    assert cached_report == report
+    # Dithered codes are another entry
+    assert codes_hash(cache.dac_codes(samples, dither=True)[0]) == dac_hash(samples, dither=True)
+
+
+def test_driver_uploads_precompiled_dac_codes(make_awg, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'library')
+    pairs, _ = library_pairs(waveform_files(['modal']))
+    reports, _ = precompile(pairs, cache_dir, workers=1, normalize=False, dac=True)
+    assert all(len(report['quantization']) == 2 for report in reports)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('quantized again')
+
+    for module in (arb_cache, arb_residency):
+        monkeypatch.setattr(module, 'quantize_arb', fail)
+    monkeypatch.setattr(arb_stream, 'iter_dac_chunks', fail)
+    awg = make_awg(arb_cache=ArbCache(cache_dir), dac=True)
+    awg.preload()
+    sim = awg.rm.instruments[SIM_RESOURCE]
+    assert sim.errors == []
+    assert len(awg.residency.reports) == 4
+    awg.select_mode(1)
+    assert sim.settings['OUTP1'] == 'ON'
+
+
+def write_library(directory, pairs, points=4000):
+    """Write pairs of one-period two-tone waveforms named like the modal/ONEPERIOD_* files"""
+    for i in range(pairs):
+        freq = 20 + i
+        t = np.arange(points) / (points * freq * 1e3)
+        for label, phase_deg in (('A', 10.5), ('B', 190.5)):
+            phase = np.radians(phase_deg)
+            v = 0.4 * np.sin(2 * np.pi * freq * 1e3 * t + phase) + 0.2 * np.sin(4 * np.pi * freq * 1e3 * t + phase)
+            name = f"LIB_{label}_{freq}k_{2 * freq}k_{f'{phase_deg:.1f}'.replace('.', 'p')}deg_{points}pts.csv"
+            np.savetxt(str(directory / name), np.column_stack((t, v)), fmt='%.10g', delimiter=',',
+                       header='time_s,value', comments='')
+
+
+def test_process_pool_matches_serial(tmp_path):
+    library = tmp_path / 'library'
+    library.mkdir()
+    write_library(library, 4)
+    pairs, unpaired = library_pairs(waveform_files([str(library)]))
+    assert len(pairs) == 4 and unpaired == []
+    serial, _ = precompile(pairs, str(tmp_path / 'serial'), workers=1)
+    pooled, _ = precompile(pairs, str(tmp_path / 'pooled'), workers=2)
+    assert sorted(report['key'] for report in serial) == sorted(report['key'] for report in pooled)
+    assert all(report['built'] for report in pooled)
+    again, _ = precompile(pairs, str(tmp_path / 'pooled'), workers=2)
+    assert not any(report['built'] for report in again)
+    # Drivers find the pool's entries through the cache
+    cache = ArbCache(str(tmp_path / 'pooled'))
+    assert cache.build_pair(*pairs[0])[3] is False
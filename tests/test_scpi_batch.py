@@ -0,0 +1,66 @@
+import pytest
+
+from scpi_batch import CommandBatch
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+
+class RecordingSession:
+    def __init__(self):
+        self.messages = []
+
+    def write(self, message):
+        self.messages.append(message)
+
+    def query(self, message):
+        self.messages.append(message)
+        return '0'
+
+
+def test_commands_join_from_root():
+    inst = RecordingSession()
+    with CommandBatch(inst) as batch:
+        batch.write('SOUR1:VOLT 1.5')
+        batch.write(':SOUR2:VOLT 1.2')
+        batch.write('*TRG')
+    assert inst.messages == [':SOUR1:VOLT 1.5;:SOUR2:VOLT 1.2;*TRG']
+    assert batch.messages == 1
+
+
+def test_splits_at_max_bytes():
+    inst = RecordingSession()
+    batch = CommandBatch(inst, max_bytes=30)
+    for volts in ('1', '2', '3'):
+        batch.write(f'SOUR1:VOLT {volts}')
+    batch.flush()
+    assert inst.messages == [':SOUR1:VOLT 1;:SOUR1:VOLT 2', ':SOUR1:VOLT 3']
+    assert all(len(message) <= 30 for message in inst.messages)
+
+
+def test_query_flushes_first():
+    inst = RecordingSession()
+    batch = CommandBatch(inst)
+    batch.write('SOUR1:VOLT 1')
+    batch.query('SYST:ERR?')
+    assert inst.messages == [':SOUR1:VOLT 1', 'SYST:ERR?']
+    batch.flush()
+    assert len(inst.messages) == 2
+
+
+def test_error_discards_batch():
+    inst = RecordingSession()
+    with pytest.raises(RuntimeError):
+        with CommandBatch(inst) as batch:
+            batch.write('OUTP1 ON')
+            raise RuntimeError
+    assert inst.messages == []
+
+
+def test_simulator_applies_batch_in_one_message():
+    rm = SimulatedResourceManager()
+    sim = rm.instruments[SIM_RESOURCE]
+    with CommandBatch(rm.open_resource(SIM_RESOURCE)) as batch:
+        batch.write('SOUR1:VOLT 1.5')
+        batch.write('OUTP1:POL INV')
+        batch.write('OUTP1 ON')
+    assert sim.stats['messages'] == 1 and sim.stats['commands'] == 3
+    assert sim.settings['OUTP1:POL'] == 'INV' and sim.settings['OUTP1'] == 'ON'
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+
+from arb_stream import STREAM_THRESHOLD, upload_arb
+from scpi_trace import TracedSession
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+
+
+def traced_session(**kwargs):
+    rm = SimulatedResourceManager()
+    session = TracedSession(rm.open_resource(SIM_RESOURCE), enabled=True, **kwargs)
+    return session, rm.instruments[SIM_RESOURCE]
+
+
+def test_records_commands_and_bytes():
+    inst, _ = traced_session()
+    inst.write('SOUR1:VOLT 1.5')
+    assert inst.query('SOUR1:VOLT?').strip()
+    commands = [event['command'] for event in inst.events]
+    assert commands == ['SOUR1:VOLT 1.5', 'SOUR1:VOLT?']
+    assert inst.events[0]['bytes'] == len('SOUR1:VOLT 1.5') + 1
+    assert dict(inst.summary())['SOUR1:VOLT'][0] == 1
+
+
+def test_disabled_records_nothing():
+    inst, _ = traced_session()
+    inst.enabled = False
+    inst.write('SOUR1:VOLT 1.5')
+    assert not inst.events
+
+
+def test_check_errors_marks_failing_command():
+    inst, sim = traced_session(check_errors=True)
+    inst.write('SOUR1:FUNC:ARB "INT:\\remoteAdded\\MISSING.arb"')
+    inst.write('SOUR1:VOLT 1.5')
+    assert 'error' in inst.events[0] and 'error' not in inst.events[1]
+    assert sim.errors == []
+    trace = inst.chrome_trace()['traceEvents']
+    assert trace[0]['cat'] == 'error'
+
+
+def test_check_errors_during_streamed_upload():
+    inst, sim = traced_session(check_errors=True)
+    inst.write('FORM:BORD SWAP')
+    samples = np.sin(np.linspace(0, 2 * np.pi, STREAM_THRESHOLD + 1000, endpoint=False)).astype('f4')
+    messages = sim.stats['messages']
+    upload_arb(inst, 1, 'BIG', samples)
+    np.testing.assert_allclose(sim.volatile[1]['BIG'], samples, atol=1e-6)
+    assert not any('error' in event for event in inst.events)
+    # The block as one message, then one error check after its last piece
+    assert sim.stats['messages'] - messages == 2
+
+
+def test_export_and_bounded_events(tmp_path):
+    inst, _ = traced_session(max_events=3)
+    for volts in range(5):
+        inst.write(f'SOUR1:VOLT {volts}')
+    assert [event['command'] for event in inst.events] == ['SOUR1:VOLT 2', 'SOUR1:VOLT 3', 'SOUR1:VOLT 4']
+    path = tmp_path / 'trace.json'
+    inst.export(str(path))
+    trace = json.loads(path.read_text())
+    assert [event['name'] for event in trace['traceEvents']] == ['SOUR1:VOLT 2', 'SOUR1:VOLT 3', 'SOUR1:VOLT 4']
+    inst.clear_trace()
+    assert not inst.events
+
+
+def test_untraced_attributes_reach_the_session():
+    inst, _ = traced_session()
+    inst.timeout = 1234
+    assert inst.session.timeout == 1234 and inst.timeout == 1234
+
+
+def test_driver_trace_errors(make_awg):
+    awg = make_awg(trace=True, trace_errors=True)
+    awg.inst.write('SOUR1:FUNC:ARB "INT:\\remoteAdded\\MISSING.arb"')
+    assert 'error' in awg.inst.events[-1]
+    awg.inst.clear_trace()
+    awg.preload()
+    awg.select_mode(1)
+    assert awg.inst.events and not any('error' in event for event in awg.inst.events)
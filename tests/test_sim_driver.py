@@ -0,0 +1,333 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from arb_sequence import SequenceError
+from arb_stream import OperationCancelled
+from async_control import InstrumentController, ModeScheduler
+from discovery import DiscoveryError
+from sim_33600a import SIM_RESOURCE, SimulatedResourceManager
+from supervisor import SessionSupervisor
+
+
+def test_preload_makes_every_mode_resident(awg, sim):
+    # Two waveform pairs (A/B and C/D), one arb of each per channel
+    assert len(awg.mode_pairs()) == 2
+    assert len(sim.volatile[1]) == 2 and len(sim.volatile[2]) == 2
+    sent = sim.stats['bytes']
+    for mode in (1, 2, 3, 4):
+        awg.select_mode(mode)
+    # Switching only configures; no arb data goes over the link again
+    assert sim.stats['bytes'] - sent < 8000
+    assert awg.current_mode == 4
+
+
+def test_polarity_switch_sends_only_polarity(awg, sim):
+    awg.select_mode(1)
+    _, sent = awg.select_mode(3)
+    assert sorted(sent) == ['OUTP1:POL INV', 'OUTP2:POL NORM']
+    assert sim.settings['OUTP1:POL'] == 'INV' and sim.settings['OUTP2:POL'] == 'NORM'
+    _, sent = awg.select_mode(3)
+    assert sent == []
+
+
+def test_switch_to_other_pair_changes_arbs(awg, sim):
+    awg.select_mode(1)
+    _, sent = awg.select_mode(2)
+    assert any(command.startswith('SOUR1:FUNC:ARB ') for command in sent)
+    assert sim.settings['SOUR1:FUNC:ARB'] != sim.settings['SOUR2:FUNC:ARB']
+    assert sim.settings['OUTP1'] == 'ON' and sim.settings['OUTP2'] == 'ON'
+
+
+def test_preload_honours_invert_ch2(make_awg):
+    inverted = make_awg(invert_ch2=True)
+    plain = make_awg(invert_ch2=False)
+    for awg in (inverted, plain):
+        awg.preload()
+    file1, file2 = inverted.mode_pairs()[0]
+    arbs = []
+    for awg in (inverted, plain):
+        name = awg.residency.pair(file1, file2)[1].strip('"')
+        arbs.append(awg.rm.instruments[SIM_RESOURCE].volatile[2][name])
+    np.testing.assert_allclose(arbs[0], -arbs[1], atol=1e-6)
+
+
+def test_switch_without_preload_uploads_what_flash_lacks(make_awg):
+    first = make_awg()
+    first.select_mode(1)
+    # A fresh unit with the same serial: the manifest lists files its flash does not have
+    awg = make_awg()
+    sim = awg.rm.instruments[SIM_RESOURCE]
+    freq, _ = awg.select_mode(1)
+    assert freq == pytest.approx(25e3, rel=1e-3)
+    assert sim.errors == []
+    assert sim.stats['flash_writes'] == first.rm.instruments[SIM_RESOURCE].stats['flash_writes']
+
+
+def test_reconnect_after_link_drop_keeps_mode(awg, sim):
+    awg.select_mode(2)
+    sim.unplug()
+    sim.replug()
+    flash_writes = sim.stats['flash_writes']
+    lost = awg.reconnect()
+    assert not any(lost.values())
+    assert sim.stats['flash_writes'] == flash_writes
+    assert awg.current_mode == 2
+    assert sim.settings['OUTP1'] == 'ON' and sim.settings['OUTP2'] == 'ON'
+
+
+def test_reconnect_after_power_cycle_restores_mode(awg, sim):
+    awg.select_mode(3)
+    sim.power_cycle()
+    awg.reconnect()
+    name = awg.residency.pair(*awg.modes[3][1:3])[0]
+    assert sim.settings['SOUR1:FUNC:ARB'] == name.strip('"')
+    assert sim.settings['OUTP1:POL'] == 'INV'
+    assert sim.settings['OUTP1'] == 'ON' and sim.settings['OUTP2'] == 'ON'
+
+
+def test_reconnect_after_flash_cleared_uploads_again(awg, sim):
+    awg.select_mode(1)
+    sim.power_cycle()
+    sim.files.clear()
+    awg.reconnect()
+    assert sim.errors == []
+    name = awg.residency.pair(*awg.modes[1][1:3])[0]
+    assert sim.settings['SOUR1:FUNC:ARB'] == name.strip('"')
+    assert sim.settings['OUTP1'] == 'ON'
+
+
+def test_reconnect_keeps_outputs_off(awg, sim):
+    awg.select_mode(1)
+    awg.output(False)
+    sim.power_cycle()
+    awg.reconnect()
+    assert sim.settings['OUTP1'] == 'OFF' and sim.settings['OUTP2'] == 'OFF'
+
+
+def test_reconnect_only_to_the_lost_unit(make_awg):
+    rm = SimulatedResourceManager.with_instruments(2)
+    awg = make_awg(rm=rm, resource=None)
+    awg.preload()
+    awg.select_mode(1)
+    resource = awg.resource
+    other = next(r for r in rm.instruments if r != resource)
+    rm.instruments[resource].unplug()
+    with pytest.raises(DiscoveryError):
+        awg.reconnect()
+    assert rm.instruments[other].settings['OUTP1'] == 'OFF'
+    rm.instruments[resource].replug()
+    awg.reconnect()
+    assert awg.resource == resource
+    assert rm.instruments[resource].settings['OUTP1'] == 'ON'
+
+
+def test_sequence_uploads_steps_flash_lacks(make_awg):
+    make_awg().play_sequence('forward 3, right 2')
+    # A fresh unit with the same serial: the manifest lists files its flash does not have
+    awg = make_awg()
+    sim = awg.rm.instruments[SIM_RESOURCE]
+    report = awg.play_sequence('forward 3, right 2')
+    assert sim.errors == []
+    for ch, name in zip((1, 2), report['names']):
+        assert name in sim.sequences[ch]
+        assert sim.settings[f'SOUR{ch}:FUNC:ARB'] == name
+
+
+def test_sequence_error_keeps_outputs_off(awg, sim, monkeypatch):
+    upload = awg.residency.upload
+
+    def upload_missing(inst, channel, samples, cancel=None):
+        upload(inst, channel, samples, cancel)
+        return '"INT:\\remoteAdded\\MISSING.arb"'
+
+    monkeypatch.setattr(awg.residency, 'upload', upload_missing)
+    with pytest.raises(SequenceError):
+        awg.play_sequence('forward 3, right 2')
+    assert sim.settings['OUTP1'] == 'OFF' and sim.settings['OUTP2'] == 'OFF'
+    assert awg.current_sequence is None
+
+
+def test_reconnect_keeps_sequence_playing(awg, sim):
+    report = awg.play_sequence('forward 3, right 2, left')
+    sim.unplug()
+    sim.replug()
+    awg.reconnect()
+    assert awg.current_mode is None
+    assert sim.settings['SOUR1:FUNC:ARB'] == report['names'][0]
+    assert sim.settings['OUTP1'] == 'ON' and sim.settings['OUTP2'] == 'ON'
+
+
+def test_reconnect_restarts_lost_sequence(awg, sim):
+    awg.play_sequence('forward 3, right 2, left')
+    sim.power_cycle()
+    awg.reconnect()
+    # The step arbs come back from flash, so the sequences are defined anew
+    for ch, name in zip((1, 2), awg.current_sequence['names']):
+        steps = sim.sequences[ch][name]
+        assert [(repeat, play) for _, repeat, play, _, _ in steps] == [(3, 'repeat'), (2, 'repeat'), (1, 'once')]
+        assert sim.settings[f'SOUR{ch}:FUNC:ARB'] == name
+        assert sim.settings[f'OUTP{ch}'] == 'ON'
+
+
+def test_supervisor_recovers_after_stop(awg, sim):
+    ctl = InstrumentController(awg)
+    supervisor = SessionSupervisor(awg, interval=0.01)
+    try:
+        ctl.request('select_mode', 1).result(timeout=10)
+        ctl.request('stop').result(timeout=10)
+        supervisor.start()
+        sim.unplug()
+        sim.replug()
+        wait_until(lambda: supervisor.reconnects == 1)
+        assert supervisor.state == 'ok'
+        assert awg.current_mode == 1
+        assert sim.settings['OUTP1'] == 'OFF' and sim.settings['OUTP2'] == 'OFF'
+    finally:
+        supervisor.stop()
+        ctl.shutdown(close=False)
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def wait_for_upload(sim):
+    """Wait until an arb upload is on its way to the instrument"""
+    sent = sim.stats['bytes']
+    wait_until(lambda: sim.stats['bytes'] - sent >= 4000)
+
+
+def test_scheduler_returning_to_running_pair(make_awg):
+    # Uploads take long enough for the later requests to arrive mid-switch
+    awg = make_awg(rm=SimulatedResourceManager(byte_latency=2e-5))
+    ctl = InstrumentController(awg)
+    try:
+        scheduler = ModeScheduler(ctl)
+        scheduler.request(1)
+        wait_for_upload(awg.rm.instruments[SIM_RESOURCE])
+        scheduler.request(2)
+        last = scheduler.request(1)
+        freq, _ = last.result(timeout=30)
+        assert freq == pytest.approx(25e3, rel=1e-3)
+        assert awg.current_mode == 1
+        assert scheduler.stats() == {'requested': 3, 'switches': 1, 'aborted': 1}
+    finally:
+        ctl.shutdown(close=False)
+
+
+def test_scheduler_latest_request_wins(make_awg):
+    awg = make_awg(rm=SimulatedResourceManager(byte_latency=2e-5))
+    ctl = InstrumentController(awg)
+    try:
+        scheduler = ModeScheduler(ctl)
+        first = scheduler.request(1)
+        last = scheduler.request(2)
+        last.result(timeout=30)
+        assert first.cancelled()
+        assert awg.current_mode == 2
+    finally:
+        ctl.shutdown(close=False)
+
+
+def test_scheduler_abort_skips_queued_switch(make_awg):
+    awg = make_awg(rm=SimulatedResourceManager(byte_latency=2e-5))
+    applied = []
+    select_mode = awg.select_mode
+
+    def record(mode_num):
+        applied.append(mode_num)
+        return select_mode(mode_num)
+
+    awg.select_mode = record
+    ctl = InstrumentController(awg)
+    try:
+        scheduler = ModeScheduler(ctl)
+        preload = ctl.request('preload')
+        wait_for_upload(awg.rm.instruments[SIM_RESOURCE])
+        # Queued behind the preload, then superseded by another pair
+        scheduler.request(1)
+        scheduler.request(2).result(timeout=30)
+        assert preload.exception() is None
+        assert applied == [2]
+        assert awg.current_mode == 2
+    finally:
+        ctl.shutdown(close=False)
+
+
+def test_stop_aborts_only_the_running_call(make_awg):
+    awg = make_awg(rm=SimulatedResourceManager(byte_latency=2e-5))
+    ctl = InstrumentController(awg)
+    try:
+        preload = ctl.request('preload')
+        wait_for_upload(awg.rm.instruments[SIM_RESOURCE])
+        queued = ctl.request('select_mode', 1)
+        ctl.request('stop').result(timeout=30)
+        assert isinstance(preload.exception(timeout=30), OperationCancelled)
+        assert queued.cancelled()
+        # Calls after the STOP run normally
+        freq, _ = ctl.request('select_mode', 1).result(timeout=30)
+        assert freq == pytest.approx(25e3, rel=1e-3)
+        assert not awg.cancel.is_set()
+    finally:
+        ctl.shutdown(close=False)
+
+
+class DoneController:
+    """Controller stand-in whose calls have finished by the time request() returns"""
+
+    def __init__(self, awg):
+        self.awg = awg
+
+    def request(self, name, *args, cancel=None):
+        future = Future()
+        future.set_result(getattr(self.awg, name)(*args))
+        return future
+
+
+def test_scheduler_with_call_already_done(awg):
+    scheduler = ModeScheduler(DoneController(awg))
+    results = []
+    thread = threading.Thread(target=lambda: results.append(scheduler.request(2).result(timeout=10)), daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), 'deadlocked'
+    assert results and awg.current_mode == 2
+
+
+def test_scheduler_storm_settles_on_last_request(make_awg):
+    awg = make_awg(rm=SimulatedResourceManager(message_latency=0.001, byte_latency=4e-6))
+    ctl = InstrumentController(awg)
+    try:
+        scheduler = ModeScheduler(ctl)
+        targets = [1, 2, 4, 3, 2, 1, 4, 2, 3, 3, 1, 4, 2, 2, 3, 1, 4, 4, 2, 3]
+        for mode_num in targets:
+            last = scheduler.request(mode_num)
+            time.sleep(0.002)
+        last.result(timeout=30)
+        assert awg.current_mode == targets[-1]
+        # Superseded requests were dropped or aborted instead of queued
+        assert scheduler.switches < len(targets)
+        assert scheduler.stats()['requested'] == len(targets)
+    finally:
+        ctl.shutdown(close=False)
+
+
+def test_sequence_replay_sends_no_arb_data(awg, sim):
+    report = awg.play_sequence('forward 200, right 50, backward 200, left 50')
+    sent = sim.stats['bytes']
+    again = awg.play_sequence('forward 200, right 50, backward 200, left 50')
+    # The steps are resident: only the sequence definitions and settings go out
+    assert sim.stats['bytes'] - sent < 8000
+    assert again['names'] == report['names']
+    # Segments follow each other exactly on the sample clock
+    segments = report['segments']
+    for seg, following in zip(segments, segments[1:]):
+        assert following['start'] == pytest.approx(seg['start'] + seg['duration'], abs=1e-12)
+    assert report['duration'] == pytest.approx(sum(seg['duration'] for seg in segments))
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from keysight_33600a import MODES
+from waveform_batch import align_waveforms, group_times, prepare_batch, prepare_loaded, sample_rate
+from waveform_loader import load_waveform_with_time
+
+
+def tone(rate, n, t0=0.0, freq=1e3):
+    times = t0 + np.arange(n) / rate
+    return times, np.sin(2 * np.pi * freq * times)
+
+
+def test_sample_rate_from_rounded_time_column():
+    # ONEPERIOD_A/B print the time column with three significant digits
+    times, _ = load_waveform_with_time(MODES[1][1])
+    assert sample_rate(times) == 50e6
+    assert sample_rate(tone(94e6, 2000)[0]) == 94e6
+
+
+def test_align_modal_pair():
+    file1, file2 = MODES[1][1:3]
+    sig1, sig2, sRate, points, times = align_waveforms(file1, file2)
+    assert (float(sRate), points) == (50e6, 2000)
+    assert sig1.dtype == sig2.dtype == np.float32
+    assert np.abs(sig1).max() == pytest.approx(1.0) and np.abs(sig2).max() == pytest.approx(1.0)
+    assert len(times) == points and times[1] - times[0] == pytest.approx(2e-8)
+    plain = align_waveforms(file1, file2, invert_ch2=False)[1]
+    np.testing.assert_array_equal(plain, -sig2)
+
+
+def test_batch_matches_pairwise():
+    groups = [MODES[1][1:3], MODES[2][1:3]]
+    batch = prepare_batch(groups, [False, True] * 2, normalize=True)
+    assert batch.signals.shape == (4, batch.points)
+    assert batch.group_rows == [(0, 2), (2, 2)]
+    for g, (file1, file2) in enumerate(groups):
+        sig1, sig2, sRate, points, _ = align_waveforms(file1, file2)
+        assert points == batch.points and float(sRate) == batch.sRates[g]
+        np.testing.assert_allclose(batch.signals[2 * g], sig1, atol=1e-6)
+        np.testing.assert_allclose(batch.signals[2 * g + 1], sig2, atol=1e-6)
+
+
+def test_resamples_onto_common_grid():
+    # A 1 MSa/s and a 2 MSa/s file over the same millisecond
+    slow, fast = tone(1e6, 1000), tone(2e6, 2000)
+    batch = prepare_loaded([[slow, fast]], normalize=False)
+    assert batch.points == 2000 and batch.sRates[0] == 2e6
+    times = group_times(batch, 0)
+    expected = np.sin(2 * np.pi * 1e3 * times)
+    np.testing.assert_allclose(batch.signals[1], expected, atol=1e-6)
+    # Linear interpolation of the slower file
+    np.testing.assert_allclose(batch.signals[0][:-2], expected[:-2], atol=1e-4)
+
+
+def test_common_time_range_and_points():
+    early, late = tone(1e6, 1000), tone(1e6, 1000, t0=100e-6)
+    batch = prepare_loaded([[early, late]], normalize=False, points=450)
+    assert batch.points == 450
+    assert batch.t_starts[0] == pytest.approx(100e-6)
+    assert batch.sRates[0] == pytest.approx(450 / 900e-6)
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        prepare_loaded([])
+    with pytest.raises(ValueError):
+        prepare_loaded([[tone(1e6, 100)], []])
+    with pytest.raises(ValueError):
+        prepare_loaded([[tone(1e6, 100), tone(1e6, 100, t0=1.0)]])
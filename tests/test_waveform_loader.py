@@ -0,0 +1,49 @@
+import csv
+
+import numpy as np
+import pytest
+
+from waveform_loader import load_waveform_with_time, sniff_waveform_file
+
+MODAL = 'modal/ONEPERIOD_A_25k_50k_84p88deg_2000pts.csv'
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_modal_csv_matches_csv_reader():
+    with open(MODAL) as f:
+        rows = list(csv.reader(f))[1:]
+    times, values = load_waveform_with_time(MODAL)
+    assert sniff_waveform_file(MODAL) == (',', 1)
+    np.testing.assert_array_equal(times, [float(t) for t, _ in rows])
+    np.testing.assert_array_equal(values, [float(v) for _, v in rows])
+    assert times.flags.c_contiguous and values.flags.c_contiguous
+
+
+@pytest.mark.parametrize('delimiter', [' ', '\t', ';'])
+def test_delimiters(tmp_path, delimiter):
+    path = write(tmp_path, 'w.dat', f'0{delimiter}0.5\n1e-8{delimiter}-0.25\n')
+    times, values = load_waveform_with_time(path)
+    np.testing.assert_array_equal(times, [0, 1e-8])
+    np.testing.assert_array_equal(values, [0.5, -0.25])
+
+
+def test_header_and_comments(tmp_path):
+    path = write(tmp_path, 'w.txt', '# exported by scope\nTime,Value,Extra\n\n0,1,9\n# gap\n1,2,9\n')
+    times, values = load_waveform_with_time(path)
+    np.testing.assert_array_equal(times, [0, 1])
+    np.testing.assert_array_equal(values, [1, 2])
+
+
+def test_single_row(tmp_path):
+    times, values = load_waveform_with_time(write(tmp_path, 'w.csv', 't,v\n0,0.5\n'))
+    assert times.shape == values.shape == (1,)
+
+
+def test_no_data(tmp_path):
+    with pytest.raises(ValueError):
+        load_waveform_with_time(write(tmp_path, 'w.csv', 'time,value\n'))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""Prepare many modal waveforms at once: one integer-sample grid, one vectorized resampling pass"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from phase_timer import phase
+from waveform_loader import load_waveform_with_time
+
+# A float64 time column is never more exact than this (relative)
+MIN_RATE_UNCERTAINTY = 1e-12
+
+# signals: float32 (files x points) in the order the groups list them;
+# sRates, t_starts: per group; group_rows: (first row, row count) per group
+PreparedBatch = namedtuple('PreparedBatch', 'signals sRates points t_starts group_rows')
+
+
+def _round_rate(rate, uncertainty):
+    """Round a sample rate to the fewest significant digits within its relative uncertainty"""
+    for digits in range(1, 18):
+        rounded = float(f'{rate:.{digits}g}')
+        if abs(rounded - rate) <= uncertainty * rate:
+            return rounded
+    return rate
+
+
+def sample_rates(times, lengths):
+    """Return the sample rate of each row of a stacked (files x samples) time matrix
+
+    Row i holds lengths[i] uniformly spaced time stamps (the rest is padding).
+    The interval is fitted by least squares over the sample index, so a
+    column printed with few significant digits (the ONEPERIOD_A/B files use
+    three) still gives the true rate; (t[-1] - t[0]) / (n - 1) is off by the
+    rounding of the last time stamp. Each fit is then rounded to the
+    precision its residuals allow.
+    """
+    lengths = np.asarray(lengths)
+    if np.any(lengths < 2):
+        raise ValueError("At least two samples are needed for a sample rate")
+    dt = np.empty(len(lengths))
+    residual = np.empty(len(lengths))
+    # Rows of one length share the centered sample index; usually there is only one length
+    for n in np.unique(lengths):
+        rows = np.flatnonzero(lengths == n)
+        index = np.arange(n) - (n - 1) / 2
+        centered = times[rows, :n] - times[rows, :n].mean(axis=1, keepdims=True)
+        dt[rows] = centered @ index / (n * (n * n - 1) / 12)
+        centered -= dt[rows, None] * index
+        residual[rows] = np.abs(centered).max(axis=1)
+    if np.any(dt <= 0):
+        raise ValueError("Invalid sample interval")
+    uncertainty = np.maximum(residual / dt / lengths, MIN_RATE_UNCERTAINTY)
+    return np.array([_round_rate(1 / d, u) for d, u in zip(dt, uncertainty)])
+
+
+def sample_rate(times):
+    """Return the sample rate of one uniformly sampled time column (see sample_rates)"""
+    times = np.asarray(times, dtype=np.float64)
+    return float(sample_rates(times[None, :], [len(times)])[0])
+
+
+def load_batch(files):
+    """Parse waveform files once each; returns {file: (times, values)}"""
+    with phase('parse'):
+        return {f: load_waveform_with_time(f) for f in dict.fromkeys(files)}
+
+
+def prepare_loaded(groups, invert=None, normalize=True, points=None):
+    """Resample groups of loaded (times, values) waveforms onto one integer-sample grid
+
+    Waveforms in a group (e.g. the two channels of a mode) share the overlap of
+    their time ranges, each file covering points * interval from its first
+    sample. Every group gets the same number of points: the given count, or
+    the most any group needs at its finest sample interval. A group's sample
+    rate is that count over its duration. invert is one flag per waveform.
+    Files are taken as uniformly sampled, so resampling is a gather on the
+    sample index of a stacked 2-D array, done for all waveforms at once.
+    """
+    waves = [wave for group in groups for wave in group]
+    if not waves:
+        raise ValueError("No waveforms to prepare")
+    sizes = np.array([len(group) for group in groups])
+    if np.any(sizes == 0):
+        raise ValueError("Empty waveform group")
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    lengths = np.array([len(values) for _, values in waves])
+
+    # Stack times and values; values are padded with the row's last value so gathers past the end clamp
+    width = lengths.max() + 1
+    stacked_times = np.zeros((len(waves), width), dtype=np.float64)
+    stacked = np.empty((len(waves), width), dtype=np.float64)
+    for row, (times, values) in enumerate(waves):
+        stacked_times[row, :len(times)] = times
+        stacked[row, :len(values)] = values
+        stacked[row, len(values):] = values[-1]
+    rates = sample_rates(stacked_times, lengths)
+    t0 = stacked_times[:, 0].copy()
+
+    # Common time range and finest rate per group
+    t_start = np.maximum.reduceat(t0, starts)
+    t_end = np.minimum.reduceat(t0 + lengths / rates, starts)
+    group_rate = np.maximum.reduceat(rates, starts)
+    span = t_end - t_start
+    if np.any(span <= 0):
+        bad = int(np.argmax(span <= 0))
+        raise ValueError(f"Waveform group {bad} has no common time range")
+    needed = np.rint(span * group_rate).astype(np.int64)
+    points = int(needed.max()) if points is None else int(points)
+    # Keep the fitted rate exactly when the group already has this many points
+    sRates = np.where(needed == points, group_rate, points / span)
+
+    # Files already sampled on their group's grid are copied; the rest are
+    # interpolated at the sample positions of every grid point, in one 2-D pass
+    group_of = np.repeat(np.arange(len(groups)), sizes)
+    offset = t_start[group_of] - t0
+    on_grid = (offset == 0) & (rates == sRates[group_of]) & (lengths >= points)
+    signals = np.empty((len(waves), points), dtype=np.float64)
+    signals[on_grid] = stacked[on_grid, :points]
+    rows = np.flatnonzero(~on_grid)
+    if len(rows):
+        grid = np.arange(points, dtype=np.float64)
+        positions = (offset[rows, None] + grid / sRates[group_of[rows], None]) * rates[rows, None]
+        lower = np.floor(positions).astype(np.intp)
+        np.clip(lower, 0, (lengths[rows] - 1)[:, None], out=lower)
+        frac = positions - lower
+        np.clip(frac, 0.0, 1.0, out=frac)
+        # Flat indices into the stacked values, one gather per neighbour
+        lower += (rows * width)[:, None]
+        flat = stacked.ravel()
+        left = flat.take(lower)
+        left += (flat.take(lower + 1) - left) * frac
+        signals[rows] = left
+
+    if normalize:
+        # An all-zero signal is left unchanged
+        peak = np.abs(signals).max(axis=1, keepdims=True)
+        signals /= np.where(peak == 0, 1.0, peak)
+    if invert is not None:
+        signals *= np.where(np.asarray(invert, dtype=bool), -1.0, 1.0)[:, None]
+
+    group_rows = list(zip(starts.tolist(), sizes.tolist()))
+    return PreparedBatch(signals.astype('f4'), sRates, points, t_start, group_rows)
+
+
+def prepare_batch(groups, invert=None, normalize=True, points=None):
+    """Load and prepare groups of waveform files (see prepare_loaded); each file is parsed once"""
+    loaded = load_batch(f for group in groups for f in group)
+    with phase('align'):
+        return prepare_loaded([[loaded[f] for f in group] for group in groups], invert, normalize, points)
+
+
+def group_times(batch, group):
+    """Return the time axis of one group's samples"""
+    return batch.t_starts[group] + np.arange(batch.points) / batch.sRates[group]
+
+
+def align_waveforms(file1, file2, invert_ch2=True, normalize=True):
+    """Load two waveform files and resample them onto a common time axis
+
+    Returns (sig1, sig2, sRate, points, unified_times) with float32 channel data.
+    """
+    batch = prepare_batch([(file1, file2)], [False, invert_ch2], normalize)
+    return batch.signals[0], batch.signals[1], str(batch.sRates[0]), batch.points, group_times(batch, 0)
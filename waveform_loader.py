@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+SNIFF_LINES = 20
+
+
+def _is_number(token):
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def sniff_waveform_file(filename):
+    """Return (delimiter, header_lines) of a two-column time/value text file
+
+    The delimiter is None for whitespace-separated files such as the .dat waveforms.
+    """
+    with open(filename, 'r') as f:
+        lines = [line for line in (f.readline() for _ in range(SNIFF_LINES)) if line]
+
+    header_lines = 0
+    for line in lines:
+        stripped = line.strip()
+        if stripped and not stripped.startswith('#'):
+            for delimiter in (',', ';', '\t', None):
+                tokens = stripped.split(delimiter)
+                if len(tokens) >= 2 and all(_is_number(t) for t in tokens[:2]):
+                    return delimiter, header_lines
+        header_lines += 1
+    raise ValueError(f"No valid waveform data in {filename}")
+
+
+def load_waveform_with_time(filename):
+    """Read a waveform file and return time and value arrays"""
+    delimiter, header_lines = sniff_waveform_file(filename)
+    # numpy's C-level reader parses in bulk without building per-value Python floats
+    data = np.loadtxt(filename, delimiter=delimiter, skiprows=header_lines, usecols=(0, 1),
+                      comments='#', dtype=np.float64, ndmin=2)
+    if len(data) == 0:
+        raise ValueError(f"No valid waveform data in {filename}")
+    return np.ascontiguousarray(data[:, 0]), np.ascontiguousarray(data[:, 1])